@@ -0,0 +1,107 @@
+"""トランジットのアニメーション (chart_animation) のベンチマーク
+
+同じトランジットの列について、フレームごとに三重円全体を描き直す方法
+(TriChartRenderer.render + Agg の描画) と、TransitAnimator でトランジットの円だけを
+描き直す方法の 1 フレームあたりの時間を比べ、両者のフレームが一致するかを確認する。
+あわせて PNG のディレクトリへの書き出しまでを通しで実行し、段階ごと (位置の計算・
+描画・書き出し) の時間を chart_timing の集計 (snapshot) から出力する (フレームは
+書き出しながら描くため、animation.write の時間は animation.draw を含む)。
+結果は JSON で出力し、フレームが一致しなければ終了コード 1 を返す。
+
+    python benchmarks/bench_animation.py --frames 120 --step-hours 24
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone, timedelta
+
+import numpy as np
+import swisseph as swe
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import chart_timing
+from chart_engine import EPHE_PATH, calculate_chart_layers, calculate_bodies_batch, set_chart_cache
+from chart_animation import TransitAnimator, iter_transit_frames, sweep_jds, write_frames
+from chart_render import TriChartRenderer
+
+BIRTH_UTC = datetime(1985, 6, 15, 3, 30, tzinfo=timezone.utc)
+START_UTC = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def _stage_breakdown(natal, prog, cusps, ascmc, jds):
+    """PNG への書き出しまでを通しで実行し、段階ごとの集計 (件数・合計 ms) を返す"""
+    was_enabled = chart_timing.is_enabled()
+    chart_timing.enable()
+    chart_timing.reset()
+    animator = TransitAnimator(natal, prog, cusps, ascmc)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            write_frames(iter_transit_frames(animator, jds), os.path.join(tmp, "frames"))
+        stats = chart_timing.snapshot()
+    finally:
+        animator.close()
+        chart_timing.enable(was_enabled)
+    return {name: {"count": s["count"], "total_ms": s["sum"] * 1000}
+            for name, s in stats.items() if name.startswith("animation.")}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--frames", type=int, default=60)
+    parser.add_argument("--step-hours", type=float, default=24)
+    parser.add_argument("--full-frames", type=int, default=10, help="全体を描き直す方法で計測するフレーム数")
+    args = parser.parse_args(argv)
+
+    swe.set_ephe_path(EPHE_PATH)
+    set_chart_cache(None)
+    natal, prog, _, cusps, ascmc = calculate_chart_layers(BIRTH_UTC, 35.69, 139.69, START_UTC, now_utc=START_UTC)
+    end_utc = START_UTC + timedelta(hours=args.step_hours * (args.frames - 1))
+    jds = [float(jd) for jd in sweep_jds(START_UTC, end_utc, args.step_hours)]
+
+    start = time.perf_counter()
+    sweep = calculate_bodies_batch(jds)
+    positions_ms = (time.perf_counter() - start) * 1000
+
+    animator = TransitAnimator(natal, prog, cusps, ascmc)
+    animator.draw(sweep[0])  # 背景の作成
+    start = time.perf_counter()
+    for trans in sweep:
+        animator.draw(trans)
+    blit_ms = (time.perf_counter() - start) * 1000 / len(sweep)
+
+    renderer = TriChartRenderer()
+    canvas = renderer.figure.canvas
+    mismatched = 0
+    start = time.perf_counter()
+    full_sweep = sweep[:args.full_frames]
+    for trans in full_sweep:
+        renderer.render(natal, prog, trans, cusps, ascmc)
+        canvas.draw()
+    full_ms = (time.perf_counter() - start) * 1000 / len(full_sweep)
+    for trans in full_sweep:
+        renderer.render(natal, prog, trans, cusps, ascmc)
+        canvas.draw()
+        if not np.array_equal(np.asarray(canvas.buffer_rgba()), animator.draw(trans)):
+            mismatched += 1
+
+    results = {
+        "frames": len(sweep),
+        "positions_ms": positions_ms,
+        "full_redraw_ms_per_frame": full_ms,
+        "transit_only_ms_per_frame": blit_ms,
+        "speedup": full_ms / blit_ms,
+        "mismatched_frames": mismatched,
+        "png_pipeline_stages": _stage_breakdown(natal, prog, cusps, ascmc, jds),
+    }
+    print(json.dumps(results, indent=2))
+    if mismatched:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""チャート検索インデックス (chart_index) のベンチマーク
+
+--charts 件のネイタルチャート (ランダムな出生日時と日本国内の出生地) の黄経とカスプを
+計算して索引を作り、いくつかの検索について次の時間を比べて JSON で出力する。
+
+    index:      ChartIndex.query (最も件数の少ない条件の索引から候補を取り出す)
+    scan:       全チャートの列データに全条件を適用する (索引を使わない配列演算)
+    per_chart:  チャートごとに calculate_natal_aspects と get_house_number を呼ぶ場合の推定
+                (--per-chart-sample 件の計測から全件分を換算)
+
+索引の作成は、配列からの write_index と、先頭 --build-charts 件を chart_batch と同じ形式の
+.jsonl に書き出してからの build_index (読み込みを含む) のそれぞれについて時間を計り、
+build_index はメモリ使用量のピーク (tracemalloc。open_memmap でファイルに書き出す配列は
+含まないため、チャート数によらず chunk_size で決まる) も出力する。
+
+索引と scan の結果、または build_index と write_index の索引が一致しない場合と、オーブを
+省略したアスペクトの検索が先頭 --per-chart-sample 件で calculate_natal_aspects の結果と
+一致しない場合は終了コード 1 を返す。
+
+    python benchmarks/bench_index.py --charts 1000000
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import swisseph as swe
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from chart_aspects import calculate_natal_aspects
+from chart_engine import EPHE_PATH, HOUSE_SYSTEM, PLANET_NAMES, get_house_number
+from chart_index import BODY_NAMES, ChartIndex, build_index, write_index
+from ephemeris_grid import EphemerisGrid
+
+JD_START = 2425977.5  # 1930-01-01
+JD_END = 2455197.5    # 2010-01-01
+
+QUERIES = {
+    "moon_cancer_4th_venus_trine_mars_2": [
+        {"type": "sign", "body": "月", "sign": "蟹座"},
+        {"type": "house", "body": "月", "house": 4},
+        {"type": "aspect", "p1": "金星", "p2": "火星", "aspect": "トライン (120°)", "orb": 2},
+    ],
+    "sun_within_3_of_123.5": [
+        {"type": "longitude", "body": "太陽", "degree": 123.5, "within": 3},
+    ],
+    "asc_within_2_of_359_wrap": [
+        {"type": "longitude", "body": "ASC", "degree": 359.0, "within": 2},
+    ],
+    "saturn_10th_sun_square_moon_1": [
+        {"type": "house", "body": "土星", "house": 10},
+        {"type": "aspect", "p1": "太陽", "p2": "月", "aspect": "スクエア (90°)", "orb": 1},
+    ],
+    "venus_libra_only": [
+        {"type": "sign", "body": "金星", "sign": "天秤座"},
+    ],
+    "sun_conjunction_moon_default_orb": [
+        {"type": "aspect", "p1": "太陽", "p2": "月", "aspect": "コンジャンクション (0°)"},
+    ],
+    "venus_trine_mars_default_orb": [
+        {"type": "aspect", "p1": "金星", "p2": "火星", "aspect": "トライン (120°)"},
+    ],
+}
+
+
+def _corpus(count, seed):
+    """ランダムな出生データの黄経 (count, len(BODY_NAMES)) とカスプ (count, 12) を計算する"""
+    rng = np.random.default_rng(seed)
+    jds = rng.uniform(JD_START, JD_END, count)
+    lats, lons = rng.uniform(26.0, 45.0, count), rng.uniform(127.0, 145.0, count)
+    # 天体位置はメモリ上のグリッドからまとめて補間する
+    grid = EphemerisGrid.sample(JD_START - 1, JD_END + 1)
+    planet_lon, _ = grid.positions(jds)
+    planet_lon = planet_lon[:, [grid.body_names.index(name) for name in PLANET_NAMES]]
+    head = list(PLANET_NAMES).index("ドラゴンヘッド")
+    cusps = np.empty((count, 12))
+    angles = np.empty((count, 2))
+    for n in range(count):
+        house_cusps, ascmc = swe.houses(jds[n], lats[n], lons[n], HOUSE_SYSTEM)
+        cusps[n], angles[n] = house_cusps, ascmc[:2]
+    lon = np.column_stack([planet_lon, (planet_lon[:, head] + 180) % 360, angles])
+    return lon, cusps
+
+
+def _write_results(path, lon, cusps):
+    """黄経とカスプを chart_batch の出力と同じ列名の .jsonl に書き出す"""
+    with open(path, "w", encoding="utf-8") as f:
+        for n in range(len(lon)):
+            record = {"row": n, "id": f"c{n}"}
+            record.update({f"natal_{name}_pos": float(pos) for name, pos in zip(BODY_NAMES[:-2], lon[n])})
+            record["asc"], record["mc"] = float(lon[n, -2]), float(lon[n, -1])
+            record.update({f"cusp_{i + 1}": float(cusp) for i, cusp in enumerate(cusps[n])})
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def _build_from_results(tmp, lon, cusps):
+    """build_index の時間 (秒) とメモリ使用量のピーク (MB) を測り、write_index の索引と比べる"""
+    results_path = os.path.join(tmp, "charts.jsonl")
+    _write_results(results_path, lon, cusps)
+    path = os.path.join(tmp, "built.idx")
+    start = time.perf_counter()
+    build_index(results_path, path)
+    build_s = time.perf_counter() - start
+    tracemalloc.start()
+    build_index(results_path, path)
+    peak_mb = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    reference = os.path.join(tmp, "reference.idx")
+    write_index(reference, lon, cusps, np.arange(len(lon)), [f"c{n}" for n in range(len(lon))])
+    same = all(np.array_equal(np.load(os.path.join(path, name)), np.load(os.path.join(reference, name)))
+               for name in os.listdir(reference) if name.endswith(".npy"))
+    return build_s, peak_mb, same
+
+
+def _scan(index, criteria):
+    """索引を使わず、全チャートの列データに全条件を適用する"""
+    candidates = np.arange(len(index))
+    for _, _, _, filter_ in index.plan(criteria):
+        candidates = candidates[filter_(candidates)]
+    return candidates
+
+
+def _natal_aspect_mismatches(index, lon, sample):
+    """オーブを省略したアスペクトだけの検索について、先頭 sample 件の結果を
+    calculate_natal_aspects と比べ、一致しない検索の名前を返す"""
+    criteria_by_name = {name: criteria for name, criteria in QUERIES.items()
+                        if all(c["type"] == "aspect" and "orb" not in c for c in criteria)}
+    expected = {name: [] for name in criteria_by_name}
+    for n in range(sample):
+        bodies = {name: {"id": PLANET_NAMES.get(name, name), "pos": float(pos)} for name, pos in zip(BODY_NAMES, lon[n])}
+        found = {(a["p1_name"], a["p2_name"], a["aspect_name"]) for a in calculate_natal_aspects(bodies)}
+        for name, criteria in criteria_by_name.items():
+            if all((c["p1"], c["p2"], c["aspect"]) in found or (c["p2"], c["p1"], c["aspect"]) in found
+                   for c in criteria):
+                expected[name].append(n)
+    mismatched = []
+    for name, criteria in criteria_by_name.items():
+        indices = index.query(criteria)["indices"]
+        if not np.array_equal(indices[indices < sample], expected[name]):
+            mismatched.append(name)
+    return mismatched
+
+
+def _median_ms(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def _per_chart_ms(lon, cusps, sample):
+    """チャートごとにアスペクトとハウスを計算する場合の 1 件あたりの時間"""
+    start = time.perf_counter()
+    for n in range(sample):
+        bodies = {name: {"id": PLANET_NAMES.get(name, name), "pos": float(pos)} for name, pos in zip(BODY_NAMES, lon[n])}
+        calculate_natal_aspects(bodies)
+        for name in ("月", "土星"):
+            get_house_number(bodies[name]["pos"], cusps[n])
+    return (time.perf_counter() - start) * 1000 / sample
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--charts", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--per-chart-sample", type=int, default=2000)
+    parser.add_argument("--build-charts", type=int, default=100000, help="build_index で計測するチャート数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--index-dir", help="索引の保存先 (省略時は一時ディレクトリ)")
+    args = parser.parse_args(argv)
+
+    swe.set_ephe_path(EPHE_PATH)
+    start = time.perf_counter()
+    lon, cusps = _corpus(args.charts, args.seed)
+    corpus_s = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.index_dir or os.path.join(tmp, "charts.idx")
+        start = time.perf_counter()
+        write_index(path, lon, cusps, np.arange(args.charts), [""] * args.charts)
+        write_s = time.perf_counter() - start
+        build_charts = min(args.build_charts, args.charts)
+        build_s, build_peak_mb, build_matches = _build_from_results(tmp, lon[:build_charts], cusps[:build_charts])
+        size_mb = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)) / 2**20
+
+        start = time.perf_counter()
+        index = ChartIndex(path)
+        open_ms = (time.perf_counter() - start) * 1000
+        sample = min(args.per_chart_sample, args.charts)
+        per_chart_ms = _per_chart_ms(lon, cusps, sample)
+        aspect_mismatched = _natal_aspect_mismatches(index, lon, sample)
+
+        queries = {}
+        mismatched = []
+        for name, criteria in QUERIES.items():
+            result = index.query(criteria)
+            if not np.array_equal(result["indices"], _scan(index, criteria)):
+                mismatched.append(name)
+            queries[name] = {
+                "matches": result["count"],
+                "driver": result["plan"][0]["criterion"]["type"] if result["plan"][0]["use"] == "index" else None,
+                "index_ms": _median_ms(lambda: index.query(criteria), args.repeat),
+                "scan_ms": _median_ms(lambda: _scan(index, criteria), max(1, args.repeat // 10)),
+            }
+
+    print(json.dumps({
+        "charts": args.charts, "corpus_s": corpus_s, "write_index_s": write_s, "index_mb": size_mb,
+        "build_index": {"charts": build_charts, "s": build_s, "peak_mb": build_peak_mb,
+                        "matches_write_index": build_matches},
+        "open_ms": open_ms, "per_chart_scan_s_estimate": per_chart_ms * args.charts / 1000,
+        "queries": queries, "mismatched": mismatched, "natal_aspect_mismatched": aspect_mismatched,
+    }, ensure_ascii=False, indent=2))
+    if mismatched or aspect_mismatched or not build_matches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
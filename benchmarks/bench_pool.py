@@ -0,0 +1,90 @@
+"""ワーカープール (ephemeris_pool) の負荷ベンチマーク
+
+--clients 個のスレッドから同時にチャートの計算を要求し、全体のスループット
+(チャート/秒) と 1 件あたりの待ち時間の分位点を計測して JSON で出力する。
+
+    python benchmarks/bench_pool.py --clients 16 --requests 200 --workers 1 2 4 8
+
+inprocess:   各スレッドがこのプロセスで calculate_all_data を呼ぶ (従来どおり)
+pool:        set_ephemeris_pool でプールを設定して calculate_all_data を呼ぶ (レイヤーごとにやり取り)
+pool_chart:  EphemerisPool.calculate_chart_layers で 1 チャートを 1 回のやり取りで計算する
+"""
+import argparse
+import json
+import os
+import statistics
+import threading
+import time
+
+from sample_data import TRANSIT_UTC, sample_inputs
+
+from chart_engine import calculate_all_data, set_ephemeris_pool, set_chart_cache
+from ephemeris_pool import EphemerisPool
+
+def _load(calculate, clients, requests):
+    """clients 個のスレッドから同時に requests 件ずつ計算し、結果の統計を返す"""
+    latencies = []
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(clients + 1)
+
+    def client(index):
+        samples = []
+        # クライアントごとに異なる出生データ
+        items = sample_inputs(requests, index * requests)
+        start_barrier.wait()
+        for dt_utc, lat, lon in items:
+            start = time.perf_counter()
+            calculate(dt_utc, lat, lon)
+            samples.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(samples)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    start_barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "charts": len(latencies),
+        "charts_per_s": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1000,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=16, help="同時にリクエストするスレッド数")
+    parser.add_argument("--requests", type=int, default=100, help="スレッドあたりのリクエスト数")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1],
+                        help="試すワーカー数")
+    args = parser.parse_args(argv)
+
+    set_chart_cache(None)
+    results = {"cpu_count": os.cpu_count(), "clients": args.clients, "requests": args.requests}
+    results["inprocess"] = _load(lambda d, la, lo: calculate_all_data(d, la, lo, TRANSIT_UTC),
+                                 args.clients, args.requests)
+
+    for workers in sorted(set(args.workers)):
+        with EphemerisPool(workers=workers, max_pending=max(args.clients, workers)) as pool:
+            set_ephemeris_pool(pool)
+            try:
+                layered = _load(lambda d, la, lo: calculate_all_data(d, la, lo, TRANSIT_UTC),
+                                args.clients, args.requests)
+            finally:
+                set_ephemeris_pool(None)
+            chart = _load(lambda d, la, lo: pool.calculate_chart_layers(d, la, lo, TRANSIT_UTC),
+                          args.clients, args.requests)
+        results[f"pool_{workers}"] = layered
+        results[f"pool_chart_{workers}"] = chart
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
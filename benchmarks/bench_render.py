@@ -0,0 +1,136 @@
+"""チャート描画のベンチマーク
+
+各モードを新しいプロセスで実行し、1 チャートあたりの描画時間 (PNG 化を含む) と
+描画を繰り返した後の常駐メモリ (RSS) を計測する。
+
+    python benchmarks/bench_render.py --charts 200
+
+legacy:        create_tri_chart で毎回 Figure を作り、閉じない (分離前の app.py と同じ)
+legacy_close:  create_tri_chart の後に plt.close() する
+layered:       TriChartRenderer で Figure とサインの円を使い回す
+
+あわせて --compare 件のチャートで create_tri_chart と TriChartRenderer の PNG を画素ごとに
+比べる。回転を theta_offset で行うためアンチエイリアスの丸めが異なり、完全には一致しない
+(1 チャートあたり数十画素、各チャンネルの差は数階調)。差が MAX_CHANNEL_DIFF 階調を超える
+画素があれば終了コード 1 を返す。
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from sample_data import sample_charts
+
+MODES = ("legacy", "legacy_close", "layered")
+# create_tri_chart との比較で許容する各チャンネルの差 (0〜255)
+MAX_CHANNEL_DIFF = 8
+
+
+def _rss_mb():
+    """現在の常駐メモリ (MB) を返す"""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def run_mode(mode, count):
+    """1 つのモードを計測して結果を返す (計測用の子プロセス内で実行)"""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from chart_fonts import configure_matplotlib_font
+    from chart_render import create_tri_chart, TriChartRenderer
+
+    configure_matplotlib_font()
+    charts = sample_charts(count)
+    renderer = TriChartRenderer() if mode == "layered" else None
+
+    def render(chart):
+        if renderer is not None:
+            return renderer.render_png(*chart)
+        fig = create_tri_chart(*chart)
+        buf = io.BytesIO()
+        fig.savefig(buf, format="png")
+        if mode == "legacy_close":
+            plt.close(fig)
+        return buf.getvalue()
+
+    render(charts[0])  # ウォームアップ
+    rss_start = _rss_mb()
+    samples = []
+    for chart in charts:
+        start = time.perf_counter()
+        render(chart)
+        samples.append(time.perf_counter() - start)
+    return {
+        "mode": mode, "charts": count,
+        "median_ms": statistics.median(samples) * 1000,
+        "p90_ms": sorted(samples)[int(len(samples) * 0.9)] * 1000,
+        "rss_start_mb": rss_start, "rss_end_mb": _rss_mb(),
+    }
+
+
+def compare_pixels(count):
+    """create_tri_chart と TriChartRenderer の PNG の画素の差を比べる (計測用の子プロセス内で実行)"""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import numpy as np
+    from PIL import Image
+    from chart_fonts import configure_matplotlib_font
+    from chart_render import create_tri_chart, TriChartRenderer
+
+    configure_matplotlib_font()
+    renderer = TriChartRenderer()
+    differing, max_diff = [], 0
+    for chart in sample_charts(count):
+        fig = create_tri_chart(*chart)
+        buf = io.BytesIO()
+        fig.savefig(buf, format="png")
+        plt.close(fig)
+        legacy = np.asarray(Image.open(buf), dtype=int)
+        layered = np.asarray(Image.open(io.BytesIO(renderer.render_png(*chart))), dtype=int)
+        if legacy.shape != layered.shape:
+            return {"charts": count, "same_size": False, "within_tolerance": False}
+        diff = np.abs(legacy - layered).max(axis=-1)
+        differing.append(int((diff > 0).sum()))
+        max_diff = max(max_diff, int(diff.max()))
+    return {
+        "charts": count, "same_size": True, "differing_pixels_max": max(differing),
+        "differing_pixels_median": statistics.median(differing), "max_channel_diff": max_diff,
+        "tolerance": MAX_CHANNEL_DIFF, "within_tolerance": max_diff <= MAX_CHANNEL_DIFF,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--charts", type=int, default=100, help="描画するチャート数")
+    parser.add_argument("--compare", type=int, default=10, help="画素を比較するチャート数")
+    parser.add_argument("--mode", choices=MODES + ("compare",), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.mode == "compare":
+        print(json.dumps(compare_pixels(args.compare)))
+        return
+    if args.mode:
+        print(json.dumps(run_mode(args.mode, args.charts)))
+        return
+
+    results = {}
+    for mode in MODES:
+        out = subprocess.run([sys.executable, __file__, "--mode", mode, "--charts", str(args.charts)],
+                             check=True, capture_output=True, text=True).stdout
+        results[mode] = json.loads(out.strip().splitlines()[-1])
+    out = subprocess.run([sys.executable, __file__, "--mode", "compare", "--compare", str(args.compare)],
+                         check=True, capture_output=True, text=True).stdout
+    results["pixel_diff"] = json.loads(out.strip().splitlines()[-1])
+    print(json.dumps(results, indent=2))
+    if not results["pixel_diff"]["within_tolerance"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""起動 (インポート) 時間のベンチマーク
+
+計算エンジンのみを使うワーカーのコールドスタートを想定し、各ケースを
+新しい Python プロセスで実行してインポートにかかる時間を計測する。
+
+    python benchmarks/bench_startup.py --runs 5
+
+before: 分離前の app.py がモジュール読み込み時に行っていた処理
+        (streamlit / matplotlib.pyplot / pandas のインポートとシステムフォント探索)
+after:  chart_engine のインポートのみ
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CASES = {
+    "before": (
+        "import streamlit, swisseph, numpy, pandas\n"
+        "import matplotlib.pyplot\n"
+        "import matplotlib.font_manager as fm\n"
+        "fm.findSystemFonts(fontpaths=None, fontext='ttf')\n"
+    ),
+    "after": "import chart_engine\n",
+}
+
+
+def _time_case(code):
+    """新しいプロセスでコードを実行し、経過時間 (秒) を返す"""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="各ケースの試行回数")
+    args = parser.parse_args(argv)
+
+    # 初回実行はバイトコードのコンパイル等を含むため捨てる
+    for code in CASES.values():
+        _time_case(code)
+
+    results = {}
+    for name, code in CASES.items():
+        samples = [_time_case(code) for _ in range(args.runs)]
+        results[name] = {"median_s": statistics.median(samples), "min_s": min(samples), "runs": args.runs}
+    results["speedup"] = results["before"]["median_s"] / results["after"]["median_s"]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+"""計算・描画の主要処理のベンチマークと回帰チェック
+
+同梱の ephe/ の天体暦だけを使い (ネットワーク不要)、次の 2 つを行って結果を JSON で出力する。
+
+golden:     固定した出生データについて、ネイタル・プログレス・トランジットの天体位置と
+            カスプ・ASC/MC・ハウス番号・アスペクトを benchmarks/golden.json と比べる
+            (位置の許容誤差は GOLDEN_TOLERANCE_ARCSEC 秒角)
+benchmarks: 1 チャートの計算、バッチ計算、多数チャートのアスペクト走査、ハウス判定、
+            描画 (Matplotlib・SVG) の所要時間
+
+    python benchmarks/bench_suite.py --output result.json
+    python benchmarks/bench_suite.py --compare base.json      # 別コミットの結果と比べる
+    python benchmarks/bench_suite.py --update-golden          # 意図して計算を変えたときのみ
+
+golden のチェックに失敗した場合は終了コード 1 で終わる。計算結果のキャッシュと
+事前計算グリッドは使わず、常に Swiss Ephemeris で計算する。
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from sample_data import ROOT, TRANSIT_UTC, sample_charts, sample_inputs
+
+import numpy as np
+
+from chart_engine import (
+    EPHE_PATH, ephemeris_available, calculate_all_data, calculate_chart_layers, get_house_number,
+    set_chart_cache, set_ephemeris_grid,
+)
+from chart_aspects import calculate_natal_aspects, body_arrays, batch_natal_aspects
+from chart_frame import house_numbers
+
+GOLDEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden.json")
+GOLDEN_TOLERANCE_ARCSEC = 1.0
+# プログレスの基準時刻 (golden の値が実行日に依存しないよう固定する)
+REFERENCE_UTC = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+# (出生日時 UTC, 緯度, 経度, トランジット日時 UTC)。天体暦の範囲の端や南半球も含める
+GOLDEN_CASES = [
+    ("1850-03-21T12:00:00", 51.48, 0.0, "1900-01-01T00:00:00"),
+    ("1900-01-01T00:00:00", 35.69, 139.69, "1950-06-15T06:30:00"),
+    ("1945-08-15T03:00:00", 34.69, 135.50, "2000-01-01T12:00:00"),
+    ("1964-10-10T05:00:00", 43.06, 141.35, "2020-07-24T11:00:00"),
+    ("1979-02-28T23:59:00", 26.21, 127.68, "2011-03-11T05:46:00"),
+    ("1990-01-01T03:00:00", 35.69, 139.69, "2024-01-01T00:00:00"),
+    ("1995-01-16T20:46:00", 34.69, 135.18, "2030-12-31T23:59:00"),
+    ("2000-02-29T12:34:56", -33.87, 151.21, "2024-04-08T18:17:00"),
+    ("2012-12-21T11:11:00", -22.91, -43.17, "2050-05-05T05:05:00"),
+    ("2024-06-30T15:00:00", 64.15, -21.94, "2100-01-01T00:00:00"),
+    ("2150-07-04T18:00:00", 40.71, -74.01, "2199-12-31T00:00:00"),
+]
+
+
+def _utc(value):
+    return datetime.fromisoformat(value).replace(tzinfo=timezone.utc)
+
+
+# --- golden ---
+def _golden_record(case):
+    """1 件の出生データの計算結果を golden の形式にする"""
+    birth, lat, lon, transit = case
+    natal, prog, trans, cusps, ascmc = calculate_chart_layers(_utc(birth), lat, lon, _utc(transit), now_utc=REFERENCE_UTC)
+    return {
+        "case": list(case),
+        "natal": {name: data['pos'] for name, data in natal.items()},
+        "prog": {name: data['pos'] for name, data in prog.items()},
+        "trans": {name: data['pos'] for name, data in trans.items()},
+        "retro": {name: data['is_retro'] for name, data in natal.items()},
+        "cusps": list(cusps[:12]),
+        "ascmc": list(ascmc[:2]),
+        "houses": {name: get_house_number(data['pos'], cusps) for name, data in natal.items()},
+        "aspects": sorted(f"{a['p1_name']}-{a['p2_name']}-{a['aspect_name']}" for a in calculate_natal_aspects(natal)),
+    }
+
+
+def _arcsec(a, b):
+    """2 つの黄経の差 (秒角、0°/360° をまたぐ場合も考慮)"""
+    diff = abs(a - b) % 360
+    return min(diff, 360 - diff) * 3600
+
+
+def check_golden(golden):
+    """golden と比べ、最大誤差と不一致の一覧を返す"""
+    failures = []
+    max_error = 0.0
+    for expected in golden["charts"]:
+        actual = _golden_record(tuple(expected["case"]))
+        label = expected["case"][0]
+        for section in ("natal", "prog", "trans"):
+            for name, pos in expected[section].items():
+                error = _arcsec(actual[section][name], pos)
+                max_error = max(max_error, error)
+                if error > GOLDEN_TOLERANCE_ARCSEC:
+                    failures.append(f"{label} {section} {name}: {error:.3f}″")
+        for section, values in (("cusps", expected["cusps"]), ("ascmc", expected["ascmc"])):
+            for i, pos in enumerate(values):
+                error = _arcsec(actual[section][i], pos)
+                max_error = max(max_error, error)
+                if error > GOLDEN_TOLERANCE_ARCSEC:
+                    failures.append(f"{label} {section}[{i}]: {error:.3f}″")
+        for section in ("retro", "houses", "aspects"):
+            if actual[section] != expected[section]:
+                failures.append(f"{label} {section} が一致しません")
+    return {"ok": not failures, "charts": len(golden["charts"]), "max_error_arcsec": max_error, "failures": failures}
+
+
+def update_golden(path=GOLDEN_PATH):
+    golden = {
+        "tolerance_arcsec": GOLDEN_TOLERANCE_ARCSEC,
+        "reference_utc": REFERENCE_UTC.isoformat(),
+        "charts": [_golden_record(case) for case in GOLDEN_CASES],
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(golden, f, ensure_ascii=False, indent=1)
+        f.write("\n")
+
+
+# --- ベンチマーク ---
+def _timed(func, repeat, warmup=1):
+    """func を repeat 回実行し、1 回あたりの時間の統計 (ms) を返す"""
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "n": repeat,
+        "median_ms": statistics.median(samples),
+        "p90_ms": samples[min(int(repeat * 0.9), repeat - 1)],
+        "min_ms": samples[0],
+    }
+
+
+def bench_single_chart(repeat):
+    inputs = iter(sample_inputs(repeat + 1) * 2)
+
+    def run():
+        dt_utc, lat, lon = next(inputs)
+        calculate_all_data(dt_utc, lat, lon, TRANSIT_UTC)
+    return _timed(run, repeat)
+
+
+def bench_batch(count, workers):
+    """chart_batch.run_batch で count 件を計算し、スループットを返す"""
+    from chart_batch import run_batch
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = os.path.join(tmp, "input.csv")
+        with open(input_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["id", "birth_date", "birth_time", "lat", "lon", "tz"])
+            for i, (dt_utc, lat, lon) in enumerate(sample_inputs(count)):
+                writer.writerow([i, dt_utc.strftime("%Y-%m-%d"), dt_utc.strftime("%H:%M"), lat, lon, 0])
+        start = time.perf_counter()
+        rows = run_batch(input_path, os.path.join(tmp, "output.jsonl"), workers=workers,
+                         transit_at=REFERENCE_UTC, progressed_at=REFERENCE_UTC, log=None)
+        elapsed = time.perf_counter() - start
+    return {"n": rows, "workers": workers, "total_s": elapsed, "charts_per_s": rows / elapsed}
+
+
+def bench_aspects(count):
+    """count 件のネイタルアスペクトを 1 件ずつ計算する場合とまとめて計算する場合"""
+    charts = [calculate_all_data(dt_utc, lat, lon, TRANSIT_UTC)[0] for dt_utc, lat, lon in sample_inputs(count)]
+    names, _, luminary = body_arrays(charts[0])
+    lon = np.array([body_arrays(bodies)[1] for bodies in charts])
+
+    def per_chart():
+        for bodies in charts:
+            calculate_natal_aspects(bodies)
+    return {
+        "charts": count,
+        "per_chart": _timed(per_chart, 5),
+        "batched": _timed(lambda: batch_natal_aspects(lon, luminary, names), 5),
+    }
+
+
+def bench_houses(count):
+    """ハウス判定: get_house_number を天体ごとに呼ぶ場合と house_numbers でまとめる場合"""
+    natal, _, _, cusps, _ = calculate_all_data(datetime(1990, 1, 1, 3, tzinfo=timezone.utc), 35.69, 139.69, TRANSIT_UTC)
+    lon = np.random.default_rng(0).uniform(0, 360, count)
+    values = lon.tolist()
+    return {
+        "positions": count,
+        "get_house_number": _timed(lambda: [get_house_number(x, cusps) for x in values], 5),
+        "house_numbers": _timed(lambda: house_numbers(lon, cusps), 5),
+    }
+
+
+def bench_render(count):
+    """描画: create_tri_chart (PNG 化を含む)・TriChartRenderer・SVG"""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from chart_render import create_tri_chart, TriChartRenderer
+    from chart_svg import render_tri_chart_svg
+
+    charts = [chart for chart in sample_charts(count) if chart[3]]
+    renderer = TriChartRenderer()
+
+    def legacy():
+        for chart in charts:
+            fig = create_tri_chart(*chart)
+            fig.savefig(io.BytesIO(), format="png")
+            plt.close(fig)
+
+    def layered():
+        for chart in charts:
+            renderer.render_png(*chart)
+
+    def svg():
+        for chart in charts:
+            render_tri_chart_svg(*chart)
+
+    results = {"charts": len(charts)}
+    for name, func in (("create_tri_chart", legacy), ("tri_chart_renderer", layered), ("svg", svg)):
+        stats = _timed(func, 3)
+        results[name] = {key: value / len(charts) if key.endswith("_ms") else value for key, value in stats.items()}
+    renderer.close()
+    return results
+
+
+def run_benchmarks(scale=1.0, workers=2):
+    """全ベンチマークを実行する (scale で件数を増減する)"""
+    def n(value):
+        return max(1, int(value * scale))
+    return {
+        "single_chart": bench_single_chart(n(200)),
+        "batch": bench_batch(n(2000), workers),
+        "aspects": bench_aspects(n(1000)),
+        "houses": bench_houses(n(10000)),
+        "render": bench_render(n(20)),
+    }
+
+
+# --- 比較 ---
+def _flatten_ms(results, prefix=""):
+    """結果の dict から所要時間 (median_ms・total_s) をドット区切りのキーで取り出す"""
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(_flatten_ms(value, f"{prefix}{key}."))
+        elif key in ("median_ms", "total_s"):
+            flat[prefix + key] = value
+    return flat
+
+
+def compare(base, current):
+    """2 つの結果の所要時間を比べ、比 (current / base) を返す"""
+    base_ms, current_ms = _flatten_ms(base["benchmarks"]), _flatten_ms(current["benchmarks"])
+    return {key: {"base": base_ms[key], "current": value, "ratio": value / base_ms[key]}
+            for key, value in current_ms.items() if base_ms.get(key)}
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", help="結果の JSON の書き出し先 (省略時は標準出力のみ)")
+    parser.add_argument("--compare", help="比較する過去の結果の JSON")
+    parser.add_argument("--scale", type=float, default=1.0, help="ベンチマークの件数の倍率")
+    parser.add_argument("--workers", type=int, default=2, help="バッチ計算のワーカープロセス数")
+    parser.add_argument("--golden-only", action="store_true", help="回帰チェックのみ行う")
+    parser.add_argument("--update-golden", action="store_true", help="golden.json を現在の計算結果で作り直す")
+    args = parser.parse_args(argv)
+
+    if not ephemeris_available():
+        raise SystemExit(f"天体暦ファイルが見つかりません: {EPHE_PATH}")
+    set_chart_cache(None)
+    set_ephemeris_grid(None)
+    calculate_all_data(REFERENCE_UTC, 0, 0, REFERENCE_UTC)  # 天体暦パスの設定
+
+    if args.update_golden:
+        update_golden()
+        print(f"{GOLDEN_PATH} を更新しました", file=sys.stderr)
+        return
+
+    with open(GOLDEN_PATH, encoding="utf-8") as f:
+        golden = check_golden(json.load(f))
+    result = {
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "golden": golden,
+    }
+    if not args.golden_only:
+        result["benchmarks"] = run_benchmarks(args.scale, args.workers)
+    if args.compare and "benchmarks" in result:
+        with open(args.compare, encoding="utf-8") as f:
+            result["comparison"] = compare(json.load(f), result)
+
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+    sys.exit(0 if golden["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
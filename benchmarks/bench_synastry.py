@@ -0,0 +1,105 @@
+"""1 対多のシナストリー採点 (chart_synastry) のベンチマーク
+
+--charts 件のネイタルチャート (ランダムな出生日時の天体、ハウスなし) を母集団として、
+ランダムな照会チャートとの採点について次の時間を比べて JSON で出力する。
+
+    vectorized:  SynastryPopulation.top_matches (workers=1、天体の列ごとの np.interp)
+    parallel:    同 (workers=--workers、区間ごとにワーカープロセスで採点)
+    per_chart:   チャートごとに calculate_cross_aspects を呼んで点数を合計する場合の推定
+                 (--per-chart-sample 件の計測から全件分を換算)
+
+点数 (上位と per_chart で計測した各チャート) が calculate_cross_aspects のアスペクトの
+重みの合計と一致しない場合、または並列と逐次で上位が一致しない場合は終了コード 1 を返す。
+
+    python benchmarks/bench_synastry.py --charts 1000000 --workers 4
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import swisseph as swe
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from chart_engine import BODY_NAMES, EPHE_PATH, PLANET_NAMES
+from chart_synastry import SynastryPopulation, _weighted_aspects
+from ephemeris_grid import EphemerisGrid
+
+JD_START = 2425977.5  # 1930-01-01
+JD_END = 2455197.5    # 2010-01-01
+
+
+def _population(count, seed):
+    """ランダムな出生日時の黄経 (count, len(BODY_NAMES)) をメモリ上のグリッドから補間する"""
+    rng = np.random.default_rng(seed)
+    jds = rng.uniform(JD_START, JD_END, count + 1)
+    grid = EphemerisGrid.sample(JD_START - 1, JD_END + 1)
+    lon, _ = grid.positions(jds)
+    lon = lon[:, [grid.body_names.index(name) for name in PLANET_NAMES]]
+    head = list(PLANET_NAMES).index("ドラゴンヘッド")
+    lon = np.column_stack([lon, (lon[:, head] + 180) % 360])
+    # 先頭の 1 件を照会チャートにする
+    return lon[1:], lon[0]
+
+
+def _bodies(lon):
+    return {name: {"id": PLANET_NAMES.get(name, name), "pos": float(pos)} for name, pos in zip(BODY_NAMES, lon)}
+
+
+def _per_chart(population, query, sample):
+    """チャートごとに calculate_cross_aspects で採点する場合の点数と 1 件あたりの時間"""
+    start = time.perf_counter()
+    scores = [sum(aspect["weight"] for aspect in _weighted_aspects(query, population._bodies(i)))
+              for i in range(sample)]
+    return np.array(scores), (time.perf_counter() - start) * 1000 / sample
+
+
+def _timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--charts", type=int, default=1000000)
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--per-chart-sample", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    swe.set_ephe_path(EPHE_PATH)
+    lon, query_lon = _population(args.charts, args.seed)
+    population = SynastryPopulation(lon, BODY_NAMES)
+    query = _bodies(query_lon)
+
+    matches, vectorized_ms = _timed(lambda: population.top_matches(query, args.top_k))
+    parallel, parallel_ms = _timed(lambda: population.top_matches(query, args.top_k, workers=args.workers))
+    sample = min(args.per_chart_sample, args.charts)
+    per_chart_scores, per_chart_ms = _per_chart(population, query, sample)
+
+    errors = [abs(match["score"] - sum(aspect["weight"] for aspect in match["aspects"])) for match in matches]
+    errors.extend(np.abs(population.scores(query)[:sample] - per_chart_scores).tolist())
+    consistent = max(errors, default=0) < 1e-9
+    parallel_matches = [match["index"] for match in matches] == [match["index"] for match in parallel]
+
+    print(json.dumps({
+        "charts": args.charts, "bodies": len(BODY_NAMES), "top_k": args.top_k,
+        "cpu_count": os.cpu_count(), "workers": args.workers,
+        "vectorized_ms": vectorized_ms, "parallel_ms": parallel_ms,
+        "per_chart_s_estimate": per_chart_ms * args.charts / 1000,
+        "top": [{"index": match["index"], "score": round(match["score"], 4), "aspects": len(match["aspects"])}
+                for match in matches[:5]],
+        "max_score_error": max(errors, default=0), "parallel_matches": parallel_matches,
+    }, ensure_ascii=False, indent=2))
+    if not (consistent and parallel_matches):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
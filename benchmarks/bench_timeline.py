@@ -0,0 +1,90 @@
+"""プログレスの年表 (progression_timeline) のベンチマーク
+
+1 つの出生データについて、calculate_progression_timeline の 1 回の呼び出しと、
+同じサンプル (毎月) ごとに calculate_chart_layers を呼ぶ従来の方法の所要時間を比べ、
+年表の黄経と live の swe.calc_ut との最大誤差 (秒角) を JSON で出力する。
+
+    python benchmarks/bench_timeline.py --years 100 --repeat 5
+    python benchmarks/bench_timeline.py --grid ephe/grid_1900_2100.bin
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timezone, timedelta
+
+import numpy as np
+import swisseph as swe
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import chart_engine
+from chart_engine import EPHE_PATH, PLANET_NAMES, calculate_chart_layers
+from ephemeris_grid import EphemerisGrid
+from progression_timeline import DAYS_PER_YEAR, calculate_progression_timeline
+
+BIRTH_UTC = datetime(1985, 6, 15, 3, 30, tzinfo=timezone.utc)
+LAT, LON = 35.69, 139.69
+TRANSIT_UTC = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def _best(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {"best_ms": min(times) * 1000, "median_ms": statistics.median(times) * 1000}
+
+
+def _loop(ages):
+    """サンプルごとにプログレスを含むチャートを計算する (従来の方法)"""
+    for age in ages:
+        now_utc = BIRTH_UTC + timedelta(days=float(age) * DAYS_PER_YEAR)
+        calculate_chart_layers(BIRTH_UTC, LAT, LON, TRANSIT_UTC, now_utc)
+
+
+def _max_error(timeline):
+    """年表の黄経と live の swe.calc_ut の最大誤差 (秒角)"""
+    iflag = swe.FLG_SWIEPH | swe.FLG_SPEED
+    error = 0.0
+    for b, p_id in enumerate(PLANET_NAMES.values()):
+        live = np.array([swe.calc_ut(jd, p_id, iflag)[0][0] for jd in timeline["progressed_jd_ut"]])
+        error = max(error, float(np.abs((timeline["lon"][:, b] - live + 180) % 360 - 180).max()))
+    return error * 3600
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--years", type=float, default=100)
+    parser.add_argument("--samples-per-year", type=int, default=12)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--grid", help="天体位置グリッド (ephemeris_grid) のパス")
+    args = parser.parse_args(argv)
+
+    swe.set_ephe_path(EPHE_PATH)
+    chart_engine.set_chart_cache(None)
+    if args.grid:
+        chart_engine.set_ephemeris_grid(EphemerisGrid(args.grid))
+
+    timeline = calculate_progression_timeline(BIRTH_UTC, LAT, LON, args.years, args.samples_per_year)
+    ages = timeline["ages"]
+    results = {
+        "samples": len(ages),
+        "bodies": len(timeline["names"]),
+        "events": len(timeline["events"]),
+        "grid": bool(args.grid),
+        "timeline": _best(lambda: calculate_progression_timeline(BIRTH_UTC, LAT, LON, args.years,
+                                                                 args.samples_per_year), args.repeat),
+        "per_sample_loop": _best(lambda: _loop(ages), max(1, args.repeat // 2)),
+        "max_error_arcsec": _max_error(timeline),
+    }
+    results["speedup"] = results["per_sample_loop"]["best_ms"] / results["timeline"]["best_ms"]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""トランジットのイベント検索 (transit_search) のベンチマーク
+
+1 つのネイタルチャートに対する --years 年分の search_transit_events について、
+全 13 天体・月以外の 12 天体・月のみの所要時間とイベント数を JSON で出力する。
+天体位置は検索期間をおおうメモリ上のグリッド (EphemerisGrid.sample) から補間する。
+グリッドの作成時間は grid_build_ms に、検索ごとの作成込みの時間は with_grid_build_ms に出力する。
+
+目標は「グリッドありで 100 年分の全天体の検索が 1 秒未満」。target_met に検索のみ、
+target_met_with_grid_build にグリッドの作成込みでの達成の有無を出力する
+(グリッドの作成は swe.calc_ut の呼び出しが大半で、100 年分では目標より長くかかる。
+何度も検索する場合は ephemeris_grid.build_grid で作ったファイルを使い回すこと)。
+
+    python benchmarks/bench_transit_search.py --years 100 --repeat 3
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import swisseph as swe
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import chart_engine
+from chart_engine import EPHE_PATH, PLANET_NAMES, _calculate_celestial_bodies
+from ephemeris_grid import EphemerisGrid
+from transit_search import search_transit_events
+
+TARGET_MS = 1000
+LAT, LON = 35.69, 139.69
+
+
+def _measure(natal, start_jd, end_jd, transit_names, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = sum(1 for _ in search_transit_events(natal, start_jd, end_jd, transit_names=transit_names))
+        times.append(time.perf_counter() - start)
+    return {"events": count, "best_ms": min(times) * 1000, "median_ms": statistics.median(times) * 1000}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--years", type=float, default=100)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    swe.set_ephe_path(EPHE_PATH)
+    start_jd = swe.julday(1990, 1, 1, 3.0)
+    end_jd = start_jd + args.years * 365.25
+    natal, _, _ = _calculate_celestial_bodies(start_jd, LAT, LON, calc_houses=True)
+    start = time.perf_counter()
+    chart_engine.set_ephemeris_grid(EphemerisGrid.sample(start_jd - 10, end_jd + 10))
+    grid_build_ms = (time.perf_counter() - start) * 1000
+
+    all_bodies = list(PLANET_NAMES)
+    results = {
+        "years": args.years,
+        "grid_build_ms": grid_build_ms,
+        "all_bodies": _measure(natal, start_jd, end_jd, all_bodies, args.repeat),
+        "without_moon": _measure(natal, start_jd, end_jd, [name for name in all_bodies if name != "月"], args.repeat),
+        "moon_only": _measure(natal, start_jd, end_jd, ["月"], args.repeat),
+    }
+    keys = ("all_bodies", "without_moon", "moon_only")
+    for key in keys:
+        results[key]["with_grid_build_ms"] = grid_build_ms + results[key]["median_ms"]
+    results["target_ms"] = TARGET_MS
+    results["target_met"] = {key: results[key]["median_ms"] < TARGET_MS for key in keys}
+    results["target_met_with_grid_build"] = {key: results[key]["with_grid_build_ms"] < TARGET_MS for key in keys}
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""チャート計算サービス (chart_service) の負荷試験
+
+サービスを子プロセスとして localhost で起動し (--url を指定した場合は起動済みのサービスに
+接続し)、--concurrency 本の keep-alive 接続から合計 --requests 件のリクエストを送って、
+エンドポイントごとの待ち時間の p50/p99 とスループットを JSON で出力する。
+
+    python benchmarks/load_service.py --requests 2000 --concurrency 32
+    python benchmarks/load_service.py --url http://127.0.0.1:8765 --mix chart=1
+
+リクエストの出生データとトランジット日時は少数の候補から選ぶため、同じ内容の
+リクエストが同時に届き、サービス側の合流とトランジットのまとめ計算が働く。
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from urllib.parse import urlencode, urlsplit
+from urllib.request import urlopen
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MIX = "chart=0.5,transits=0.3,svg=0.15,png=0.05"
+PATHS = {"chart": "/chart", "svg": "/chart.svg", "png": "/chart.png", "transits": "/transits"}
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _start_service(extra_args):
+    """サービスを子プロセスで起動し、応答するようになるまで待つ"""
+    port = _free_port()
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, "chart_service.py"), "--port", str(port), *extra_args],
+                               cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            with urlopen(f"{url}/healthz", timeout=1):
+                return process, url
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise SystemExit("サービスが起動しませんでした")
+
+
+def _workload(count, mix, distinct, seed):
+    """(種類, リクエストのパス) のリストを作る"""
+    rng = random.Random(seed)
+    kinds, weights = zip(*mix.items())
+    births = [{"birth_date": f"{rng.randint(1940, 2010)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+               "birth_time": f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}",
+               "prefecture": "東京都", "transit": "2024-01-01T12:00"} for _ in range(distinct)]
+    transit_times = [f"20{rng.randint(20, 30)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T"
+                     f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}" for _ in range(distinct * 4)]
+    requests = []
+    for kind in rng.choices(kinds, weights, k=count):
+        params = {"at": rng.choice(transit_times)} if kind == "transits" else rng.choice(births)
+        requests.append((kind, f"{PATHS[kind]}?{urlencode(params)}"))
+    return requests
+
+
+async def _connection(host, port, queue, results):
+    """1 本の keep-alive 接続でキューが空になるまでリクエストを送る"""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while True:
+            try:
+                kind, path = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+            start = time.perf_counter()
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode("latin-1"))
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                if name.lower() == "content-length":
+                    length = int(value)
+            await reader.readexactly(length)
+            results.append((kind, status, time.perf_counter() - start))
+    finally:
+        writer.close()
+
+
+async def _run_load(url, requests, concurrency):
+    parts = urlsplit(url)
+    queue = asyncio.Queue()
+    for request in requests:
+        queue.put_nowait(request)
+    results = []
+    start = time.perf_counter()
+    await asyncio.gather(*[_connection(parts.hostname, parts.port, queue, results) for _ in range(concurrency)])
+    return results, time.perf_counter() - start
+
+
+def _summary(samples):
+    latencies = sorted(seconds for _, _, seconds in samples)
+    return {
+        "requests": len(samples),
+        "errors": sum(1 for _, status, _ in samples if status != 200),
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1000,
+    }
+
+
+def _service_counters(url):
+    """サービスの /metrics から horoscope_service_* のカウンタを取り出す"""
+    with urlopen(f"{url}/metrics", timeout=5) as response:
+        text = response.read().decode("utf-8")
+    return {line.split()[0]: float(line.split()[1]) for line in text.splitlines()
+            if line.startswith("horoscope_service_")}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="起動済みのサービスの URL (省略時は子プロセスで起動する)")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="エンドポイントの比率 (chart/svg/png/transits)")
+    parser.add_argument("--distinct", type=int, default=50, help="出生データの候補数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--service-args", default="", help="子プロセスのサービスに渡す引数 (例: \"--grid grid.bin\")")
+    args = parser.parse_args(argv)
+
+    mix = {kind: float(weight) for kind, weight in (item.split("=") for item in args.mix.split(","))}
+    unknown = set(mix) - set(PATHS)
+    if unknown:
+        raise SystemExit(f"未対応の種類です: {', '.join(sorted(unknown))}")
+
+    process = None
+    url = args.url
+    if url is None:
+        process, url = _start_service(args.service_args.split())
+    try:
+        requests = _workload(args.requests, mix, args.distinct, args.seed)
+        results, elapsed = asyncio.run(_run_load(url, requests, args.concurrency))
+        report = {
+            "requests": len(results),
+            "concurrency": args.concurrency,
+            "elapsed_s": elapsed,
+            "requests_per_s": len(results) / elapsed,
+            "overall": _summary(results),
+            "endpoints": {kind: _summary([r for r in results if r[0] == kind]) for kind in mix
+                          if any(r[0] == kind for r in results)},
+            "service": _service_counters(url),
+        }
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
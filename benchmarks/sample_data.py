@@ -0,0 +1,35 @@
+"""ベンチマーク共通のサンプルデータ
+
+日付と場所をずらして毎回異なるチャートになる出生データを作る。インポートすると
+リポジトリのルートを sys.path に加えるため、各スクリプトは最初にこのモジュールを
+インポートしてからルートのモジュールをインポートする。
+
+    from sample_data import TRANSIT_UTC, sample_charts, sample_inputs
+"""
+import os
+import sys
+from datetime import datetime, timezone, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+TRANSIT_UTC = datetime(2024, 1, 1, tzinfo=timezone.utc)
+_BASE_UTC = datetime(1950, 1, 1, tzinfo=timezone.utc)
+
+
+def sample_inputs(count, offset=0):
+    """出生データ (dt_utc, lat, lon) のリストを作る
+
+    offset 件目から count 件を返す (offset を変えると別のデータになる。スレッドごとに分けるときに使う)。
+    """
+    return [(_BASE_UTC + timedelta(days=53 * i, minutes=97 * i), 20 + (i * 7) % 40, 125 + (i * 11) % 20)
+            for i in range(offset, offset + count)]
+
+
+def sample_charts(count, offset=0, transit_utc=TRANSIT_UTC):
+    """sample_inputs の出生データで calculate_all_data の結果のリストを作る (描画用)"""
+    # 描画のベンチマークの親プロセスでは天体暦を読み込まないよう、使うときにインポートする
+    from chart_engine import calculate_all_data
+
+    return [calculate_all_data(dt_utc, lat, lon, transit_utc) for dt_utc, lat, lon in sample_inputs(count, offset)]
@@ -0,0 +1,106 @@
+"""SVG 版と Matplotlib 版の三重円チャートの比較
+
+いくつかのチャートについて次の 2 点を確認し、結果を JSON で出力する。
+差が閾値を超えた場合は終了コード 1 で終わる。
+
+pixel:    SVG を cairosvg でラスタライズし、Matplotlib の PNG と比べて色の差が大きい
+          ピクセルの割合。見た目の比較はこれだけで、cairosvg (benchmarks/requirements.txt)
+          がなければエラーで終わる。--geometry-only を付けたときだけ比較を省き、
+          pixel を "skipped" として出力する (この場合は見た目を確認していない)
+geometry: 全テキスト (サイン・ハウス番号・天体記号・度数・ASC/MC) の配置座標の最大差 (px)。
+          両方の描画とも chart_layout で座標を求めるため、SVG の座標変換の確認にとどまり、
+          見た目の比較の代わりにはならない
+
+    pip install -r benchmarks/requirements.txt
+    python benchmarks/svg_visual_diff.py
+"""
+import argparse
+import io
+import json
+import re
+import sys
+import time
+
+from sample_data import sample_charts
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+
+from chart_render import TriChartRenderer
+from chart_svg import render_tri_chart_svg
+
+MAX_GEOMETRY_DIFF_PX = 0.5
+MAX_PIXEL_MISMATCH = 0.03
+PIXEL_THRESHOLD = 0.25
+
+TEXT_RE = re.compile(r'<text x="([\d.]+)" y="([\d.]+)"[^>]*>([^<]*)</text>')
+
+
+def _geometry_diff(renderer, chart, svg):
+    """テキストの配置座標を比べ、最大差 (px) を返す"""
+    fig = renderer.render(*chart)
+    fig.canvas.draw()  # 極座標軸の縦横比は描画時に確定する
+    ax = renderer.ax
+    height = fig.bbox.height
+    mpl = sorted((t.get_text(), *ax.transData.transform(t.get_position())) for t in ax.texts)
+    mpl = [(s, x, height - y) for s, x, y in mpl]
+    ours = sorted((s, float(x), float(y)) for x, y, s in TEXT_RE.findall(svg.decode("utf-8")))
+    if [s for s, _, _ in mpl] != [s for s, _, _ in ours]:
+        return float("inf")
+    return max(max(abs(a[1] - b[1]), abs(a[2] - b[2])) for a, b in zip(mpl, ours))
+
+
+def _load_cairosvg():
+    try:
+        import cairosvg
+    except (ImportError, OSError) as e:
+        raise SystemExit("画素の比較には cairosvg が必要です: pip install -r benchmarks/requirements.txt "
+                         "(座標だけを比べる場合は --geometry-only)") from e
+    return cairosvg
+
+
+def _pixel_mismatch(cairosvg, renderer, chart, svg):
+    """ラスタライズした画像を比べ、差の大きいピクセルの割合を返す"""
+    expected = plt.imread(io.BytesIO(renderer.render_png(*chart)))[..., :3]
+    actual = plt.imread(io.BytesIO(cairosvg.svg2png(bytestring=svg)))[..., :3]
+    return float(np.mean(np.abs(expected - actual).max(axis=2) > PIXEL_THRESHOLD))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--charts", type=int, default=5)
+    parser.add_argument("--geometry-only", action="store_true",
+                        help="画素の比較 (cairosvg が必要) を省き、配置座標だけを比べる")
+    args = parser.parse_args(argv)
+    cairosvg = None if args.geometry_only else _load_cairosvg()
+
+    renderer = TriChartRenderer()
+    results = []
+    for chart in sample_charts(args.charts):
+        start = time.perf_counter()
+        svg = render_tri_chart_svg(*chart)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with renderer.lock:
+            geometry = _geometry_diff(renderer, chart, svg)
+        results.append({
+            "svg_ms": elapsed_ms,
+            "geometry_max_diff_px": geometry,
+            "pixel_mismatch": None if cairosvg is None else _pixel_mismatch(cairosvg, renderer, chart, svg),
+        })
+
+    geometry_ok = all(r["geometry_max_diff_px"] <= MAX_GEOMETRY_DIFF_PX for r in results)
+    if cairosvg is None:
+        pixel, pixel_ok = "skipped", True
+        print("SKIP: --geometry-only のため、画素の比較 (見た目の確認) は行っていません", file=sys.stderr)
+    else:
+        pixel_ok = all(r["pixel_mismatch"] <= MAX_PIXEL_MISMATCH for r in results)
+        pixel = "ok" if pixel_ok else "failed"
+    ok = geometry_ok and pixel_ok
+    print(json.dumps({"ok": ok, "pixel": pixel, "geometry_ok": geometry_ok, "charts": results}, indent=2))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""トランジットのアニメーション (固定したネイタルチャートの上でトランジットを動かす)
+
+サインの円・ハウス・ネイタルとプログレスの円は最初に一度だけ描いて背景として保存し、
+各フレームでは背景を戻してトランジットの天体記号・度数と日時の表示だけを描き直す
+(Agg のブリッティング)。トランジットの位置は全フレーム分を calculate_bodies_batch で
+まとめて計算する。--grid の範囲外では、その期間だけのグリッドをフレームの間隔
+(ephemeris_grid.DEFAULT_STEP より細かい場合は DEFAULT_STEP) で作って一度の配列演算で
+補間する。グリッドの点はフレームの時刻と一致するため、粗い間隔でも補間の誤差は増えない。
+
+    python chart_animation.py 1985-06-15 12:30 transit.mp4 --prefecture 東京都 \\
+        --start 2024-01-01 --end 2024-12-31 --step-hours 24 --fps 12
+
+出力は拡張子で決まる。
+    .mp4 / .webm / .gif など: ffmpeg にフレームをパイプで渡して書き出す
+        (ffmpeg がない場合、.gif は Pillow で書き出す。Pillow は GIF を最後にまとめて
+        書き出すため、減色したフレームをすべてメモリに保持する)
+    拡張子なし: ディレクトリとみなし、frame_00000.png から順に PNG を書き出す
+どちらもフレームは 1 枚ずつ描いて書き出すため、動画と PNG では全フレームを保持しない。
+"""
+import argparse
+import os
+import subprocess
+import sys
+from datetime import datetime, timezone, timedelta
+
+import numpy as np
+import swisseph as swe
+from matplotlib import rcParams
+from matplotlib.animation import FFMpegWriter
+
+from chart_engine import (
+    EPHE_PATH, ephemeris_available, calculate_chart_layers, calculate_bodies_batch,
+    datetime_to_jd, set_ephemeris_grid,
+)
+from chart_layout import RING_RADII, rotation_offset_for, layout_planets, planet_label
+from chart_render import TriChartRenderer, draw_planet_texts
+from chart_timing import span
+from ephemeris_grid import DEFAULT_STEP
+from transit_search import jd_to_datetime
+
+DEFAULT_FPS = 12
+DEFAULT_DPI = 100
+DEFAULT_TZ_HOURS = 9
+# PNG の圧縮レベル (既定の 6 ではエンコードが描画より遅くなるため下げる)
+PNG_COMPRESS_LEVEL = 1
+VIDEO_EXTENSIONS = (".mp4", ".m4v", ".mov", ".webm", ".mkv", ".avi", ".gif")
+# ffmpeg の出力形式ごとの追加の引数 (一般的なプレーヤーで再生できる形式にする)
+FFMPEG_OUTPUT_ARGS = {
+    ".mp4": ["-vcodec", "libx264", "-pix_fmt", "yuv420p"],
+    ".m4v": ["-vcodec", "libx264", "-pix_fmt", "yuv420p"],
+    ".mov": ["-vcodec", "libx264", "-pix_fmt", "yuv420p"],
+}
+
+
+class TransitAnimator:
+    """ネイタル・プログレス・ハウスを固定し、トランジットの円だけを描き替える描画クラス
+
+    draw() が返す RGBA の配列は Figure の描画バッファを参照しているため、
+    次の draw() までに書き出すかコピーすること。
+    """
+
+    def __init__(self, natal, prog, cusps, ascmc, dpi=DEFAULT_DPI):
+        self.renderer = TriChartRenderer()
+        self.figure = self.renderer.figure
+        self.figure.set_dpi(dpi)
+        self.ax = self.renderer.ax
+        self.canvas = self.figure.canvas
+        self.rotation_offset = rotation_offset_for(ascmc)
+        self.renderer.render(natal, prog, {}, cusps, ascmc)
+        self._texts = {}
+        self._caption = self.figure.text(0.02, 0.98, "", ha="left", va="top", fontsize=12, animated=True)
+        self._background = None
+
+    def _create_texts(self, trans):
+        """トランジットの天体記号と度数の Artist を作り、背景を保存する (最初のフレームで一度だけ)"""
+        plot_info = layout_planets(trans, RING_RADII["trans"], self.rotation_offset)
+        artists = draw_planet_texts(self.ax, trans, plot_info, angle_shift=-self.rotation_offset)
+        names = [name for name in trans if name in plot_info]
+        for name, symbol, label in zip(names, artists[::2], artists[1::2]):
+            symbol.set_animated(True)
+            label.set_animated(True)
+            self._texts[name] = (symbol, label)
+        # animated な Artist は通常の描画に含まれないため、背景には静的な要素だけが残る
+        self.canvas.draw()
+        self._background = self.canvas.copy_from_bbox(self.figure.bbox)
+
+    def draw(self, trans, caption=""):
+        """トランジットの天体を描き直し、フレームの RGBA 配列 (高さ, 幅, 4) を返す"""
+        if self._background is None:
+            self._create_texts(trans)
+        self.canvas.restore_region(self._background)
+        plot_info = layout_planets(trans, RING_RADII["trans"], self.rotation_offset)
+        visible = []
+        for name, (symbol, label) in self._texts.items():
+            info = plot_info.get(name)
+            if info is None:
+                continue
+            angle = np.deg2rad(info['angle'] - self.rotation_offset)
+            symbol.set_position((angle, info['radius']))
+            label.set_position((angle, info['radius'] - 0.5))
+            label.set_text(planet_label(trans[name]))
+            visible.extend((symbol, label))
+        # 全体を描く場合と同じく zorder の順に描く (重なった記号と度数の前後を一致させる)
+        for artist in sorted(visible, key=lambda artist: artist.get_zorder()):
+            self.ax.draw_artist(artist)
+        self._caption.set_text(caption)
+        self.figure.draw_artist(self._caption)
+        return np.asarray(self.canvas.buffer_rgba())
+
+    def close(self):
+        self.renderer.close()
+
+
+def sweep_jds(start_utc, end_utc, step_hours):
+    """start_utc から end_utc まで step_hours 時間ごとのユリウス日 (UT) の配列"""
+    start_jd, end_jd = datetime_to_jd(start_utc), datetime_to_jd(end_utc)
+    return np.arange(start_jd, end_jd + 1e-9, step_hours / 24)
+
+
+def iter_transit_frames(animator, jds, tz=timezone(timedelta(hours=DEFAULT_TZ_HOURS))):
+    """jds の各時刻のフレーム (ユリウス日, RGBA 配列) を順に返すジェネレーター"""
+    jds = [float(jd) for jd in jds]
+    steps = np.diff(jds)
+    sample_step = None
+    if len(steps) and steps[0] > 0 and np.allclose(steps, steps[0]):
+        # 一定間隔のスイープはフレームの時刻をグリッドの点にする (細かすぎる場合は DEFAULT_STEP)
+        sample_step = max(float(steps[0]), DEFAULT_STEP)
+    with span("animation.positions"):
+        sweep = calculate_bodies_batch(jds, sample_step)
+    for jd, trans in zip(jds, sweep):
+        caption = f"{jd_to_datetime(jd).astimezone(tz):%Y-%m-%d %H:%M}"
+        with span("animation.draw"):
+            frame = animator.draw(trans, caption)
+        yield jd, frame
+
+
+# --- 書き出し ---
+def _write_png_frames(frames, directory):
+    from PIL import Image
+
+    os.makedirs(directory, exist_ok=True)
+    count = 0
+    for count, (_, rgba) in enumerate(frames, start=1):
+        # 背景は不透明なのでアルファチャンネルは書き出さない
+        Image.fromarray(rgba[..., :3]).save(os.path.join(directory, f"frame_{count - 1:05d}.png"),
+                                   compress_level=PNG_COMPRESS_LEVEL)
+    return count
+
+
+def _write_ffmpeg(frames, path, fps):
+    """ffmpeg の標準入力に RGBA のフレームを 1 枚ずつ流し込む"""
+    frames = iter(frames)
+    try:
+        _, first = next(frames)
+    except StopIteration:
+        return 0
+    height, width = first.shape[:2]
+    extension = os.path.splitext(path)[1].lower()
+    command = [rcParams["animation.ffmpeg_path"], "-y", "-loglevel", "error",
+               "-f", "rawvideo", "-pix_fmt", "rgba", "-s", f"{width}x{height}", "-r", str(fps), "-i", "pipe:",
+               *FFMPEG_OUTPUT_ARGS.get(extension, []), path]
+    process = subprocess.Popen(command, stdin=subprocess.PIPE)
+    count = 0
+    try:
+        process.stdin.write(first.tobytes())
+        count = 1
+        for _, rgba in frames:
+            process.stdin.write(rgba.tobytes())
+            count += 1
+    finally:
+        process.stdin.close()
+        if process.wait() != 0:
+            raise RuntimeError(f"ffmpeg の書き出しに失敗しました (終了コード {process.returncode})")
+    return count
+
+
+def _write_gif_pillow(frames, path, fps):
+    from PIL import Image
+
+    images = (Image.fromarray(rgba).convert("RGB").quantize() for _, rgba in frames)
+    first = next(images, None)
+    if first is None:
+        return 0
+    rest = list(images)
+    first.save(path, save_all=True, append_images=rest, duration=round(1000 / fps), loop=0)
+    return len(rest) + 1
+
+
+def write_frames(frames, output, fps=DEFAULT_FPS):
+    """フレームを output の形式で書き出し、フレーム数を返す"""
+    extension = os.path.splitext(output)[1].lower()
+    with span("animation.write"):
+        if extension not in VIDEO_EXTENSIONS:
+            return _write_png_frames(frames, output)
+        if FFMpegWriter.isAvailable():
+            return _write_ffmpeg(frames, output, fps)
+        if extension == ".gif":
+            return _write_gif_pillow(frames, output, fps)
+    raise RuntimeError(f"{extension} の書き出しには ffmpeg が必要です")
+
+
+def save_transit_animation(natal, prog, cusps, ascmc, jds, output, fps=DEFAULT_FPS, dpi=DEFAULT_DPI,
+                           tz=timezone(timedelta(hours=DEFAULT_TZ_HOURS))):
+    """jds の各時刻のトランジットを動かしたアニメーションを output に書き出し、フレーム数を返す"""
+    animator = TransitAnimator(natal, prog, cusps, ascmc, dpi=dpi)
+    try:
+        return write_frames(iter_transit_frames(animator, jds, tz), output, fps)
+    finally:
+        animator.close()
+
+
+def _parse_local(value, tz):
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=tz)
+    return dt.astimezone(timezone.utc)
+
+
+def main(argv=None):
+    from chart_batch import parse_chart_row
+    from ephemeris_grid import EphemerisGrid
+
+    parser = argparse.ArgumentParser(description="トランジットのアニメーションを書き出す")
+    parser.add_argument("birth_date", help="生年月日 (YYYY-MM-DD)")
+    parser.add_argument("birth_time", help="出生時刻 (HH:MM)")
+    parser.add_argument("output", help="出力先 (.mp4 / .gif など、拡張子なしは PNG のディレクトリ)")
+    parser.add_argument("--prefecture", default="東京都", help="出生地の都道府県 (--lat/--lon を省略する場合)")
+    parser.add_argument("--lat", type=float)
+    parser.add_argument("--lon", type=float)
+    parser.add_argument("--tz", type=float, default=DEFAULT_TZ_HOURS, help="UTC からの時差 (時間)")
+    parser.add_argument("--start", required=True, help="開始日時 (ISO 8601)")
+    parser.add_argument("--end", required=True, help="終了日時 (ISO 8601)")
+    parser.add_argument("--step-hours", type=float, default=24, help="フレームの間隔 (時間)")
+    parser.add_argument("--fps", type=float, default=DEFAULT_FPS)
+    parser.add_argument("--dpi", type=float, default=DEFAULT_DPI)
+    parser.add_argument("--grid", default=None, help="天体位置の事前計算グリッド (ephemeris_grid.py で作成)")
+    args = parser.parse_args(argv)
+    # 0° も有効な座標なので、省略されたかどうかは None で判定する
+    if (args.lat is None) != (args.lon is None):
+        raise SystemExit("--lat と --lon は両方指定してください")
+
+    if not ephemeris_available():
+        raise SystemExit(f"天体暦ファイルが見つかりません: {EPHE_PATH}")
+    swe.set_ephe_path(EPHE_PATH)
+    if args.grid:
+        set_ephemeris_grid(EphemerisGrid(args.grid))
+
+    tz = timezone(timedelta(hours=args.tz))
+    row = {"birth_date": args.birth_date, "birth_time": args.birth_time, "tz": str(args.tz),
+           "prefecture": args.prefecture, "lat": args.lat, "lon": args.lon}
+    dt_utc, lat, lon, _ = parse_chart_row(row)
+    start_utc, end_utc = _parse_local(args.start, tz), _parse_local(args.end, tz)
+    # プログレスは開始日時で固定する
+    natal, prog, _, cusps, ascmc = calculate_chart_layers(dt_utc, lat, lon, start_utc, now_utc=start_utc)
+    if not cusps:
+        raise SystemExit("ハウスが計算できませんでした")
+
+    jds = sweep_jds(start_utc, end_utc, args.step_hours)
+    count = save_transit_animation(natal, prog, cusps, ascmc, jds, args.output, args.fps, args.dpi, tz)
+    print(f"{count} フレームを書き出しました: {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
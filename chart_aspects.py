@@ -0,0 +1,133 @@
+"""NumPy によるアスペクト計算
+
+天体の黄経を配列として扱い、全組み合わせの角距離行列を一度に計算してから
+ASPECTS のオーブ (太陽・月を含む組は +2°) をマスクとして適用する。
+黄経配列の先頭に軸を追加すれば、複数チャートをまとめて計算できる。
+
+    lon_a: (..., A)  lon_b: (..., B)  ->  hit/orb: (..., A, B, K)   K = len(ASPECTS)
+"""
+from functools import lru_cache
+
+import numpy as np
+
+from chart_engine import ASPECTS, LUMINARIES
+from chart_frame import ChartFrame
+
+ASPECT_NAMES = list(ASPECTS)
+ASPECT_ANGLES = np.array([params["angle"] for params in ASPECTS.values()], dtype=float)
+ASPECT_ORBS = np.array([params["orb"] for params in ASPECTS.values()], dtype=float)
+LUMINARY_ORB_BONUS = 2
+
+# 同一チャート内のドラゴンヘッドとテイルのオポジション (常に正確に 180°) は表示しない
+# (別のチャートとの間では実際の接触なので除外しない)
+EXCLUDED_PAIRS = {frozenset(("ドラゴンヘッド", "ドラゴンテイル"))}
+
+
+def body_arrays(celestial_bodies):
+    """天体情報の dict (または ChartFrame) から (名前リスト, 黄経配列, 太陽・月のマスク) を作る"""
+    if isinstance(celestial_bodies, ChartFrame):
+        return list(celestial_bodies.names), celestial_bodies.lon, celestial_bodies.luminary
+    names = list(celestial_bodies)
+    lon = np.array([celestial_bodies[name]['pos'] for name in names], dtype=float)
+    luminary = np.array([celestial_bodies[name].get('id') in LUMINARIES for name in names], dtype=bool)
+    return names, lon, luminary
+
+
+def angular_distance(lon_a, lon_b):
+    """全組み合わせの角距離 (0〜180°) を返す。形状は (..., A, B)"""
+    diff = np.abs(np.asarray(lon_a, dtype=float)[..., :, None] - np.asarray(lon_b, dtype=float)[..., None, :])
+    return np.where(diff > 180, 360 - diff, diff)
+
+
+def aspect_matrix(lon_a, lon_b, luminary_a=None, luminary_b=None):
+    """アスペクトの成立マスクとオーブを返す
+
+    戻り値はどちらも (..., A, B, K) の配列で、K は ASPECTS の並び順に対応する。
+    orb はアスペクト角からのずれで、hit が False の要素にも値が入っている。
+    """
+    distance = angular_distance(lon_a, lon_b)
+    orb = np.abs(distance[..., None] - ASPECT_ANGLES)
+
+    allowed = ASPECT_ORBS
+    if luminary_a is not None or luminary_b is not None:
+        lum_a = np.zeros(np.shape(lon_a), dtype=bool) if luminary_a is None else np.asarray(luminary_a, dtype=bool)
+        lum_b = np.zeros(np.shape(lon_b), dtype=bool) if luminary_b is None else np.asarray(luminary_b, dtype=bool)
+        has_luminary = lum_a[..., :, None] | lum_b[..., None, :]
+        allowed = ASPECT_ORBS + LUMINARY_ORB_BONUS * has_luminary[..., None]
+    return orb < allowed, orb
+
+
+@lru_cache(maxsize=64)
+def pair_mask(names_a, names_b, same_chart):
+    """計算対象とする天体の組み合わせマスク (A, B)。names は tuple で渡す
+
+    結果はキャッシュして共有するため、書き込みできない配列で返す。
+    """
+    mask = np.ones((len(names_a), len(names_b)), dtype=bool)
+    if same_chart:
+        # 同一チャート内では重複と自分自身を除いた上三角のみ
+        mask = np.triu(mask, k=1)
+        for i, name_a in enumerate(names_a):
+            for j, name_b in enumerate(names_b):
+                if frozenset((name_a, name_b)) in EXCLUDED_PAIRS:
+                    mask[i, j] = False
+    mask.flags.writeable = False
+    return mask
+
+
+def _aspect_list(names_a, lon_a, names_b, lon_b, hit, orb):
+    """成立マスクからアスペクトのリストを作る"""
+    aspect_list = []
+    for i, j, k in zip(*np.nonzero(hit)):
+        aspect_name = ASPECT_NAMES[k]
+        aspect_list.append({
+            "p1_name": names_a[i], "p2_name": names_b[j],
+            "p1_pos": float(lon_a[i]), "p2_pos": float(lon_b[j]),
+            "aspect_name": aspect_name, "orb": float(orb[i, j, k]),
+            "params": ASPECTS[aspect_name]
+        })
+    return aspect_list
+
+
+def calculate_natal_aspects(celestial_bodies):
+    """ネイタルチャート内のアスペクトを計算する"""
+    names, lon, luminary = body_arrays(celestial_bodies)
+    hit, orb = aspect_matrix(lon, lon, luminary, luminary)
+    hit &= pair_mask(tuple(names), tuple(names), same_chart=True)[..., None]
+    return _aspect_list(names, lon, names, lon, hit, orb)
+
+
+def calculate_cross_aspects(bodies_a, bodies_b):
+    """2 つのチャート間 (ネイタル×トランジット等) のアスペクトを計算する
+
+    p1 が bodies_a、p2 が bodies_b 側の天体となる。
+    """
+    names_a, lon_a, lum_a = body_arrays(bodies_a)
+    names_b, lon_b, lum_b = body_arrays(bodies_b)
+    hit, orb = aspect_matrix(lon_a, lon_b, lum_a, lum_b)
+    hit &= pair_mask(tuple(names_a), tuple(names_b), same_chart=False)[..., None]
+    return _aspect_list(names_a, lon_a, names_b, lon_b, hit, orb)
+
+
+def batch_natal_aspects(lon, luminary, names=None):
+    """複数チャート分のネイタルアスペクトをまとめて計算する
+
+    lon は (N, B) の黄経配列、luminary は (B,) の太陽・月マスク。
+    戻り値は成立マスクとオーブ (どちらも (N, B, B, K)) で、同一天体・重複の組と
+    names を渡した場合は表示しない組み合わせを除外済み。
+    """
+    hit, orb = aspect_matrix(lon, lon, luminary, luminary)
+    names = names if names is not None else [str(i) for i in range(np.shape(lon)[-1])]
+    hit &= pair_mask(tuple(names), tuple(names), same_chart=True)[..., None]
+    return hit, orb
+
+
+def batch_cross_aspects(lon_a, lon_b, luminary_a=None, luminary_b=None):
+    """複数チャート分のチャート間アスペクトをまとめて計算する
+
+    lon_a は (N, A)、lon_b は (N, B) または全チャート共通の (B,)。
+    戻り値は成立マスクとオーブ (どちらも (N, A, B, K))。
+    """
+    lon_a = np.asarray(lon_a, dtype=float)
+    lon_b = np.broadcast_to(np.asarray(lon_b, dtype=float), lon_a.shape[:-1] + np.shape(lon_b)[-1:])
+    return aspect_matrix(lon_a, lon_b, luminary_a, luminary_b)
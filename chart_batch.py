@@ -0,0 +1,354 @@
+"""出生データ CSV からネイタル・プログレス・トランジットを一括計算するバッチ処理
+
+    python chart_batch.py births.csv charts.jsonl --workers 8
+    python chart_batch.py births.csv charts.jsonl --resume   # 中断したところから再開
+
+入力 CSV の列:
+    id          任意。出力にそのまま書き出す識別子
+    birth_date  生年月日 (YYYY-MM-DD)
+    birth_time  出生時刻 (HH:MM または HH:MM:SS)
+    lat, lon    出生地の緯度・経度 (省略時は prefecture から補完)
+    prefecture  都道府県名 (lat/lon を省略する場合)
+    tz          UTC からの時差 (時間単位、省略時は 9 = 日本時間)
+    transit     トランジット日時 (ISO 8601、省略時は --transit-at)
+
+入力は逐次読み込み、一定件数ずつプロセスプールへ投入する。同時に処理中の
+チャンク数に上限を設けているため、入力件数によらずメモリ使用量は一定となる。
+結果は入力順に書き出し、チャンクごとに進捗ファイル (<output>.progress) を
+更新するので、--resume で途中から再開できる。
+
+出力形式は拡張子から判定する (.csv / .jsonl / .parquet)。Parquet の場合は
+出力パスをディレクトリとし、チャンクごとに part-NNNNNN.parquet を書き出す
+(pyarrow が必要)。
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone, timedelta
+
+import swisseph as swe
+
+from chart_aspects import calculate_natal_aspects
+from chart_engine import (
+    BODY_NAMES, EPHE_PATH, PREFECTURE_DATA, ephemeris_available,
+    calculate_chart_layers, set_ephemeris_grid,
+)
+from ephemeris_grid import EphemerisGrid
+
+DEFAULT_TZ_HOURS = 9
+DEFAULT_CHUNK_SIZE = 256
+LAYERS = ("natal", "prog", "transit")
+
+
+def _output_columns():
+    """出力レコードの列名を返す"""
+    columns = ["row", "id", "error"]
+    for layer in LAYERS:
+        for name in BODY_NAMES:
+            columns += [f"{layer}_{name}_pos", f"{layer}_{name}_retro"]
+    columns += [f"cusp_{i + 1}" for i in range(12)]
+    columns += ["asc", "mc", "aspects"]
+    return columns
+
+
+OUTPUT_COLUMNS = _output_columns()
+
+
+# --- ワーカー処理 ---
+def _init_worker(ephe_path, grid_path=None):
+    """ワーカープロセスの初期化 (天体暦パスの設定はプロセスごとに一度だけ)"""
+    swe.set_ephe_path(ephe_path)
+    if grid_path:
+        set_ephemeris_grid(EphemerisGrid(grid_path))
+
+
+def _has_value(value):
+    """入力の値があるか (数値の 0 は値ありとし、None と空文字を未入力とみなす)"""
+    return value is not None and str(value).strip() != ""
+
+
+def parse_chart_row(row):
+    """入力行から (出生日時 UTC, 緯度, 経度, トランジット日時 UTC or None) を取り出す"""
+    tz = timezone(timedelta(hours=float(row.get("tz") or DEFAULT_TZ_HOURS)))
+    birth_time = row["birth_time"].strip()
+    time_format = "%H:%M:%S" if birth_time.count(":") == 2 else "%H:%M"
+    dt_local = datetime.strptime(f"{row['birth_date'].strip()} {birth_time}", f"%Y-%m-%d {time_format}")
+    dt_utc = dt_local.replace(tzinfo=tz).astimezone(timezone.utc)
+
+    if _has_value(row.get("lat")) and _has_value(row.get("lon")):
+        lat, lon = float(row["lat"]), float(row["lon"])
+    else:
+        pref = PREFECTURE_DATA[row["prefecture"].strip()]
+        lat, lon = pref["lat"], pref["lon"]
+
+    transit_dt_utc = None
+    if row.get("transit"):
+        transit_dt = datetime.fromisoformat(row["transit"].strip())
+        if transit_dt.tzinfo is None:
+            transit_dt = transit_dt.replace(tzinfo=tz)
+        transit_dt_utc = transit_dt.astimezone(timezone.utc)
+    return dt_utc, lat, lon, transit_dt_utc
+
+
+def _chart_record(index, row, reference_utc, default_transit_utc):
+    """1 件の入力行を計算し、出力レコード (dict) を返す"""
+    record = {"row": index, "id": row.get("id", ""), "error": ""}
+    try:
+        dt_utc, lat, lon, transit_dt_utc = parse_chart_row(row)
+    except (KeyError, ValueError, TypeError, AttributeError) as e:
+        record["error"] = f"入力が不正です: {e!r}"
+        return record
+
+    try:
+        natal, prog, trans, cusps, ascmc = calculate_chart_layers(
+            dt_utc, lat, lon, transit_dt_utc or default_transit_utc, now_utc=reference_utc)
+    except swe.Error as e:
+        # 天体暦の範囲外の日時など。1 件の失敗でバッチ全体を止めない
+        record["error"] = f"計算できませんでした: {e}"
+        return record
+    if not cusps:
+        record["error"] = "ハウスが計算できませんでした"
+        return record
+
+    for layer, bodies in zip(LAYERS, (natal, prog, trans)):
+        for name in BODY_NAMES:
+            record[f"{layer}_{name}_pos"] = bodies[name]['pos']
+            record[f"{layer}_{name}_retro"] = bodies[name]['is_retro']
+    for i, cusp in enumerate(cusps[:12]):
+        record[f"cusp_{i + 1}"] = cusp
+    record["asc"], record["mc"] = ascmc[0], ascmc[1]
+    record["aspects"] = [
+        {"p1": a["p1_name"], "p2": a["p2_name"], "aspect": a["aspect_name"], "orb": a["orb"]}
+        for a in calculate_natal_aspects(natal)
+    ]
+    return record
+
+
+def _process_chunk(start_index, rows, reference_utc, default_transit_utc):
+    """チャンク単位でレコードを計算する (ワーカープロセスで実行)"""
+    return [_chart_record(start_index + i, row, reference_utc, default_transit_utc) for i, row in enumerate(rows)]
+
+
+# --- 出力 ---
+class _CsvSink:
+    """CSV 形式で追記する出力先"""
+    def __init__(self, path, resume_offset):
+        self.file = _open_for_append(path, resume_offset)
+        self.writer = csv.DictWriter(self.file, fieldnames=OUTPUT_COLUMNS)
+        if self.file.tell() == 0:
+            self.writer.writeheader()
+
+    def write(self, records):
+        for record in records:
+            if "aspects" in record:
+                record = dict(record, aspects=json.dumps(record["aspects"], ensure_ascii=False))
+            self.writer.writerow(record)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def position(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+class _JsonlSink:
+    """JSON Lines 形式で追記する出力先"""
+    def __init__(self, path, resume_offset):
+        self.file = _open_for_append(path, resume_offset)
+
+    def write(self, records):
+        for record in records:
+            self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def position(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+def _parquet_schema(pa):
+    """出力列の Parquet のスキーマ (aspects は JSON の文字列、エラーの行の値は null)"""
+    def column_type(column):
+        if column == "row":
+            return pa.int64()
+        if column in ("id", "error", "aspects"):
+            return pa.string()
+        return pa.bool_() if column.endswith("_retro") else pa.float64()
+    return pa.schema([(c, column_type(c)) for c in OUTPUT_COLUMNS])
+
+
+class _ParquetSink:
+    """チャンクごとに part ファイルを書き出す Parquet 出力先"""
+    def __init__(self, path, resume_offset):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise SystemExit("Parquet 出力には pyarrow が必要です: pip install pyarrow") from e
+        self.pa, self.pq = pa, pq
+        # 型はチャンクごとに推論させない (エラーの行だけの part でも列の型を揃える)
+        self.schema = _parquet_schema(pa)
+        self.dir = path
+        self.part = resume_offset
+        os.makedirs(path, exist_ok=True)
+        # 前回の実行で進捗に記録される前に書かれた part は破棄する
+        for name in os.listdir(path):
+            if name.startswith("part-") and int(name[5:11]) >= self.part:
+                os.remove(os.path.join(path, name))
+
+    def write(self, records):
+        rows = []
+        for record in records:
+            if record.get("aspects") is not None:
+                record = {**record, "aspects": json.dumps(record["aspects"], ensure_ascii=False)}
+            rows.append(record)
+        part_path = os.path.join(self.dir, f"part-{self.part:06d}.parquet")
+        table = self.pa.Table.from_pylist(rows, schema=self.schema)
+        self.pq.write_table(table, part_path + ".tmp")
+        os.replace(part_path + ".tmp", part_path)
+        self.part += 1
+
+    def position(self):
+        return self.part
+
+    def close(self):
+        pass
+
+
+SINKS = {".csv": _CsvSink, ".jsonl": _JsonlSink, ".parquet": _ParquetSink}
+
+
+def _open_for_append(path, resume_offset):
+    """resume_offset バイト目以降を切り捨てて追記用に開く"""
+    f = open(path, "a+", encoding="utf-8", newline="")
+    f.truncate(resume_offset)
+    f.seek(resume_offset)
+    return f
+
+
+# --- 進捗管理 ---
+def _progress_path(output):
+    return output.rstrip("/" + os.sep) + ".progress"
+
+
+def _load_progress(output):
+    try:
+        with open(_progress_path(output), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _save_progress(output, progress):
+    path = _progress_path(output)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(progress, f)
+    os.replace(path + ".tmp", path)
+
+
+def _read_chunks(input_path, skip_rows, chunk_size):
+    """入力 CSV を読み、(先頭行番号, 行リスト) を逐次返す"""
+    with open(input_path, encoding="utf-8-sig", newline="") as f:
+        reader = csv.DictReader(f)
+        index = 0
+        chunk = []
+        for row in reader:
+            if index >= skip_rows:
+                chunk.append(row)
+                if len(chunk) == chunk_size:
+                    yield index - len(chunk) + 1, chunk
+                    chunk = []
+            index += 1
+        if chunk:
+            yield index - len(chunk), chunk
+
+
+def run_batch(input_path, output_path, workers=None, chunk_size=DEFAULT_CHUNK_SIZE,
+              transit_at=None, progressed_at=None, resume=False, grid_path=None, log=sys.stderr):
+    """バッチ計算を実行し、書き出した件数を返す"""
+    ext = os.path.splitext(output_path.rstrip("/" + os.sep))[1].lower()
+    if ext not in SINKS:
+        raise SystemExit(f"未対応の出力形式です: {ext} (.csv / .jsonl / .parquet)")
+    if not ephemeris_available():
+        raise SystemExit(f"天体暦ファイルが見つかりません: {EPHE_PATH}")
+
+    progress = _load_progress(output_path) if resume else None
+    if progress is None:
+        # 再開時にも同じ基準時刻で計算できるよう、基準時刻は進捗ファイルに残す
+        now = datetime.now(timezone.utc)
+        progress = {
+            "rows_done": 0, "offset": 0,
+            "progressed_at": (progressed_at or now).isoformat(),
+            "transit_at": (transit_at or now).isoformat(),
+        }
+        if ext != ".parquet" and os.path.exists(output_path):
+            os.remove(output_path)
+        _save_progress(output_path, progress)
+    reference_utc = datetime.fromisoformat(progress["progressed_at"])
+    default_transit_utc = datetime.fromisoformat(progress["transit_at"])
+
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = workers * 2
+    sink = SINKS[ext](output_path, progress["offset"])
+    pending = deque()
+
+    def drain_one():
+        records = pending.popleft().result()
+        sink.write(records)
+        progress["rows_done"] += len(records)
+        progress["offset"] = sink.position()
+        _save_progress(output_path, progress)
+        if log:
+            print(f"{progress['rows_done']} 件完了", file=log)
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(EPHE_PATH, grid_path)) as pool:
+            for start, rows in _read_chunks(input_path, progress["rows_done"], chunk_size):
+                # 処理中のチャンクが上限に達したら、先頭から順に書き出して空きを作る
+                while len(pending) >= max_in_flight:
+                    drain_one()
+                pending.append(pool.submit(_process_chunk, start, rows, reference_utc, default_transit_utc))
+            while pending:
+                drain_one()
+    finally:
+        sink.close()
+    return progress["rows_done"]
+
+
+def _parse_utc(value):
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone(timedelta(hours=DEFAULT_TZ_HOURS)))
+    return dt.astimezone(timezone.utc)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="出生データ CSV からチャートを一括計算する")
+    parser.add_argument("input", help="入力 CSV")
+    parser.add_argument("output", help="出力先 (.csv / .jsonl / .parquet)")
+    parser.add_argument("--workers", type=int, default=None, help="ワーカープロセス数 (既定: CPU 数)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="1 タスクあたりの行数")
+    parser.add_argument("--transit-at", type=_parse_utc, default=None,
+                        help="transit 列がない行のトランジット日時 (ISO 8601、既定: 現在時刻)")
+    parser.add_argument("--progressed-at", type=_parse_utc, default=None,
+                        help="プログレスの基準日時 (ISO 8601、既定: 現在時刻)")
+    parser.add_argument("--resume", action="store_true", help="進捗ファイルから処理を再開する")
+    parser.add_argument("--grid", default=None, help="天体位置の事前計算グリッド (ephemeris_grid.py で作成)")
+    args = parser.parse_args(argv)
+
+    total = run_batch(args.input, args.output, workers=args.workers, chunk_size=args.chunk_size,
+                      transit_at=args.transit_at, progressed_at=args.progressed_at, resume=args.resume, grid_path=args.grid)
+    print(f"完了: {total} 件", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
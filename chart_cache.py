@@ -0,0 +1,131 @@
+"""チャート計算結果のキャッシュ
+
+プロセス内の LRU キャッシュ (件数上限つき) と、複数のワーカーで共有できる
+SQLite のディスクキャッシュ (任意) の 2 段構成。値は pickle したバイト列で
+保持するため、取り出すたびに新しいオブジェクトが返り、呼び出し側が結果を
+書き換えてもキャッシュには影響しない。
+
+    cache = ChartCache(maxsize=2048, disk_path="/var/cache/horoscope/charts.sqlite3")
+    chart_engine.set_chart_cache(cache)
+
+トランジットとプログレスの基準時刻は time_resolution (秒) 単位に切り捨ててから
+計算するため、「現在時刻」での要求が続いてもキャッシュに当たるようになる。
+"""
+import os
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+DEFAULT_MAXSIZE = 1024
+DEFAULT_TIME_RESOLUTION = 60  # 秒
+
+
+def quantize_datetime(dt, resolution_seconds):
+    """datetime を resolution_seconds 単位に切り捨てる"""
+    if resolution_seconds <= 0:
+        return dt
+    ts = dt.timestamp()
+    return datetime.fromtimestamp(ts - ts % resolution_seconds, tz=dt.tzinfo or timezone.utc)
+
+
+class ChartCache:
+    """LRU のメモリキャッシュと任意のディスクキャッシュからなる 2 段キャッシュ"""
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, disk_path=None, time_resolution=DEFAULT_TIME_RESOLUTION):
+        self.maxsize = maxsize
+        self.disk_path = disk_path
+        self.time_resolution = time_resolution
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        if disk_path:
+            os.makedirs(os.path.dirname(os.path.abspath(disk_path)), exist_ok=True)
+            with self._connect() as conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS chart_cache (key TEXT PRIMARY KEY, value BLOB NOT NULL)")
+
+    # --- ディスク ---
+    def _connect(self):
+        """スレッド・プロセスごとの SQLite 接続を返す"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.disk_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _disk_get(self, key):
+        try:
+            row = self._connect().execute("SELECT value FROM chart_cache WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error:
+            return None
+        return row[0] if row else None
+
+    def _disk_put(self, key, value):
+        try:
+            with self._connect() as conn:
+                conn.execute("INSERT OR REPLACE INTO chart_cache (key, value) VALUES (?, ?)", (key, value))
+        except sqlite3.Error:
+            pass
+
+    # --- メモリ ---
+    def _memory_put(self, key, value):
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.maxsize:
+                self._memory.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    # --- 公開 API ---
+    def quantize(self, dt):
+        """基準時刻を time_resolution 単位に切り捨てる"""
+        return quantize_datetime(dt, self.time_resolution)
+
+    def get_or_compute(self, key, compute):
+        """key に対応する値を返す。どの段にもなければ compute() の結果を保存して返す"""
+        key = repr(key)
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self._counters["memory_hits"] += 1
+                return pickle.loads(value)
+
+        if self.disk_path:
+            value = self._disk_get(key)
+            if value is not None:
+                with self._lock:
+                    self._counters["disk_hits"] += 1
+                self._memory_put(key, value)
+                return pickle.loads(value)
+
+        result = compute()
+        value = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._counters["misses"] += 1
+        self._memory_put(key, value)
+        if self.disk_path:
+            self._disk_put(key, value)
+        return result
+
+    def stats(self):
+        """ヒット・ミス数などの統計を返す"""
+        with self._lock:
+            stats = dict(self._counters, size=len(self._memory), maxsize=self.maxsize)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def clear(self, disk=False):
+        """メモリキャッシュ (disk=True ならディスクキャッシュも) を空にし、統計をリセットする"""
+        with self._lock:
+            self._memory.clear()
+            for name in self._counters:
+                self._counters[name] = 0
+        if disk and self.disk_path:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM chart_cache")
@@ -0,0 +1,323 @@
+"""ホロスコープ計算エンジン
+
+Streamlit や Matplotlib に依存しない計算処理をまとめたモジュール。
+UI を持たないワーカーやバッチ処理からも軽量にインポートできる。
+"""
+import logging
+import os
+from datetime import datetime, timezone, timedelta
+
+import swisseph as swe
+
+from chart_timing import span
+
+logger = logging.getLogger(__name__)
+
+# --- 定数定義 ---
+
+# 天体暦ファイルの配置場所 (このモジュールと同じ階層の ephe フォルダ)
+EPHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ephe')
+
+# 事前計算した天体位置グリッド (set_ephemeris_grid で設定する)
+_ephemeris_grid = None
+
+# 計算結果のキャッシュ (set_chart_cache で設定する)
+_chart_cache = None
+
+# 天体・ハウスの計算を任せるワーカープロセスのプール (set_ephemeris_pool で設定する)
+_ephemeris_pool = None
+
+# ハウスシステム (プラシーダス)
+HOUSE_SYSTEM = b'P'
+
+# サイン (星座)
+SIGN_NAMES = ["牡羊座", "牡牛座", "双子座", "蟹座", "獅子座", "乙女座", "天秤座", "蠍座", "射手座", "山羊座", "水瓶座", "魚座"]
+SIGN_SYMBOLS = ["♈", "♉", "♊", "♋", "♌", "♍", "♎", "♏", "♐", "♑", "♒", "♓"]
+DEGREES_PER_SIGN = 30
+ZODIAC_DEGREES = 360
+
+# 天体
+PLANET_NAMES = {
+    "太陽": swe.SUN, "月": swe.MOON, "水星": swe.MERCURY, "金星": swe.VENUS, "火星": swe.MARS,
+    "木星": swe.JUPITER, "土星": swe.SATURN, "天王星": swe.URANUS, "海王星": swe.NEPTUNE,
+    "冥王星": swe.PLUTO, "キロン": swe.CHIRON, "リリス": swe.MEAN_APOG,
+    "ドラゴンヘッド": swe.MEAN_NODE
+}
+PLANET_SYMBOLS = {
+    "太陽": "☉", "月": "☽", "水星": "☿", "金星": "♀", "火星": "♂", "木星": "♃", "土星": "♄",
+    "天王星": "♅", "海王星": "♆", "冥王星": "♇", "キロン": "⚷", "リリス": "⚸",
+    "ドラゴンヘッド": "☊", "ドラゴンテイル": "☋", "ASC": "ASC", "MC": "MC"
+}
+PLANET_COLORS = {
+    "太陽": "gold", "月": "silver", "水星": "lightgrey", "金星": "hotpink", "火星": "red",
+    "木星": "orange", "土星": "saddlebrown", "天王星": "cyan", "海王星": "blue",
+    "冥王星": "darkviolet", "キロン": "green", "リリス": "black",
+    "ドラゴンヘッド": "gray", "ドラゴンテイル": "gray",
+    "ASC": "black", "MC": "black"
+}
+LUMINARIES = [swe.SUN, swe.MOON]
+SENSITIVE_POINTS = ["ASC", "MC"]
+# 計算結果に含まれる天体の並び (PLANET_NAMES と、ドラゴンヘッドから求めるドラゴンテイル)
+BODY_NAMES = list(PLANET_NAMES) + ["ドラゴンテイル"]
+
+# アスペクト
+ASPECTS = {
+    "コンジャンクション (0°)": {"angle": 0, "orb": 8, "symbol": "☌", "color": "blue"},
+    "オポジション (180°)": {"angle": 180, "orb": 8, "symbol": "☍", "color": "red"},
+    "トライン (120°)": {"angle": 120, "orb": 8, "symbol": "△", "color": "green"},
+    "スクエア (90°)": {"angle": 90, "orb": 7, "symbol": "□", "color": "red"},
+    "セクスタイル (60°)": {"angle": 60, "orb": 4, "symbol": "✶", "color": "green"},
+}
+
+# 都道府県データ
+PREFECTURE_DATA = {
+    "北海道": {"lat": 43.064, "lon": 141.348}, "青森県": {"lat": 40.825, "lon": 140.741},
+    "岩手県": {"lat": 39.704, "lon": 141.153}, "宮城県": {"lat": 38.269, "lon": 140.872},
+    "秋田県": {"lat": 39.719, "lon": 140.102}, "山形県": {"lat": 38.240, "lon": 140.364},
+    "福島県": {"lat": 37.750, "lon": 140.468}, "茨城県": {"lat": 36.342, "lon": 140.447},
+    "栃木県": {"lat": 36.566, "lon": 139.884}, "群馬県": {"lat": 36.391, "lon": 139.060},
+    "埼玉県": {"lat": 35.857, "lon": 139.649}, "千葉県": {"lat": 35.605, "lon": 140.123},
+    "東京都": {"lat": 35.690, "lon": 139.692}, "神奈川県": {"lat": 35.448, "lon": 139.643},
+    "新潟県": {"lat": 37.902, "lon": 139.023}, "富山県": {"lat": 36.695, "lon": 137.211},
+    "石川県": {"lat": 36.594, "lon": 136.626}, "福井県": {"lat": 36.065, "lon": 136.222},
+    "山梨県": {"lat": 35.664, "lon": 138.568}, "長野県": {"lat": 36.651, "lon": 138.181},
+    "岐阜県": {"lat": 35.391, "lon": 136.722}, "静岡県": {"lat": 34.977, "lon": 138.383},
+    "愛知県": {"lat": 35.180, "lon": 136.907}, "三重県": {"lat": 34.730, "lon": 136.509},
+    "滋賀県": {"lat": 35.005, "lon": 135.869}, "京都府": {"lat": 35.021, "lon": 135.756},
+    "大阪府": {"lat": 34.686, "lon": 135.520}, "兵庫県": {"lat": 34.691, "lon": 135.183},
+    "奈良県": {"lat": 34.685, "lon": 135.833}, "和歌山県": {"lat": 34.226, "lon": 135.168},
+    "鳥取県": {"lat": 35.504, "lon": 134.238}, "島根県": {"lat": 35.472, "lon": 133.051},
+    "岡山県": {"lat": 34.662, "lon": 133.934}, "広島県": {"lat": 34.396, "lon": 132.459},
+    "山口県": {"lat": 34.186, "lon": 131.471}, "徳島県": {"lat": 34.066, "lon": 134.559},
+    "香川県": {"lat": 34.340, "lon": 134.043}, "愛媛県": {"lat": 33.842, "lon": 132.765},
+    "高知県": {"lat": 33.560, "lon": 133.531}, "福岡県": {"lat": 33.607, "lon": 130.418},
+    "佐賀県": {"lat": 33.249, "lon": 130.299}, "長崎県": {"lat": 32.745, "lon": 129.874},
+    "熊本県": {"lat": 32.790, "lon": 130.742}, "大分県": {"lat": 33.238, "lon": 131.613},
+    "宮崎県": {"lat": 31.911, "lon": 131.424}, "鹿児島県": {"lat": 31.560, "lon": 130.558},
+    "沖縄県": {"lat": 26.212, "lon": 127.681}
+}
+
+# --- ヘルパー関数 ---
+def get_degree_parts(d):
+    """度数を星座と度数表記に変換する"""
+    d %= 360
+    sign_index = int(d / DEGREES_PER_SIGN)
+    pos_in_sign = d % DEGREES_PER_SIGN
+    return SIGN_NAMES[sign_index], f"{int(pos_in_sign):02d}°{int((pos_in_sign - int(pos_in_sign)) * 60):02d}'"
+
+def get_house_number(degree, cusps):
+    """天体の度数からハウス番号を特定する"""
+    cusps_with_13th = list(cusps) + [(cusps[0] + 360) % 360]
+    for i in range(12):
+        start, end = cusps[i], cusps_with_13th[i+1]
+        if start > end: # 0度をまたぐハウス
+            if degree >= start or degree < end: return i + 1
+        else:
+            if start <= degree < end: return i + 1
+    return 12
+
+# --- 計算関数 ---
+def ephemeris_available(ephe_path=EPHE_PATH):
+    """天体暦ファイルのフォルダが存在するかを返す"""
+    return os.path.exists(ephe_path)
+
+def set_ephemeris_grid(grid):
+    """天体位置の計算に使う事前計算グリッド (ephemeris_grid.EphemerisGrid) を設定する
+
+    グリッドの範囲外の日時は従来どおり swe.calc_ut で計算する。None を渡すと解除する。
+    """
+    global _ephemeris_grid
+    _ephemeris_grid = grid
+
+def get_ephemeris_grid():
+    """set_ephemeris_grid で設定したグリッドを返す (未設定なら None)"""
+    return _ephemeris_grid
+
+def set_chart_cache(cache):
+    """天体・ハウスの計算結果のキャッシュ (chart_cache.ChartCache) を設定する
+
+    設定中はトランジットとプログレスの基準時刻をキャッシュの時間分解能に切り捨てて計算する。
+    None を渡すと解除する。
+    """
+    global _chart_cache
+    _chart_cache = cache
+
+def set_ephemeris_pool(pool):
+    """天体・ハウスの計算を任せるワーカープロセスのプール (ephemeris_pool.EphemerisPool) を設定する
+
+    設定中は Swiss Ephemeris をこのプロセスでは使わず、ハウスとグリッドの範囲外の計算を
+    プールのワーカーで行う (キャッシュとグリッドはこのプロセス側で引く)。None を渡すと解除する。
+    """
+    global _ephemeris_pool
+    _ephemeris_pool = pool
+
+def get_ephemeris_pool():
+    """set_ephemeris_pool で設定したプールを返す (未設定なら None)"""
+    return _ephemeris_pool
+
+def datetime_to_jd(dt_utc):
+    """UTC の datetime をユリウス日 (UT) に変換する"""
+    jd_ut, _ = swe.utc_to_jd(dt_utc.year, dt_utc.month, dt_utc.day, dt_utc.hour, dt_utc.minute, dt_utc.second, 1)
+    return jd_ut
+
+def _calculate_celestial_bodies(jd_ut, lat, lon, calc_houses=False):
+    """指定されたユリウス日の天体情報を計算する内部関数"""
+    cache = _chart_cache
+    if cache is None:
+        return _compute_celestial_bodies(jd_ut, lat, lon, calc_houses)
+    # 天体位置は観測地に依存しないため、ハウスを計算しない場合はユリウス日のみをキーにする
+    key = ("houses", jd_ut, lat, lon, HOUSE_SYSTEM) if calc_houses else ("bodies", jd_ut)
+    with span("cache.get_or_compute"):
+        return cache.get_or_compute(key, lambda: _compute_celestial_bodies(jd_ut, lat, lon, calc_houses))
+
+def _compute_celestial_bodies(jd_ut, lat, lon, calc_houses=False):
+    """天体情報とハウスを計算する (キャッシュなし)"""
+    grid = _ephemeris_grid
+    pool = _ephemeris_pool
+    if pool is not None and (calc_houses or grid is None or not grid.covers(jd_ut)):
+        # Swiss Ephemeris を使う計算はプールのワーカーで行う
+        return pool.compute_bodies(jd_ut, lat, lon, calc_houses)
+
+    celestial_bodies = {}
+    if grid is not None and grid.covers(jd_ut):
+        with span("ephemeris.grid"):
+            grid_lon, grid_speed = grid.positions(jd_ut)
+            for b, name in enumerate(grid.body_names):
+                celestial_bodies[name] = {'id': PLANET_NAMES[name], 'pos': float(grid_lon[b]),
+                                          'speed': float(grid_speed[b]), 'is_retro': bool(grid_speed[b] < 0)}
+    else:
+        # 天体暦ファイルの読み込みは最初の calc_ut の中で行われるため、この段階に含まれる
+        with span("ephemeris.calc_ut"):
+            iflag = swe.FLG_SWIEPH | swe.FLG_SPEED
+            for name, p_id in PLANET_NAMES.items():
+                res = swe.calc_ut(jd_ut, p_id, iflag)
+                celestial_bodies[name] = {'id': p_id, 'pos': res[0][0], 'speed': res[0][3], 'is_retro': res[0][3] < 0}
+    
+    head = celestial_bodies["ドラゴンヘッド"]
+    celestial_bodies["ドラゴンテイル"] = {'id': -1, 'pos': (head['pos'] + 180) % 360, 'speed': head['speed'], 'is_retro': False}
+
+    if calc_houses:
+        try:
+            with span("ephemeris.houses"):
+                cusps, ascmc = swe.houses(jd_ut, lat, lon, HOUSE_SYSTEM)
+            celestial_bodies["ASC"] = {'id': 'ASC', 'pos': ascmc[0], 'is_retro': False}
+            celestial_bodies["MC"] = {'id': 'MC', 'pos': ascmc[1], 'is_retro': False}
+            return celestial_bodies, cusps, ascmc
+        except swe.Error as e:
+            logger.warning("ハウスが計算できませんでした: %s", e)
+            return celestial_bodies, None, None
+    return celestial_bodies, None, None
+
+
+def sample_ephemeris_grid(jd_start, jd_end, step=None):
+    """[jd_start, jd_end] の天体位置グリッドをメモリ上に作る (ephemeris_grid.EphemerisGrid.sample)
+
+    ワーカープールの設定中はサンプリングをプールで行う。step の省略時は ephemeris_grid.DEFAULT_STEP。
+    """
+    from ephemeris_grid import DEFAULT_STEP, EphemerisGrid, sample_positions
+
+    pool = _ephemeris_pool
+    sampler = sample_positions if pool is None else (lambda jds, body_ids: pool.run(sample_positions, jds, body_ids))
+    step = step or DEFAULT_STEP
+    with span("ephemeris.grid_sample"):
+        # 補間は前後 4 点を使うため、両端に余裕を持たせる
+        return EphemerisGrid.sample(jd_start - step, jd_end + 2 * step, step, sampler)
+
+def _sampled_batch_grid(jd_uts, step=None):
+    """jd_uts の範囲だけのグリッドを作る。step を省略した場合、DEFAULT_STEP 間隔のサンプル数が
+    jd_uts の件数を超えるなら 1 件ずつ計算するほうが速いため None を返す"""
+    from ephemeris_grid import DEFAULT_STEP
+
+    if len(jd_uts) < 2:
+        return None
+    if step is None:
+        step = DEFAULT_STEP
+        if (max(jd_uts) - min(jd_uts)) / step + 4 > len(jd_uts):
+            return None
+    return sample_ephemeris_grid(min(jd_uts), max(jd_uts), step)
+
+def _grid_bodies(body_names, lon_row, speed_row):
+    """グリッドから補間した 1 時刻分の黄経・速度を天体情報の dict にする"""
+    celestial_bodies = {
+        name: {'id': PLANET_NAMES[name], 'pos': pos, 'speed': speed, 'is_retro': speed < 0}
+        for name, pos, speed in zip(body_names, lon_row, speed_row)
+    }
+    head = celestial_bodies["ドラゴンヘッド"]
+    celestial_bodies["ドラゴンテイル"] = {'id': -1, 'pos': (head['pos'] + 180) % 360, 'speed': head['speed'], 'is_retro': False}
+    return celestial_bodies
+
+def calculate_bodies_batch(jd_uts, sample_step=None):
+    """複数のユリウス日の天体情報 (ハウスなし) をまとめて計算し、jd_uts と同じ順のリストで返す
+
+    設定済みのグリッドの範囲内の日時は一度の配列演算でまとめて補間する。範囲外の日時は、
+    その範囲を ephemeris_grid.DEFAULT_STEP 間隔でサンプリングする点数が件数以下なら
+    (短い期間に密に並んでいる場合)、メモリ上にその範囲だけのグリッドを作って補間し、
+    それ以外は 1 件ずつ計算する。sample_step を指定すると、範囲外の日時は常にその間隔の
+    グリッドを作って補間する (一定間隔の日時の列では、間隔をそろえるとグリッドの点と一致する)。
+    """
+    grid = _ephemeris_grid
+    # grid.covers と同じ判定を 1 件ずつ行う (範囲外の日時が 1 件あってもまとめて補間できるように)
+    covered = [grid is not None and grid.jd_start <= jd_ut <= grid.jd_end for jd_ut in jd_uts]
+    inside = [i for i, c in enumerate(covered) if c]
+    outside = [i for i, c in enumerate(covered) if not c]
+    results = [None] * len(jd_uts)
+    sampled = _sampled_batch_grid([jd_uts[i] for i in outside], sample_step)
+    for batch_grid, indices in ((grid, inside), (sampled, outside)):
+        if batch_grid is None or not indices:
+            continue
+        with span("ephemeris.grid_batch"):
+            grid_lon, grid_speed = batch_grid.positions([jd_uts[i] for i in indices])
+        for i, lon_row, speed_row in zip(indices, grid_lon.tolist(), grid_speed.tolist()):
+            results[i] = _grid_bodies(batch_grid.body_names, lon_row, speed_row)
+    return [bodies if bodies is not None else _calculate_celestial_bodies(jd_ut, None, None)[0]
+            for jd_ut, bodies in zip(jd_uts, results)]
+
+
+def progressed_datetime(dt_utc, now_utc=None):
+    """一日一年法で now_utc 時点に対応するプログレスの日時を返す"""
+    if now_utc is None:
+        now_utc = datetime.now(timezone.utc)
+    age_in_days = (now_utc - dt_utc).days
+    age_in_years = age_in_days / 365.2425
+    return dt_utc + timedelta(days=age_in_years)
+
+def calculate_chart_layers(dt_utc, lat, lon, transit_dt_utc, now_utc=None):
+    """ネイタル、プログレス、トランジットを計算する (天体暦パスは設定済みであること)
+
+    プログレスは now_utc (省略時は現在時刻) を基準に計算する。
+    """
+    cache = _chart_cache
+    if cache is not None:
+        # 基準時刻をそろえて、同じような時刻の要求がキャッシュに当たるようにする
+        transit_dt_utc = cache.quantize(transit_dt_utc)
+        now_utc = cache.quantize(now_utc or datetime.now(timezone.utc))
+
+    # 1. ネイタル計算
+    jd_ut_natal = datetime_to_jd(dt_utc)
+    with span("chart.natal"):
+        natal_bodies, cusps, ascmc = _calculate_celestial_bodies(jd_ut_natal, lat, lon, calc_houses=True)
+    if not cusps: # ハウス計算失敗時は中止
+        return None, None, None, None, None
+
+    # 2. プログレス計算 (一日一年法)
+    jd_ut_prog = datetime_to_jd(progressed_datetime(dt_utc, now_utc))
+    with span("chart.progressed"):
+        progressed_bodies, _, _ = _calculate_celestial_bodies(jd_ut_prog, lat, lon)
+
+    # 3. トランジット計算 (指定された日時を使用)
+    jd_ut_transit = datetime_to_jd(transit_dt_utc)
+    with span("chart.transit"):
+        transit_bodies, _, _ = _calculate_celestial_bodies(jd_ut_transit, lat, lon)
+
+    return natal_bodies, progressed_bodies, transit_bodies, cusps, ascmc
+
+def calculate_all_data(dt_utc, lat, lon, transit_dt_utc):
+    """ネイタル、プログレス、トランジットの全データを計算する"""
+    if not ephemeris_available():
+        logger.error("天体暦ファイルが見つかりません: %s", EPHE_PATH)
+        return None, None, None, None, None
+    # ワーカープールを使う場合は各ワーカーが起動時に設定済み
+    if _ephemeris_pool is None:
+        with span("ephemeris.set_path"):
+            swe.set_ephe_path(EPHE_PATH)
+    return calculate_chart_layers(dt_utc, lat, lon, transit_dt_utc)
@@ -0,0 +1,103 @@
+"""日本語フォントの遅延検出
+
+フォントの探索はチャートを描画するときまで行わず、見つかったパスは
+ディスク上にキャッシュして次回以降の起動で再利用する。見つからなかった結果は
+キャッシュしない (後からインストールしたフォントを次回の起動で拾うため)。
+"""
+import json
+import os
+
+# 日本語フォントファイル名 (適宜変更してください)
+JP_FONT_FILE = "ipaexg.ttf"
+JP_FONT_KEYWORDS = ("ipaexg", "IPAexGothic")
+FALLBACK_SANS_SERIF = ['Hiragino Sans', 'Yu Gothic', 'Meiryo', 'TakaoPGothic', 'DejaVu Sans']
+
+# フォント検索結果のキャッシュファイル (HOROSCOPE_FONT_CACHE で変更可能)
+FONT_CACHE_PATH = os.environ.get(
+    "HOROSCOPE_FONT_CACHE",
+    os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "horoscope_drawer", "font_cache.json"),
+)
+
+_NOT_SEARCHED = object()
+_jp_font_path = _NOT_SEARCHED
+
+
+def _load_cached_font_path(cache_path):
+    """キャッシュ済みのフォントパスを読み込む (未キャッシュ・無効時は _NOT_SEARCHED)"""
+    try:
+        with open(cache_path, encoding="utf-8") as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return _NOT_SEARCHED
+    path = cached.get("path")
+    # 未検出の結果 (古いキャッシュ) や、削除・移動されたフォントは再探索させる
+    if path is None or not os.path.exists(path):
+        return _NOT_SEARCHED
+    return path
+
+
+def _save_cached_font_path(cache_path, path):
+    """フォント検索結果をキャッシュファイルへ書き出す (失敗しても無視する)"""
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"path": path}, f, ensure_ascii=False)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass
+
+
+def _search_system_fonts():
+    """システムフォントから IPAex ゴシックを探す"""
+    import matplotlib.font_manager as fm
+
+    for font_path in fm.findSystemFonts(fontpaths=None, fontext='ttf'):
+        if any(keyword in font_path for keyword in JP_FONT_KEYWORDS):
+            return font_path
+    return None
+
+
+def find_jp_font_path(cache_path=FONT_CACHE_PATH, refresh=False):
+    """日本語フォントのパスを返す (見つからなければ None)
+
+    プロセス内では一度だけ解決し、見つかったフォントのパスは cache_path に保存する。
+    refresh=True の場合はキャッシュを無視して探索し直す。
+    """
+    global _jp_font_path
+    if not refresh and _jp_font_path is not _NOT_SEARCHED:
+        return _jp_font_path
+
+    if os.path.exists(JP_FONT_FILE):
+        _jp_font_path = JP_FONT_FILE
+        return _jp_font_path
+
+    path = _NOT_SEARCHED if refresh else _load_cached_font_path(cache_path)
+    if path is _NOT_SEARCHED:
+        path = _search_system_fonts()
+        if path is not None:
+            _save_cached_font_path(cache_path, path)
+    _jp_font_path = path
+    return _jp_font_path
+
+
+def configure_matplotlib_font():
+    """Matplotlib の日本語フォントを設定する
+
+    IPAex ゴシックが見つかった場合は True、システムのデフォルトフォントに
+    フォールバックした場合は False を返す。
+    """
+    import matplotlib
+    import matplotlib.font_manager as fm
+
+    jp_font_path = find_jp_font_path()
+    if jp_font_path:
+        fm.fontManager.addfont(jp_font_path)
+        font_prop = fm.FontProperties(fname=jp_font_path)
+        matplotlib.rcParams['font.family'] = font_prop.get_name()
+        return True
+
+    # フォントが見つからない場合は、システムデフォルトのゴシック体を使用
+    matplotlib.rcParams['font.family'] = 'sans-serif'
+    matplotlib.rcParams['font.sans-serif'] = FALLBACK_SANS_SERIF
+    return False
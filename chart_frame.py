@@ -0,0 +1,212 @@
+"""列指向のチャートデータ (ChartFrame)
+
+chart_engine が返す {name: {'id', 'pos', 'speed', 'is_retro'}} の dict を、天体ごとの
+列 (ID・黄経・速度・逆行フラグ) の配列として持つ。ハウス番号やサイン・度数の表記は
+配列演算でまとめて求めるため、表や JSON への変換で天体ごとの Python の処理が要らない。
+
+    frame = ChartFrame.from_bodies(natal_bodies)
+    df = frame.to_dataframe(cusps)
+    houses = frame.houses(cusps)
+
+読み取り専用の Mapping としても振る舞う (frame[name] は従来と同じ形の dict を返す) ため、
+アスペクト計算や描画の関数にはそのまま渡せる。
+"""
+import json
+from collections.abc import Mapping
+from functools import lru_cache
+
+import numpy as np
+
+from chart_engine import SIGN_NAMES, PLANET_SYMBOLS, LUMINARIES, SENSITIVE_POINTS, DEGREES_PER_SIGN, ZODIAC_DEGREES
+
+TABLE_COLUMNS = ["天体", "サイン", "度数", "逆行", "ハウス"]
+
+_SIGN_NAMES = np.array(SIGN_NAMES)
+
+
+def wrap_angle(angle):
+    """角度 (スカラーまたは配列) を [-180, 180) に正規化する (np.mod より速い floor で計算する)"""
+    return angle - 360 * np.floor((angle + 180) / 360)
+
+
+def house_numbers(lon, cusps):
+    """黄経の配列に対するハウス番号 (1〜12) の配列を返す
+
+    カスプを第 1 カスプから単調増加になるよう 360° ずつ足して展開し、searchsorted で
+    区間を求める。get_house_number と同じく、各ハウスはカスプ以上・次のカスプ未満。
+    """
+    cusps = np.asarray(cusps, dtype=float)
+    unwrapped = cusps + ZODIAC_DEGREES * np.concatenate(([0], np.cumsum(np.diff(cusps) < 0)))
+    lon = np.asarray(lon, dtype=float)
+    lon = np.where(lon < cusps[0], lon + ZODIAC_DEGREES, lon)
+    return np.clip(np.searchsorted(unwrapped, lon, side="right"), 1, 12)
+
+
+def batch_house_numbers(lon, cusps):
+    """複数チャート分のハウス番号 (house_numbers と同じ規則)
+
+    lon は (N, B) の黄経、cusps は (N, 12) のカスプ。戻り値は (N, B) の uint8 の配列。
+    """
+    cusps = np.asarray(cusps, dtype=float)
+    wraps = np.concatenate([np.zeros((len(cusps), 1)), np.cumsum(np.diff(cusps, axis=1) < 0, axis=1)], axis=1)
+    unwrapped = cusps + ZODIAC_DEGREES * wraps
+    lon = np.asarray(lon, dtype=float)
+    lon = np.where(lon < cusps[:, :1], lon + ZODIAC_DEGREES, lon)
+    # searchsorted (side="right") と同じく、黄経以下のカスプの数を数える
+    count = (unwrapped[:, None, :] <= lon[:, :, None]).sum(axis=2)
+    return np.clip(count, 1, 12).astype(np.uint8)
+
+
+def degree_strings(lon):
+    """黄経の配列をサイン内の度数表記 ("DD°MM'") の配列にする (get_degree_parts と同じ表記)"""
+    pos_in_sign = np.mod(np.mod(lon, ZODIAC_DEGREES), DEGREES_PER_SIGN)
+    degrees = pos_in_sign.astype(int)
+    minutes = ((pos_in_sign - degrees) * 60).astype(int)
+    return np.char.add(np.char.add(np.char.zfill(degrees.astype(str), 2), "°"),
+                       np.char.add(np.char.zfill(minutes.astype(str), 2), "'"))
+
+
+@lru_cache(maxsize=16)
+def _name_labels(names):
+    """天体記号つきの表示名 (names は tuple で渡す)"""
+    return np.array([f"{PLANET_SYMBOLS.get(name, '')} {name}" for name in names])
+
+
+class ChartFrame(Mapping):
+    """1 つのチャート (ネイタル・プログレス・トランジットのいずれか) の天体の列データ
+
+    names: 天体名の tuple、ids: 天体 ID (ASC/MC は文字列) の object 配列、
+    lon: 黄経、speed: 速度 (ASC/MC は NaN)、retro: 逆行フラグ。
+    """
+
+    __slots__ = ("names", "ids", "lon", "speed", "retro", "_index")
+
+    def __init__(self, names, ids, lon, speed, retro):
+        self.names = tuple(names)
+        self.ids = np.asarray(ids, dtype=object)
+        self.lon = np.asarray(lon, dtype=float)
+        self.speed = np.asarray(speed, dtype=float)
+        self.retro = np.asarray(retro, dtype=bool)
+        self._index = {name: i for i, name in enumerate(self.names)}
+
+    @classmethod
+    def from_bodies(cls, celestial_bodies):
+        """chart_engine の天体情報の dict から作る"""
+        rows = celestial_bodies.values()
+        return cls(
+            celestial_bodies.keys(),
+            [data.get('id') for data in rows],
+            [data['pos'] for data in rows],
+            [data.get('speed', np.nan) for data in rows],
+            [data.get('is_retro', False) for data in rows],
+        )
+
+    # --- Mapping (従来の dict と同じ形で 1 天体ずつ取り出す) ---
+    def __getitem__(self, name):
+        i = self._index[name]
+        data = {'id': self.ids[i], 'pos': float(self.lon[i]), 'is_retro': bool(self.retro[i])}
+        if not np.isnan(self.speed[i]):
+            data['speed'] = float(self.speed[i])
+        return data
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def __repr__(self):
+        return f"ChartFrame({len(self.names)} bodies)"
+
+    def index(self, name):
+        """天体名の列番号"""
+        return self._index[name]
+
+    def to_bodies(self):
+        """従来の天体情報の dict に戻す"""
+        return {name: self[name] for name in self.names}
+
+    # --- 列の計算 ---
+    @property
+    def luminary(self):
+        """太陽・月のマスク"""
+        return np.isin(self.ids, LUMINARIES)
+
+    def sign_indices(self):
+        """サインの番号 (0〜11)"""
+        return (np.mod(self.lon, ZODIAC_DEGREES) / DEGREES_PER_SIGN).astype(int)
+
+    def sign_names(self):
+        """サイン名の配列"""
+        return _SIGN_NAMES[self.sign_indices()]
+
+    def degree_strings(self):
+        """サイン内の度数表記の配列"""
+        return degree_strings(self.lon)
+
+    def houses(self, cusps):
+        """ハウス番号の配列"""
+        return house_numbers(self.lon, cusps)
+
+    # --- 出力 ---
+    def table(self, cusps=None):
+        """表示用の列の dict (キーは TABLE_COLUMNS)。cusps がなければハウスは "-" """
+        house = self.houses(cusps) if cusps else np.full(len(self.names), "-")
+        return dict(zip(TABLE_COLUMNS, (
+            _name_labels(self.names), self.sign_names(), self.degree_strings(),
+            np.where(self.retro, "R", ""), house,
+        )))
+
+    def to_dataframe(self, cusps=None, name_label=TABLE_COLUMNS[0]):
+        """表示用の pandas.DataFrame を作る (name_label は天体名の列の見出し)"""
+        import pandas as pd
+
+        columns = self.table(cusps)
+        columns[name_label] = columns.pop(TABLE_COLUMNS[0])
+        return pd.DataFrame(columns, columns=[name_label] + TABLE_COLUMNS[1:])
+
+    def to_dict(self, cusps=None):
+        """JSON に変換できる列ごとの dict (speed の NaN は None)"""
+        data = {
+            "names": list(self.names),
+            "ids": self.ids.tolist(),
+            "lon": self.lon.tolist(),
+            "speed": np.where(np.isnan(self.speed), None, self.speed).tolist(),
+            "retro": self.retro.tolist(),
+            "sign": self.sign_indices().tolist(),
+        }
+        if cusps:
+            data["house"] = self.houses(cusps).tolist()
+        return data
+
+    def to_json(self, cusps=None, **kwargs):
+        """to_dict の結果を JSON 文字列にする (kwargs は json.dumps に渡す)"""
+        kwargs.setdefault("ensure_ascii", False)
+        return json.dumps(self.to_dict(cusps), **kwargs)
+
+
+def aspect_dataframe(frame, aspects, cusps):
+    """アスペクトのリストを表示用の pandas.DataFrame にする (オーブの小さい順)
+
+    天体ごとの表示 (名前と逆行・サインとハウス) を列としてまとめて作り、
+    アスペクトの組の添字で割り当てる。ASC/MC にはハウスを付けない。
+    """
+    import pandas as pd
+
+    aspects = pd.DataFrame(aspects).sort_values("orb", kind="stable")
+    table = frame.table(cusps)
+    names = np.array(frame.names)
+    display_names = np.char.rstrip(np.char.add(np.char.add(names, " "), table["逆行"]))
+    details = np.where(np.isin(names, SENSITIVE_POINTS), table["サイン"],
+                       np.char.add(np.char.add(table["サイン"], " "), np.char.add(table["ハウス"].astype(str), "ハウス")))
+    p1 = aspects["p1_name"].map(frame.index).to_numpy()
+    p2 = aspects["p2_name"].map(frame.index).to_numpy()
+    return pd.DataFrame({
+        "天体1": display_names[p1], "詳細1": details[p1],
+        "アスペクト": aspects["aspect_name"].str.split(" ").str[0].to_numpy(),
+        "天体2": display_names[p2], "詳細2": details[p2],
+        "オーブ": aspects["orb"].map("{:.2f}°".format).to_numpy(),
+    })
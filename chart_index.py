@@ -0,0 +1,492 @@
+"""計算済みチャートのコーパスの検索インデックス
+
+chart_batch の出力 (.jsonl / .csv / .parquet) からネイタルの天体位置を読み込み、
+天体ごとの次の索引をディレクトリに .npy として保存する。検索時は mmap で開くため、
+数百万件のインデックスでも読み込みはほぼ一瞬で、プロセス間でページキャッシュを共有できる。
+
+- 黄経: 天体ごとにチャートを黄経順に並べた配列と 1° 単位のバケットの先頭位置。
+  サインは 30 バケット分の連続区間、度数の範囲は 0°/360° をまたぐ場合 2 区間になる
+- ハウス: 天体ごとにチャートをハウス番号順に並べた配列とハウスごとの先頭位置
+- アスペクト: ASPECTS のオーブ内にある天体の組とアスペクトごとに、チャートをオーブ順に
+  並べた配列 (同一天体・EXCLUDED_PAIRS の組は含まない)
+- 列データ: 全チャートの黄経 (N, 天体数) とハウス番号 (N, 天体数)
+
+    python chart_index.py build charts.jsonl charts.idx
+    python chart_index.py query charts.idx --sign 月:蟹座 --house 月:4 --aspect 金星:火星:トライン:2
+    python chart_index.py query charts.idx --near 太陽:123.5:3
+
+検索条件は dict のリストで、すべてを満たすチャートを返す。
+    {"type": "sign", "body": "月", "sign": "蟹座"}
+    {"type": "house", "body": "月", "house": 4}
+    {"type": "longitude", "body": "太陽", "degree": 123.5, "within": 3}
+    {"type": "aspect", "p1": "金星", "p2": "火星", "aspect": "トライン (120°)", "orb": 2}
+各条件の該当件数を索引から見積もり、最も件数の少ない条件の索引から候補を取り出して、
+残りの条件は件数の少ない順に列データで絞り込む。アスペクトの条件はオーブが指定値未満の
+チャートを返し、orb を省略すると calculate_natal_aspects と同じ許容オーブ (太陽・月を含む組は
++2°) を使う。索引に含まれないオーブ (許容オーブより大きい) の条件は索引を使わず、
+列データでの絞り込みだけに使う。
+"""
+import argparse
+import csv
+import json
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+
+import chart_engine
+from chart_aspects import ASPECT_NAMES, ASPECT_ANGLES, ASPECT_ORBS, LUMINARY_ORB_BONUS, EXCLUDED_PAIRS
+from chart_engine import LUMINARIES, PLANET_NAMES, SENSITIVE_POINTS, SIGN_NAMES, DEGREES_PER_SIGN, ZODIAC_DEGREES
+from chart_frame import batch_house_numbers, wrap_angle
+
+FORMAT_VERSION = 1
+# 索引の列 (天体と ASC・MC)
+BODY_NAMES = chart_engine.BODY_NAMES + SENSITIVE_POINTS
+# 1 回に処理するチャート数 (ハウスとアスペクトの計算の作業領域を抑える)
+DEFAULT_CHUNK_SIZE = 50000
+# 索引の境界での丸め誤差に備えて候補を少し広めに取り、列データで正確に絞り込む
+MARGIN = 1e-4
+
+_LUMINARY = np.array([PLANET_NAMES.get(name) in LUMINARIES for name in BODY_NAMES])
+
+
+# --- 入力 ---
+def _read_results(path):
+    """chart_batch の出力のレコード (dict) を順に返す"""
+    ext = os.path.splitext(path.rstrip("/" + os.sep))[1].lower()
+    if ext == ".jsonl":
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    elif ext == ".csv":
+        with open(path, encoding="utf-8", newline="") as f:
+            yield from csv.DictReader(f)
+    elif ext == ".parquet":
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise SystemExit("Parquet の読み込みには pyarrow が必要です: pip install pyarrow") from e
+        for name in sorted(os.listdir(path)):
+            if name.startswith("part-") and name.endswith(".parquet"):
+                for batch in pq.ParquetFile(os.path.join(path, name)).iter_batches():
+                    yield from batch.to_pylist()
+    else:
+        raise SystemExit(f"未対応の入力形式です: {ext} (.csv / .jsonl / .parquet)")
+
+
+def _record_arrays(record):
+    """レコードから (黄経の行, カスプの行) を取り出す。エラーのレコードは None"""
+    if record.get("error"):
+        return None
+    lon = [record[f"natal_{name}_pos"] for name in BODY_NAMES[:-2]] + [record["asc"], record["mc"]]
+    cusps = [record[f"cusp_{i + 1}"] for i in range(12)]
+    return [float(v) for v in lon], [float(v) for v in cusps]
+
+
+# --- 作成 ---
+def _sorted_postings(keys, key_count):
+    """keys (N,) を値順に並べたチャート番号と、各値の先頭位置 (key_count + 1,) を返す"""
+    order = np.argsort(keys, kind="stable").astype(np.int32)
+    offsets = np.searchsorted(keys[order], np.arange(key_count + 1), side="left")
+    return order, offsets
+
+
+def _nearest_aspects():
+    """四捨五入した角距離 (0〜180°) ごとに、オーブ内に入りうるアスペクトの番号を引く表
+
+    アスペクトの角度の間隔がオーブ (太陽・月の加算を含む) の 2 倍 + 1° 以上あれば、
+    角距離がオーブ内に入るアスペクトは四捨五入した角距離に最も近いものだけになる。
+    """
+    if np.any(np.diff(np.sort(ASPECT_ANGLES)) < 2 * (ASPECT_ORBS.max() + LUMINARY_ORB_BONUS) + 1):
+        raise ValueError("アスペクトの角度の間隔がオーブに対して狭すぎるため、索引を作れません")
+    return np.argmin(np.abs(np.arange(181)[:, None] - ASPECT_ANGLES), axis=1)
+
+
+def _aspect_pairs():
+    """アスペクトの索引を作る天体の組 (上三角) と、組 × アスペクトごとの許容オーブ (計算しない組は 0)"""
+    pair_i, pair_j = np.triu_indices(len(BODY_NAMES), k=1)
+    allowed = ASPECT_ORBS + LUMINARY_ORB_BONUS * (_LUMINARY[pair_i] | _LUMINARY[pair_j])[:, None]
+    excluded = np.array([frozenset((BODY_NAMES[i], BODY_NAMES[j])) in EXCLUDED_PAIRS for i, j in zip(pair_i, pair_j)])
+    allowed[excluded] = 0
+    return pair_i, pair_j, allowed
+
+
+def _chunk_aspects(chunk, pair_i, pair_j, allowed, nearest):
+    """チャートの一部 (n, 天体数) のアスペクトの (組 × アスペクトの番号, オーブ, チャートの番号) を返す
+
+    batch_natal_aspects と同じ判定 (オーブ未満、太陽・月を含む組は +2°、EXCLUDED_PAIRS を除く) を
+    天体の組 (上三角) だけについて行う。チャートの番号は chunk 内の位置で、昇順に並ぶ。
+    """
+    distance = np.abs(wrap_angle(chunk[:, pair_i] - chunk[:, pair_j]))
+    k = nearest[np.round(distance).astype(np.intp)]
+    orb = np.abs(distance - ASPECT_ANGLES[k])
+    hit = orb < allowed[np.arange(len(pair_i)), k]
+    n, p = np.nonzero(hit)
+    return p * len(ASPECT_NAMES) + k[hit], orb[hit].astype(np.float32), n
+
+
+def _write_aspect_postings(lon, chunk_size, create, work_path):
+    """全チャートのアスペクトを (組 × アスペクト) ごとにオーブ順に並べた索引を書き出す
+
+    1 回目で chunk_size 件ずつアスペクトを計算して work_path に保存しながら組 × アスペクトごとの
+    件数を数え、2 回目で保存したアスペクトを組 × アスペクトの区間に順に書き込んでから、
+    区間ごとにオーブ順に並べる (全チャート分のアスペクトを一度にメモリに持たない)。
+    """
+    pair_i, pair_j, allowed = _aspect_pairs()
+    nearest = _nearest_aspects()
+    key_count = len(pair_i) * len(ASPECT_NAMES)
+    counts = np.zeros(key_count, dtype=np.int64)
+    chunk_paths = []
+    for start in range(0, len(lon), chunk_size):
+        keys, orbs, n = _chunk_aspects(np.asarray(lon[start:start + chunk_size]), pair_i, pair_j, allowed, nearest)
+        counts += np.bincount(keys, minlength=key_count)
+        chunk_paths.append(os.path.join(work_path, f"aspects_{len(chunk_paths):05d}.npz"))
+        np.savez(chunk_paths[-1], keys=keys, orbs=orbs, charts=(n + start).astype(np.int32))
+
+    offsets = create("aspect_offsets", np.int64, (key_count + 1,))
+    offsets[0], offsets[1:] = 0, np.cumsum(counts)
+    charts = create("aspect_charts", np.int32, (int(offsets[-1]),))
+    orbs = create("aspect_orbs", np.float32, (int(offsets[-1]),))
+    cursor = np.array(offsets[:-1])
+    for path in chunk_paths:
+        with np.load(path) as chunk:
+            order = np.argsort(chunk["keys"], kind="stable")
+            keys = chunk["keys"][order]
+            # 同じ組 × アスペクトの中での順位を足して書き込み位置にする
+            position = cursor[keys] + np.arange(len(keys)) - np.searchsorted(keys, keys, side="left")
+            charts[position] = chunk["charts"][order]
+            orbs[position] = chunk["orbs"][order]
+        cursor += np.bincount(keys, minlength=key_count)
+        os.remove(path)
+    for key in np.nonzero(counts)[0]:
+        lo, hi = offsets[key], offsets[key + 1]
+        order = np.argsort(orbs[lo:hi], kind="stable")
+        charts[lo:hi], orbs[lo:hi] = charts[lo:hi][order], orbs[lo:hi][order]
+
+
+def write_index(index_path, lon, cusps, rows, ids, chunk_size=DEFAULT_CHUNK_SIZE):
+    """黄経 (N, len(BODY_NAMES)) とカスプ (N, 12) から索引を作って index_path に保存する
+
+    索引の各配列は np.lib.format.open_memmap で書き出し先に確保して chunk_size 件ずつ
+    (並べ替えは天体 1 つの列ずつ) 書き込むため、全チャート分の配列をメモリに持たない。
+    lon などには np.memmap を渡してもよい。
+    """
+    count = len(lon)
+    if not count:
+        raise ValueError("索引に入れるチャートがありません")
+    ids = np.asarray(ids, dtype=str)
+
+    # 別名のディレクトリに書き出してから置き換える (書き出し途中の索引を開かないように)
+    tmp_path = index_path.rstrip("/" + os.sep) + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    arrays = {}
+
+    def create(name, dtype, shape):
+        arrays[name] = np.lib.format.open_memmap(os.path.join(tmp_path, f"{name}.npy"), mode="w+",
+                                                 dtype=dtype, shape=shape)
+        return arrays[name]
+
+    body_count = len(BODY_NAMES)
+    out_lon = create("lon", float, (count, body_count))
+    houses = create("house", np.uint8, (count, body_count))
+    out_rows = create("rows", np.int64, (count,))
+    out_ids = create("ids", ids.dtype, (count,))
+    for start in range(0, count, chunk_size):
+        stop = min(start + chunk_size, count)
+        chunk = np.asarray(lon[start:stop], dtype=float) % ZODIAC_DEGREES
+        chunk[chunk >= ZODIAC_DEGREES] = 0.0  # 負のごく小さい値の剰余が 360 になる場合
+        out_lon[start:stop] = chunk
+        houses[start:stop] = batch_house_numbers(chunk, np.asarray(cusps[start:stop], dtype=float))
+        out_rows[start:stop] = rows[start:stop]
+        out_ids[start:stop] = ids[start:stop]
+
+    lon_order = create("lon_order", np.int32, (body_count, count))
+    lon_sorted = create("lon_sorted", float, (body_count, count))
+    lon_offsets = create("lon_offsets", np.int64, (body_count, ZODIAC_DEGREES + 1))
+    house_order = create("house_order", np.int32, (body_count, count))
+    house_offsets = create("house_offsets", np.int64, (body_count, 13))
+    for b in range(body_count):
+        # 黄経順に並べ、1° ごとのバケットの先頭位置を求める
+        column = np.array(out_lon[:, b])
+        order = np.argsort(column)
+        lon_order[b] = order
+        lon_sorted[b] = column[order]
+        lon_offsets[b] = np.searchsorted(lon_sorted[b], np.arange(ZODIAC_DEGREES + 1), side="left")
+        house_order[b], house_offsets[b] = _sorted_postings(np.array(houses[:, b]) - 1, 12)
+    _write_aspect_postings(out_lon, chunk_size, create, tmp_path)
+
+    for array in arrays.values():
+        array.flush()
+    arrays.clear()
+    meta = {"version": FORMAT_VERSION, "count": count, "bodies": BODY_NAMES, "aspects": ASPECT_NAMES}
+    with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    shutil.rmtree(index_path, ignore_errors=True)
+    os.replace(tmp_path, index_path)
+    return count
+
+
+def _record_chunks(results_path, chunk_size):
+    """chart_batch の出力を chunk_size 件ずつ (黄経, カスプ, row, id) の配列にして返す
+
+    レコードは前もって確保した chunk_size 件分の配列に書き込む (Python のリストに溜めない)。
+    """
+    def empty():
+        return (np.empty((chunk_size, len(BODY_NAMES))), np.empty((chunk_size, 12)),
+                np.empty(chunk_size, dtype=np.int64), np.empty(chunk_size, dtype=object))
+
+    lon, cusps, rows, ids = empty()
+    n = 0
+    for index, record in enumerate(_read_results(results_path)):
+        arrays = _record_arrays(record)
+        if arrays is None:
+            continue
+        lon[n], cusps[n] = arrays
+        rows[n] = int(record.get("row", index))
+        ids[n] = str(record.get("id") or "")
+        n += 1
+        if n == chunk_size:
+            yield lon, cusps, rows, ids.astype(str)
+            lon, cusps, rows, ids = empty()
+            n = 0
+    if n:
+        yield lon[:n], cusps[:n], rows[:n], ids[:n].astype(str)
+
+
+def build_index(results_path, index_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """chart_batch の出力から索引を作り、索引に入れたチャート数を返す
+
+    入力は chunk_size 件ずつ配列にして作業用のディレクトリに保存し、読み終えてから
+    チャート数と id の最大の長さで確保した open_memmap の配列にまとめて write_index に渡す
+    (全チャート分の配列をメモリに持たない)。
+    """
+    input_path = index_path.rstrip("/" + os.sep) + ".input"
+    shutil.rmtree(input_path, ignore_errors=True)
+    os.makedirs(input_path)
+    try:
+        chunk_paths, count, id_width = [], 0, 1
+        for chunk in _record_chunks(results_path, chunk_size):
+            chunk_paths.append(os.path.join(input_path, f"chunk_{len(chunk_paths):05d}.npz"))
+            np.savez(chunk_paths[-1], *chunk)
+            count += len(chunk[0])
+            id_width = max(id_width, int(np.char.str_len(chunk[3]).max()))
+        if not count:
+            raise ValueError("索引に入れるチャートがありません")
+
+        columns = [np.lib.format.open_memmap(os.path.join(input_path, f"{name}.npy"), mode="w+",
+                                             dtype=dtype, shape=shape)
+                   for name, dtype, shape in (("lon", float, (count, len(BODY_NAMES))), ("cusps", float, (count, 12)),
+                                              ("rows", np.int64, (count,)), ("ids", f"<U{id_width}", (count,)))]
+        start = 0
+        for path in chunk_paths:
+            with np.load(path) as chunk:
+                stop = start + len(chunk["arr_0"])
+                for i, column in enumerate(columns):
+                    column[start:stop] = chunk[f"arr_{i}"]
+            start = stop
+            os.remove(path)
+        return write_index(index_path, *columns, chunk_size=chunk_size)
+    finally:
+        columns = None
+        shutil.rmtree(input_path, ignore_errors=True)
+
+
+# --- 検索 ---
+def _body_index(name):
+    try:
+        return BODY_NAMES.index(name)
+    except ValueError:
+        raise ValueError(f"未知の天体です: {name}") from None
+
+
+def _aspect_index(name):
+    """アスペクト名 (「トライン」のように角度を省略してもよい) の ASPECT_NAMES 上の位置"""
+    for k, aspect_name in enumerate(ASPECT_NAMES):
+        if name in (aspect_name, aspect_name.split(" (")[0]):
+            return k
+    raise ValueError(f"未知のアスペクトです: {name}")
+
+
+class ChartIndex:
+    """build_index で作った索引を mmap で開き、条件に合うチャートを検索する"""
+
+    def __init__(self, path):
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != FORMAT_VERSION or meta["bodies"] != BODY_NAMES or meta["aspects"] != ASPECT_NAMES:
+            raise ValueError(f"索引の形式が異なります。作り直してください: {path}")
+        self.path = path
+        self.count = meta["count"]
+        for name in ("lon", "house", "rows", "ids", "lon_order", "lon_sorted", "lon_offsets",
+                     "house_order", "house_offsets", "aspect_charts", "aspect_orbs", "aspect_offsets"):
+            setattr(self, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r"))
+        pair_i, pair_j = np.triu_indices(len(BODY_NAMES), k=1)
+        self._pair_id = np.full((len(BODY_NAMES), len(BODY_NAMES)), -1, dtype=np.int64)
+        self._pair_id[pair_i, pair_j] = np.arange(len(pair_i))
+
+    def __len__(self):
+        return self.count
+
+    # 各条件について (該当件数の見積もり, 候補を取り出す関数 or None, 列データでの絞り込み関数) を返す
+    def _plan_sign(self, criterion):
+        b = _body_index(criterion["body"])
+        sign = criterion["sign"]
+        s = SIGN_NAMES.index(sign) if isinstance(sign, str) else int(sign)
+        lo, hi = self.lon_offsets[b, s * DEGREES_PER_SIGN], self.lon_offsets[b, (s + 1) * DEGREES_PER_SIGN]
+        return (int(hi - lo), lambda: self.lon_order[b, lo:hi],
+                lambda idx: np.floor(self.lon[idx, b] / DEGREES_PER_SIGN) == s)
+
+    def _lon_range(self, b, start, end):
+        """黄経が [start, end] (0 <= start <= end <= 360) のチャートの lon_order 上の区間"""
+        offsets, values = self.lon_offsets[b], self.lon_sorted[b]
+        lo_bucket, hi_bucket = int(start), min(int(end) + 1, ZODIAC_DEGREES)
+        base = offsets[lo_bucket]
+        lo = base + np.searchsorted(values[base:offsets[hi_bucket]], start, side="left")
+        hi = base + np.searchsorted(values[base:offsets[hi_bucket]], end, side="right")
+        return int(lo), int(hi)
+
+    def _plan_longitude(self, criterion):
+        b = _body_index(criterion["body"])
+        degree, within = float(criterion["degree"]) % ZODIAC_DEGREES, float(criterion["within"])
+        if within < 0:
+            raise ValueError(f"幅は 0 以上で指定してください: {within}")
+        filter_ = lambda idx: np.abs(wrap_angle(self.lon[idx, b] - degree)) <= within
+        if within >= 180:
+            return self.count, None, filter_
+        start, end = (degree - within - MARGIN) % ZODIAC_DEGREES, (degree + within + MARGIN) % ZODIAC_DEGREES
+        # 0°/360° をまたぐ場合は 2 区間に分ける
+        ranges = [(start, end)] if start <= end else [(start, ZODIAC_DEGREES), (0.0, end)]
+        ranges = [self._lon_range(b, a, z) for a, z in ranges]
+        return (sum(hi - lo for lo, hi in ranges),
+                lambda: np.concatenate([self.lon_order[b, lo:hi] for lo, hi in ranges]), filter_)
+
+    def _plan_house(self, criterion):
+        b = _body_index(criterion["body"])
+        h = int(criterion["house"])
+        if not 1 <= h <= 12:
+            raise ValueError(f"ハウスは 1〜12 で指定してください: {h}")
+        lo, hi = self.house_offsets[b, h - 1], self.house_offsets[b, h]
+        return int(hi - lo), lambda: self.house_order[b, lo:hi], lambda idx: self.house[idx, b] == h
+
+    def _plan_aspect(self, criterion):
+        i, j = sorted((_body_index(criterion["p1"]), _body_index(criterion["p2"])))
+        k = _aspect_index(criterion["aspect"])
+        # オーブを省略すると calculate_natal_aspects と同じ許容オーブ (太陽・月を含む組は +2°) になる
+        allowed = ASPECT_ORBS[k] + LUMINARY_ORB_BONUS * (_LUMINARY[i] or _LUMINARY[j])
+        orb = float(criterion.get("orb", allowed))
+        filter_ = lambda idx: np.abs(np.abs(wrap_angle(self.lon[idx, i] - self.lon[idx, j])) - ASPECT_ANGLES[k]) < orb
+        pair = self._pair_id[i, j]
+        if pair < 0 or frozenset((BODY_NAMES[i], BODY_NAMES[j])) in EXCLUDED_PAIRS or orb > allowed:
+            # 索引にはオーブ内のアスペクトしかないため、絞り込みだけに使う
+            return self.count, None, filter_
+        key = pair * len(ASPECT_NAMES) + k
+        lo, end = self.aspect_offsets[key], self.aspect_offsets[key + 1]
+        hi = lo + np.searchsorted(self.aspect_orbs[lo:end], orb + MARGIN, side="right")
+        return int(hi - lo), lambda: self.aspect_charts[lo:hi], filter_
+
+    def plan(self, criteria):
+        """条件ごとの見積もりを件数の少ない順に並べた (条件, 件数, 取り出し, 絞り込み) のリスト"""
+        planners = {"sign": self._plan_sign, "longitude": self._plan_longitude,
+                    "house": self._plan_house, "aspect": self._plan_aspect}
+        steps = []
+        for criterion in criteria:
+            if criterion.get("type") not in planners:
+                raise ValueError(f"未知の条件です: {criterion.get('type')}")
+            steps.append((criterion, *planners[criterion["type"]](criterion)))
+        # 件数が同じなら索引を使える条件を先にする
+        return sorted(steps, key=lambda step: (step[1], step[2] is None))
+
+    def query(self, criteria, limit=None):
+        """すべての条件を満たすチャートを検索する
+
+        戻り値の dict のキー: count (件数)、indices (索引内の番号)、rows / ids (chart_batch の
+        row と id)、plan (評価した順の条件と見積もり件数)。limit を指定すると先頭 limit 件だけを返す。
+        """
+        steps = self.plan(criteria)
+        plan = []
+        if steps and steps[0][2] is not None:
+            criterion, estimate, fetch, filter_ = steps[0]
+            candidates = np.sort(fetch())
+            # 度数とオーブは索引を少し広めに取っているため、取り出した条件でも絞り込む
+            if criterion["type"] in ("longitude", "aspect"):
+                candidates = candidates[filter_(candidates)]
+            plan.append({"criterion": criterion, "estimate": estimate, "use": "index"})
+            steps = steps[1:]
+        else:
+            candidates = np.arange(self.count)
+        for criterion, estimate, _, filter_ in steps:
+            if len(candidates):
+                candidates = candidates[filter_(candidates)]
+            plan.append({"criterion": criterion, "estimate": estimate, "use": "filter"})
+
+        count = len(candidates)
+        if limit is not None:
+            candidates = candidates[:limit]
+        return {"count": count, "indices": candidates, "rows": self.rows[candidates],
+                "ids": self.ids[candidates], "plan": plan}
+
+
+# --- コマンドライン ---
+def _criteria_from_args(args):
+    criteria = []
+    for value in args.sign:
+        body, sign = value.split(":")
+        criteria.append({"type": "sign", "body": body, "sign": sign})
+    for value in args.house:
+        body, house = value.split(":")
+        criteria.append({"type": "house", "body": body, "house": int(house)})
+    for value in args.near:
+        body, degree, within = value.split(":")
+        criteria.append({"type": "longitude", "body": body, "degree": float(degree), "within": float(within)})
+    for value in args.aspect:
+        p1, p2, aspect, *orb = value.split(":")
+        criterion = {"type": "aspect", "p1": p1, "p2": p2, "aspect": aspect}
+        if orb:
+            criterion["orb"] = float(orb[0])
+        criteria.append(criterion)
+    return criteria
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="計算済みチャートの検索インデックス")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="chart_batch の出力から索引を作る")
+    build.add_argument("results", help="chart_batch の出力 (.jsonl / .csv / .parquet)")
+    build.add_argument("index", help="索引のディレクトリ")
+    build.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    query = sub.add_parser("query", help="条件に合うチャートを検索する")
+    query.add_argument("index", help="索引のディレクトリ")
+    query.add_argument("--sign", action="append", default=[], help="天体:サイン (例: 月:蟹座)")
+    query.add_argument("--house", action="append", default=[], help="天体:ハウス (例: 月:4)")
+    query.add_argument("--near", action="append", default=[], help="天体:度数:幅 (例: 太陽:123.5:3)")
+    query.add_argument("--aspect", action="append", default=[], help="天体:天体:アスペクト[:オーブ] (例: 金星:火星:トライン:2)")
+    query.add_argument("--limit", type=int, default=20, help="表示する件数")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        start = time.perf_counter()
+        count = build_index(args.results, args.index, args.chunk_size)
+        print(f"{count} 件のチャートの索引を作りました ({time.perf_counter() - start:.1f} 秒): {args.index}",
+              file=sys.stderr)
+        return
+
+    index = ChartIndex(args.index)
+    try:
+        criteria = _criteria_from_args(args)
+        start = time.perf_counter()
+        result = index.query(criteria, limit=args.limit)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    print(json.dumps({
+        "count": result["count"], "elapsed_ms": elapsed_ms, "plan": result["plan"],
+        "matches": [{"row": int(row), "id": str(id_)} for row, id_ in zip(result["rows"], result["ids"])],
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
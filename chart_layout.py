@@ -0,0 +1,61 @@
+"""三重円チャートの配置計算
+
+Matplotlib 版 (chart_render) と SVG 版 (chart_svg) で共通に使う、描画ライブラリに
+依存しない寸法と配置の計算。角度は度、半径はチャートの中心から外周までを 10 とした単位。
+"""
+from chart_engine import SENSITIVE_POINTS
+
+FIGSIZE = (10, 10)
+RADIUS_MAX = 10
+RADIUS_SIGN = 9.5
+RADIUS_HOUSE_NUM = 3.5
+RING_RADII = {"trans": 8.0, "prog": 6.2, "natal": 4.4}
+
+
+def rotation_offset_for(ascmc):
+    """ASC が左端 (180°) に来るように回転させる角度"""
+    return 180 - ascmc[0]
+
+
+def layout_planets(bodies, radius, rotation_offset):
+    """天体を円周上に並べたときの角度 (度、回転後) と半径を求める
+
+    近接する天体は半径を少しずつずらして重ならないようにする。
+    """
+    plot_info = {}
+    planets_to_plot = {name: data for name, data in bodies.items() if name not in SENSITIVE_POINTS}
+    sorted_planets = sorted(planets_to_plot.items(), key=lambda item: item[1]['pos'])
+
+    last_angle_deg = -999
+    last_radius_offset = 0
+    radius_step = 0.6
+
+    for name, data in sorted_planets:
+        angle_deg = (data['pos'] + rotation_offset) % 360
+
+        angle_diff = (angle_deg - last_angle_deg + 360) % 360
+        current_radius_offset = 0
+        if angle_diff < 15:
+            current_radius_offset = last_radius_offset - radius_step if last_radius_offset >= 0 else last_radius_offset + radius_step
+            if abs(current_radius_offset) > radius_step * 2 : current_radius_offset = 0
+
+        plot_info[name] = {'angle': angle_deg, 'radius': radius + current_radius_offset}
+        last_angle_deg = angle_deg
+        last_radius_offset = current_radius_offset
+    return plot_info
+
+
+def planet_label(data):
+    """天体のサイン内度数と逆行の表記"""
+    pos_in_sign = data['pos'] % 30
+    retro_str = ' R' if data.get('is_retro') else ''
+    return f"{int(pos_in_sign):02d}{retro_str}"
+
+
+def house_label_angles(cusps):
+    """各ハウスの番号を置く角度 (カスプと次のカスプの中間、回転前) を返す"""
+    angles = []
+    for i, cusp_deg in enumerate(cusps):
+        next_cusp_deg = cusps[(i + 1) % 12]
+        angles.append(cusp_deg + (((next_cusp_deg - cusp_deg) + 360) % 360) / 2)
+    return angles
@@ -0,0 +1,205 @@
+"""三重円ホロスコープの描画 (Matplotlib)
+
+create_tri_chart はチャートごとに Figure を作り直す従来の描画関数。
+TriChartRenderer は Figure を使い回す描画クラスで、サインの円と三重円の補助線は
+初回に一度だけ描き、チャートごとにはハウスのカスプ・ASC/MC・天体の三重円だけを
+描き直す。ASC に合わせた回転は極座標軸の theta_offset で行うため、サインの円を
+描き直す必要はない。Figure は pyplot を経由せずに作るので、グローバルな Figure
+管理に残らず、close() で確実に解放できる。
+出力は create_tri_chart と画素単位では一致しない (回転のしかたが異なるため、アンチ
+エイリアスの丸めで 1 チャートあたり数十画素が数階調ずれる。benchmarks/bench_render.py)。
+"""
+import io
+import threading
+
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.patches import Circle
+
+from chart_engine import SIGN_SYMBOLS, PLANET_SYMBOLS, PLANET_COLORS
+from chart_fonts import configure_matplotlib_font
+from chart_timing import span
+from chart_layout import (
+    FIGSIZE, RADIUS_MAX, RADIUS_SIGN, RADIUS_HOUSE_NUM, RING_RADII,
+    rotation_offset_for, layout_planets, planet_label, house_label_angles,
+)
+
+
+# --- 描画関数 ---
+def draw_planet_texts(ax, bodies, plot_info, angle_shift=0):
+    """天体記号と度数のテキストを描き、作成した Artist のリストを返す
+
+    plot_info は chart_layout.layout_planets の結果。chart_animation でトランジットの
+    天体だけを描き直すときにも使う。
+    """
+    artists = []
+    for name, data in bodies.items():
+        if name in plot_info:
+            info = plot_info[name]
+            angle = np.deg2rad(info['angle'] + angle_shift)
+            artists.append(ax.text(angle, info['radius'], PLANET_SYMBOLS[name], ha='center', va='center', fontsize=14,
+                                   color=PLANET_COLORS.get(name, 'black'), weight='bold', zorder=15))
+            artists.append(ax.text(angle, info['radius'] - 0.5, planet_label(data),
+                                   ha='center', va='top', fontsize=7, zorder=14))
+    return artists
+
+
+def _plot_planets_on_circle(ax, bodies, radius, rotation_offset):
+    """指定された半径の円周上に天体をプロットする内部関数 (ラベル描画なし)"""
+    circle = plt.Circle((0, 0), radius, transform=ax.transData._b, color='lightgray', fill=False, linestyle='--', linewidth=0.5)
+    ax.add_artist(circle)
+    draw_planet_texts(ax, bodies, layout_planets(bodies, radius, rotation_offset))
+
+
+def _setup_polar_axes(ax):
+    """三重円用に極座標軸を設定する"""
+    ax.set_theta_zero_location('E')
+    ax.set_theta_direction(1)
+    ax.set_rlim(0, RADIUS_MAX)
+    ax.spines['polar'].set_visible(False)
+    ax.set_thetagrids([], [])
+    ax.set_rgrids([], [])
+
+
+def _draw_sign_ring(ax, rotation_offset):
+    """サインの円 (一番外側) を描く"""
+    def apply_rotation(pos): return (pos + rotation_offset) % 360
+
+    radius_sign = RADIUS_SIGN
+    for i in range(12):
+        start_deg, end_deg = apply_rotation(i * 30), apply_rotation((i + 1) * 30)
+        mid_deg = apply_rotation(i * 30 + 15)
+        start_angle, end_angle, mid_angle = np.deg2rad(start_deg), np.deg2rad(end_deg), np.deg2rad(mid_deg)
+        color = "aliceblue" if i % 2 == 0 else "white"
+
+        if start_deg > end_deg:
+            ax.fill_between(np.linspace(start_angle, 2 * np.pi, 50), radius_sign - 1, radius_sign, color=color, zorder=0)
+            ax.fill_between(np.linspace(0, end_angle, 50), radius_sign - 1, radius_sign, color=color, zorder=0)
+        else:
+            ax.fill_between(np.linspace(start_angle, end_angle, 100), radius_sign - 1, radius_sign, color=color, zorder=0)
+
+        ax.plot([start_angle, start_angle], [radius_sign - 1, radius_sign], color='lightgray', linewidth=1)
+        ax.text(mid_angle, radius_sign - 0.5, SIGN_SYMBOLS[i], ha='center', va='center', fontsize=20, zorder=2)
+
+
+def _draw_houses(ax, cusps, ascmc, rotation_offset):
+    """ハウスのカスプ (すべて破線)・ハウス番号・ASC/MC ラベルを描き、Artist のリストを返す"""
+    def apply_rotation(pos): return (pos + rotation_offset) % 360
+
+    artists = []
+    radius_sign = RADIUS_SIGN
+    for i, (cusp_deg, mid_angle_deg) in enumerate(zip(cusps, house_label_angles(cusps))):
+        angle = np.deg2rad(apply_rotation(cusp_deg))
+        artists += ax.plot([angle, angle], [0, radius_sign - 1],
+                           color='gray',
+                           linestyle='--',
+                           linewidth=1, zorder=5)
+
+        mid_angle_rad = np.deg2rad(apply_rotation(mid_angle_deg))
+        artists.append(ax.text(mid_angle_rad, RADIUS_HOUSE_NUM, str(i + 1), ha='center', va='center', fontsize=12, color='gray', zorder=6))
+
+    # ASC/MCラベル
+    artists.append(ax.text(np.deg2rad(apply_rotation(ascmc[0])), radius_sign-1.2, "ASC", ha='right', va='center', fontsize=12, color='black'))
+    artists.append(ax.text(np.deg2rad(apply_rotation(ascmc[1])), radius_sign-1.2, "MC", ha='center', va='bottom', fontsize=12, color='black'))
+    return artists
+
+
+def create_tri_chart(natal, prog, trans, cusps, ascmc):
+    """三重円ホロスコープチャートを作成する
+
+    呼び出し側で不要になった Figure を plt.close() すること。
+    """
+    fig, ax = plt.subplots(figsize=FIGSIZE, subplot_kw={'projection': 'polar'})
+    _setup_polar_axes(ax)
+
+    rotation_offset = rotation_offset_for(ascmc)
+
+    # 1. サインの円 (一番外側)
+    _draw_sign_ring(ax, rotation_offset)
+
+    # 2. ハウスのカスプ (すべて破線)
+    _draw_houses(ax, cusps, ascmc, rotation_offset)
+
+    # 3. 天体を三重円でプロット
+    _plot_planets_on_circle(ax, trans, RING_RADII["trans"], rotation_offset)
+    _plot_planets_on_circle(ax, prog, RING_RADII["prog"], rotation_offset)
+    _plot_planets_on_circle(ax, natal, RING_RADII["natal"], rotation_offset)
+
+    return fig
+
+
+# --- 使い回し型の描画クラス ---
+class TriChartRenderer:
+    """サインの円を一度だけ描き、チャートごとの要素だけを描き直す三重円の描画クラス
+
+    Matplotlib はスレッドセーフではないため、描画は lock で直列化する。
+    """
+
+    def __init__(self, figsize=FIGSIZE):
+        configure_matplotlib_font()
+        self.lock = threading.Lock()
+        self.figure = Figure(figsize=figsize)
+        FigureCanvasAgg(self.figure)
+        self.ax = self.figure.add_subplot(projection='polar')
+        _setup_polar_axes(self.ax)
+        self._chart_artists = []
+
+        # 静的な要素: 黄経 0° を基準に描いておき、回転は theta_offset で行う
+        _draw_sign_ring(self.ax, 0)
+        for radius in RING_RADII.values():
+            self.ax.add_artist(Circle((0, 0), radius, transform=self.ax.transData._b, color='lightgray',
+                                      fill=False, linestyle='--', linewidth=0.5))
+
+    def _clear_chart(self):
+        """前回のチャートの要素を取り除く"""
+        for artist in self._chart_artists:
+            artist.remove()
+        self._chart_artists = []
+
+    def render(self, natal, prog, trans, cusps, ascmc):
+        """チャートを描画して Figure を返す (次の render まで有効。lock を取得してから呼ぶこと)"""
+        self._clear_chart()
+        rotation_offset = rotation_offset_for(ascmc)
+        self.ax.set_theta_offset(np.deg2rad(rotation_offset))
+
+        # 回転は軸側で行うため、各要素は回転なし (黄経そのもの) の角度で描く
+        artists = _draw_houses(self.ax, cusps, ascmc, 0)
+        for bodies, key in ((trans, "trans"), (prog, "prog"), (natal, "natal")):
+            plot_info = layout_planets(bodies, RING_RADII[key], rotation_offset)
+            artists += draw_planet_texts(self.ax, bodies, plot_info, angle_shift=-rotation_offset)
+        self._chart_artists = artists
+        return self.figure
+
+    def render_png(self, natal, prog, trans, cusps, ascmc, **savefig_kwargs):
+        """チャートを PNG のバイト列として返す (savefig_kwargs は Figure.savefig に渡す)"""
+        with self.lock:
+            with span("render.artists"):
+                self.render(natal, prog, trans, cusps, ascmc)
+            # Agg での描画と PNG のエンコードは savefig の中で行われる
+            with span("render.savefig"):
+                buf = io.BytesIO()
+                self.figure.savefig(buf, format="png", **savefig_kwargs)
+            self._clear_chart()
+        return buf.getvalue()
+
+    def close(self):
+        """Figure を解放する"""
+        with self.lock:
+            self._clear_chart()
+            self.figure.clear()
+            self.ax = None
+
+
+_shared_renderer = None
+_shared_renderer_lock = threading.Lock()
+
+
+def get_shared_renderer():
+    """プロセス内で共有する TriChartRenderer を返す"""
+    global _shared_renderer
+    with _shared_renderer_lock:
+        if _shared_renderer is None:
+            _shared_renderer = TriChartRenderer()
+        return _shared_renderer
@@ -0,0 +1,441 @@
+"""ローカル専用のチャート計算 HTTP サービス (asyncio)
+
+Streamlit の UI を介さずに、他のプログラムから三重円の天体位置・カスプ・アスペクトと
+チャート画像を取得するためのサービス。ループバックアドレスでのみ待ち受ける。
+
+    python chart_service.py --port 8765 [--grid ephe_grid.bin] [--workers 4]
+
+GET /chart       出生データの天体位置・カスプ・アスペクト (JSON)
+GET /chart.png   三重円チャートの PNG (dpi で解像度を指定、既定 100)
+GET /chart.svg   三重円チャートの SVG
+GET /transits    指定日時 (at) のトランジット天体の位置 (JSON)
+GET /metrics     処理時間とサービスの統計 (Prometheus のテキスト形式)
+GET /healthz     稼働確認
+
+/chart 系のパラメータは chart_batch の入力 CSV と同じ (birth_date, birth_time, lat, lon,
+prefecture, tz, transit)。transit を省略した場合は現在時刻 (分単位に切り捨て) を使う。
+
+- 同じパラメータのリクエストが計算中に届いた場合は、その計算の結果を共有する
+- /transits のリクエストは BATCH_WINDOW 秒の間に届いたものをまとめ、
+  calculate_bodies_batch で 1 回の配列演算として計算する (--grid の範囲外でも、日時が
+  短い期間に密に集まっていればその期間だけのグリッドをメモリ上に作って補間する)。
+  まとめた計算が失敗した場合は 1 件ずつ計算し直し、失敗した日時のリクエストだけを失敗にする
+- 天体暦の範囲外の日時など、入力のために計算できない場合は 422 を返す
+"""
+import argparse
+import asyncio
+import ipaddress
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
+from urllib.parse import urlsplit, parse_qsl
+
+import swisseph as swe
+
+from chart_aspects import calculate_natal_aspects
+from chart_batch import parse_chart_row, DEFAULT_TZ_HOURS
+from chart_cache import ChartCache
+from chart_engine import (
+    EPHE_PATH, ephemeris_available, calculate_all_data, calculate_bodies_batch, datetime_to_jd,
+    set_ephemeris_grid, set_chart_cache, set_ephemeris_pool,
+)
+from chart_frame import ChartFrame
+from ephemeris_pool import PoolBusyError
+import chart_timing
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# /transits をまとめる待ち時間 (秒) と 1 回にまとめる最大件数
+BATCH_WINDOW = 0.002
+MAX_BATCH = 512
+MAX_REQUEST_LINE = 8192
+# 1 リクエストのヘッダの最大行数 (各行の長さの上限は MAX_REQUEST_LINE)
+MAX_HEADERS = 100
+DPI_RANGE = (30, 300)
+
+_STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                422: "Unprocessable Entity", 431: "Request Header Fields Too Large",
+                500: "Internal Server Error", 503: "Service Unavailable", 504: "Gateway Timeout"}
+
+
+class RequestError(Exception):
+    """クライアントに返すエラー (status は HTTP ステータスコード)"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# --- パラメータ ---
+def _now_minute():
+    now = datetime.now(timezone.utc)
+    return now - timedelta(seconds=now.second, microseconds=now.microsecond)
+
+
+def _parse_chart_params(params):
+    """/chart 系のパラメータを (出生日時 UTC, 緯度, 経度, トランジット日時 UTC) にする"""
+    try:
+        dt_utc, lat, lon, transit_dt_utc = parse_chart_row(params)
+    except (KeyError, ValueError, TypeError, AttributeError) as e:
+        raise RequestError(400, f"パラメータが不正です: {e!r}") from None
+    return dt_utc, lat, lon, transit_dt_utc or _now_minute()
+
+
+def _parse_at(params):
+    """/transits の at (ISO 8601、タイムゾーン省略時は tz 時間) を UTC にする"""
+    try:
+        at = datetime.fromisoformat(params["at"])
+        if at.tzinfo is None:
+            at = at.replace(tzinfo=timezone(timedelta(hours=float(params.get("tz") or DEFAULT_TZ_HOURS))))
+    except (KeyError, ValueError) as e:
+        raise RequestError(400, f"パラメータが不正です: {e!r}") from None
+    return at.astimezone(timezone.utc)
+
+
+# --- 計算 (executor 上で実行する) ---
+def _calculation_error(e):
+    """計算中の例外をクライアントに返すエラーにする (天体暦の範囲外などは入力の誤り)"""
+    if isinstance(e, swe.Error):
+        return RequestError(422, f"計算できない日時です: {e}")
+    return e
+
+
+def _compute_chart(dt_utc, lat, lon, transit_dt_utc):
+    try:
+        natal, prog, trans, cusps, ascmc = calculate_all_data(dt_utc, lat, lon, transit_dt_utc)
+    except swe.Error as e:
+        raise _calculation_error(e) from None
+    if not cusps:
+        raise RequestError(422, "ハウスが計算できませんでした")
+    return natal, prog, trans, cusps, ascmc
+
+
+def _chart_json(chart, dt_utc, lat, lon, transit_dt_utc):
+    natal, prog, trans, cusps, ascmc = chart
+    return json.dumps({
+        "input": {"birth_utc": dt_utc.isoformat(), "lat": lat, "lon": lon, "transit_utc": transit_dt_utc.isoformat()},
+        "natal": ChartFrame.from_bodies(natal).to_dict(cusps),
+        "progressed": ChartFrame.from_bodies(prog).to_dict(cusps),
+        "transit": ChartFrame.from_bodies(trans).to_dict(cusps),
+        "cusps": list(cusps[:12]),
+        "asc": ascmc[0], "mc": ascmc[1],
+        "aspects": [{"p1": a["p1_name"], "p2": a["p2_name"], "aspect": a["aspect_name"], "orb": a["orb"]}
+                    for a in calculate_natal_aspects(natal)],
+    }, ensure_ascii=False).encode("utf-8")
+
+
+def _render_png(chart, dpi):
+    from chart_render import get_shared_renderer
+    return get_shared_renderer().render_png(*chart, dpi=dpi)
+
+
+def _render_svg(chart):
+    from chart_svg import render_tri_chart_svg
+    return render_tri_chart_svg(*chart)
+
+
+# --- トランジットのまとめ計算 ---
+def _compute_transits(jds):
+    """jds の天体情報のリストを返す
+
+    まとめた計算が失敗した場合は 1 件ずつ計算し直し、失敗した日時の要素は例外の
+    インスタンスにする (1 件の不正な日時で同じバッチの他のリクエストを失敗させない)。
+    """
+    try:
+        return calculate_bodies_batch(jds)
+    except Exception:
+        if len(jds) == 1:
+            raise
+    results = []
+    for jd_ut in jds:
+        try:
+            results.append(calculate_bodies_batch([jd_ut])[0])
+        except Exception as e:
+            results.append(_calculation_error(e))
+    return results
+
+
+class _TransitBatcher:
+    """短時間に届いたトランジットの要求をまとめて 1 回で計算する"""
+
+    def __init__(self, executor, window=BATCH_WINDOW, max_batch=MAX_BATCH):
+        self.executor = executor
+        self.window = window
+        self.max_batch = max_batch
+        self.batches = 0
+        self.batched_requests = 0
+        self._pending = []
+        self._timer = None
+
+    def submit(self, jd_ut):
+        """jd_ut の天体情報を返す Future"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((jd_ut, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        self.batches += 1
+        self.batched_requests += len(batch)
+        jds = sorted({jd_ut for jd_ut, _ in batch})
+        task = asyncio.get_running_loop().run_in_executor(self.executor, _compute_transits, jds)
+
+        def distribute(task):
+            if task.cancelled() or task.exception() is not None:
+                error = task.exception() if not task.cancelled() else asyncio.CancelledError()
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(_calculation_error(error))
+                return
+            results = dict(zip(jds, task.result()))
+            for jd_ut, future in batch:
+                if future.done():
+                    continue
+                if isinstance(results[jd_ut], Exception):
+                    future.set_exception(results[jd_ut])
+                else:
+                    future.set_result(results[jd_ut])
+        task.add_done_callback(distribute)
+
+
+# --- サービス ---
+class ChartService:
+    """リクエストの振り分け・同一リクエストの合流・トランジットのまとめ計算を行う"""
+
+    def __init__(self, calc_threads=1, batch_window=BATCH_WINDOW, max_batch=MAX_BATCH):
+        # Swiss Ephemeris はプロセス全体で状態を共有するため、既定では 1 スレッドで計算する
+        # (ワーカープール使用時は calc_threads を増やして並列に投入できる)
+        # pyswisseph の天体暦パスはスレッドごとの設定になっている場合があるため、各スレッドで設定する
+        self.calc_executor = ThreadPoolExecutor(max_workers=calc_threads, thread_name_prefix="chart-calc",
+                                                initializer=swe.set_ephe_path, initargs=(EPHE_PATH,))
+        # Matplotlib の描画は共有の TriChartRenderer で直列化されるため 1 スレッドで行う
+        self.render_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chart-render")
+        self.transits = _TransitBatcher(self.calc_executor, batch_window, max_batch)
+        self.counters = {"requests": 0, "coalesced": 0, "errors": 0}
+        self._inflight = {}
+
+    async def _coalesced(self, key, factory):
+        """key が同じ計算が進行中ならその結果を待ち、なければ factory() を実行する"""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.counters["coalesced"] += 1
+        # 待っている側が切断しても、合流している他のリクエストの計算は止めない
+        return await asyncio.shield(task)
+
+    async def _run(self, executor, func, *args):
+        """executor (None なら既定のスレッドプール) で func(*args) を実行する"""
+        return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+    async def _chart(self, params):
+        dt_utc, lat, lon, transit_dt_utc = _parse_chart_params(params)
+        key = ("chart", dt_utc, lat, lon, transit_dt_utc)
+        chart = await self._coalesced(key, lambda: self._run(self.calc_executor, _compute_chart,
+                                                              dt_utc, lat, lon, transit_dt_utc))
+        return key, chart, (dt_utc, lat, lon, transit_dt_utc)
+
+    async def _get_chart(self, params):
+        key, chart, inputs = await self._chart(params)
+        body = await self._coalesced(key + ("json",), lambda: self._run(None, _chart_json, chart, *inputs))
+        return 200, "application/json; charset=utf-8", body
+
+    async def _get_chart_png(self, params):
+        try:
+            dpi = min(max(int(params.get("dpi", 100)), DPI_RANGE[0]), DPI_RANGE[1])
+        except ValueError:
+            raise RequestError(400, "dpi は整数で指定してください") from None
+        key, chart, _ = await self._chart(params)
+        body = await self._coalesced(key + ("png", dpi), lambda: self._run(
+            self.render_executor, _render_png, chart, dpi))
+        return 200, "image/png", body
+
+    async def _get_chart_svg(self, params):
+        key, chart, _ = await self._chart(params)
+        body = await self._coalesced(key + ("svg",), lambda: self._run(None, _render_svg, chart))
+        return 200, "image/svg+xml", body
+
+    async def _get_transits(self, params):
+        at = _parse_at(params)
+        jd_ut = datetime_to_jd(at)
+        bodies = await self._coalesced(("transits", jd_ut), lambda: self.transits.submit(jd_ut))
+        body = json.dumps({"at_utc": at.isoformat(), "transit": ChartFrame.from_bodies(bodies).to_dict()},
+                          ensure_ascii=False).encode("utf-8")
+        return 200, "application/json; charset=utf-8", body
+
+    async def _get_metrics(self, params):
+        return 200, "text/plain; version=0.0.4", self.metrics_text().encode("utf-8")
+
+    async def _get_healthz(self, params):
+        return 200, "text/plain", b"ok"
+
+    async def handle(self, path, params):
+        """(ステータス, Content-Type, 本文) を返す"""
+        self.counters["requests"] += 1
+        routes = {"/chart": self._get_chart, "/chart.png": self._get_chart_png, "/chart.svg": self._get_chart_svg,
+                  "/transits": self._get_transits, "/metrics": self._get_metrics, "/healthz": self._get_healthz}
+        handler = routes.get(path)
+        if handler is None:
+            raise RequestError(404, f"{path} は存在しません")
+        # 計測の名前は既知のパスだけにする (任意のパスごとに集計が増えないように)
+        with chart_timing.span(f"service{path}"):
+            return await handler(params)
+
+    def metrics_text(self):
+        lines = []
+        for name, value in self.counters.items():
+            lines.append(f"# TYPE horoscope_service_{name}_total counter")
+            lines.append(f"horoscope_service_{name}_total {value}")
+        lines.append("# TYPE horoscope_service_transit_batches_total counter")
+        lines.append(f"horoscope_service_transit_batches_total {self.transits.batches}")
+        lines.append("# TYPE horoscope_service_transit_batched_requests_total counter")
+        lines.append(f"horoscope_service_transit_batched_requests_total {self.transits.batched_requests}")
+        return chart_timing.prometheus_text() + "\n".join(lines) + "\n"
+
+    # --- HTTP ---
+    async def _read_headers(self, reader):
+        """ヘッダを読み込んで dict で返す (長すぎる行や多すぎる行は RequestError(431))"""
+        headers = {}
+        for _ in range(MAX_HEADERS + 1):
+            try:
+                line = await reader.readline()
+            except (ValueError, asyncio.LimitOverrunError):
+                raise RequestError(431, "header line too long") from None
+            if line in (b"\r\n", b"\n", b""):
+                return headers
+            if len(line) > MAX_REQUEST_LINE:
+                raise RequestError(431, "header line too long")
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        raise RequestError(431, "too many header lines")
+
+    async def serve_connection(self, reader, writer):
+        """1 つの接続のリクエストを順に処理する (HTTP/1.1 の keep-alive に対応)"""
+        try:
+            while True:
+                try:
+                    request_line = await reader.readline()
+                    too_long = len(request_line) > MAX_REQUEST_LINE
+                except (ValueError, asyncio.LimitOverrunError):
+                    # StreamReader の上限 (64 KiB) を超える行
+                    request_line, too_long = b"", True
+                if too_long:
+                    self.counters["errors"] += 1
+                    await self._respond(writer, 400, "text/plain", b"request line too long", keep_alive=False)
+                    break
+                if not request_line:
+                    break
+                try:
+                    headers = await self._read_headers(reader)
+                except RequestError as e:
+                    self.counters["errors"] += 1
+                    await self._respond(writer, e.status, "text/plain", str(e).encode("utf-8"), keep_alive=False)
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self._respond(writer, 400, "text/plain", b"bad request line", keep_alive=False)
+                    break
+                keep_alive = (version == "HTTP/1.1" and headers.get("connection", "").lower() != "close") \
+                    or headers.get("connection", "").lower() == "keep-alive"
+
+                if method != "GET":
+                    status, content_type, body = 405, "text/plain", b"only GET is supported"
+                else:
+                    url = urlsplit(target)
+                    try:
+                        status, content_type, body = await self.handle(url.path, dict(parse_qsl(url.query)))
+                    except RequestError as e:
+                        status, content_type, body = e.status, "application/json; charset=utf-8", \
+                            json.dumps({"error": str(e)}, ensure_ascii=False).encode("utf-8")
+                    except Exception as e:
+                        status = 504 if isinstance(e, TimeoutError) else 503 if isinstance(e, PoolBusyError) else 500
+                        logger.exception("リクエストの処理中にエラーが発生しました: %s", target)
+                        content_type, body = "application/json; charset=utf-8", \
+                            json.dumps({"error": repr(e)}, ensure_ascii=False).encode("utf-8")
+                    if status >= 400:
+                        self.counters["errors"] += 1
+                await self._respond(writer, status, content_type, body, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, content_type, body, keep_alive):
+        head = (f"HTTP/1.1 {status} {_STATUS_TEXT.get(status, '')}\r\n"
+                f"Content-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+    def close(self):
+        self.calc_executor.shutdown(wait=False, cancel_futures=True)
+        self.render_executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, service=None, ready=None):
+    """サービスを起動して停止されるまで待ち受ける (ready には待ち受け開始後に (host, port) を渡す)"""
+    if not ipaddress.ip_address(host).is_loopback:
+        raise ValueError(f"ループバックアドレス以外では待ち受けできません: {host}")
+    service = service or ChartService()
+    server = await asyncio.start_server(service.serve_connection, host, port)
+    address = server.sockets[0].getsockname()[:2]
+    logger.info("chart service: http://%s:%d/", *address)
+    if ready is not None:
+        ready(address)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=DEFAULT_HOST, help="待ち受けるループバックアドレス")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--grid", help="天体位置グリッド (ephemeris_grid) のパス")
+    parser.add_argument("--workers", type=int, default=0, help="天体暦のワーカープロセス数 (0 ならこのプロセスで計算)")
+    parser.add_argument("--cache-size", type=int, default=4096, help="計算結果のキャッシュの件数")
+    args = parser.parse_args(argv)
+    if not ipaddress.ip_address(args.host).is_loopback:
+        raise SystemExit(f"ループバックアドレス以外では待ち受けできません: {args.host}")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if not ephemeris_available():
+        raise SystemExit(f"天体暦ファイルが見つかりません: {EPHE_PATH}")
+    chart_timing.enable()
+    set_chart_cache(ChartCache(maxsize=args.cache_size))
+    if args.grid:
+        from ephemeris_grid import EphemerisGrid
+        set_ephemeris_grid(EphemerisGrid(args.grid))
+    calc_threads = 1
+    if args.workers:
+        from ephemeris_pool import EphemerisPool
+        set_ephemeris_pool(EphemerisPool(workers=args.workers, grid_path=args.grid))
+        calc_threads = args.workers * 2
+    try:
+        asyncio.run(serve(args.host, args.port, ChartService(calc_threads=calc_threads)))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
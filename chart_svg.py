@@ -0,0 +1,139 @@
+"""三重円ホロスコープの SVG 出力 (Matplotlib 不要)
+
+create_tri_chart と同じ配置 (chart_layout) で SVG を直接組み立てる。Matplotlib の
+Figure (10×10 インチ、100 dpi) と同じ座標になるよう、極座標軸の位置と大きさ・
+フォントサイズ (pt) ・破線のパターンを換算している。
+
+    svg = render_tri_chart_svg(natal, prog, trans, cusps, ascmc)   # bytes
+    with open("chart.svg", "wb") as f:
+        write_tri_chart_svg(f, natal, prog, trans, cusps, ascmc)
+
+サインの円の帯と補助線は回転前の形を一度だけ組み立てておき、チャートごとには
+ASC に合わせた rotate 変換をかけて使い回す。
+見た目が Matplotlib 版と揃っているかは benchmarks/svg_visual_diff.py で SVG を
+ラスタライズして比べる (cairosvg が必要。benchmarks/requirements.txt を参照)。
+"""
+import math
+from functools import lru_cache
+from xml.sax.saxutils import escape
+
+from chart_engine import SIGN_SYMBOLS, PLANET_SYMBOLS, PLANET_COLORS
+from chart_layout import (
+    FIGSIZE, RADIUS_MAX, RADIUS_SIGN, RADIUS_HOUSE_NUM, RING_RADII,
+    rotation_offset_for, layout_planets, planet_label, house_label_angles,
+)
+
+# Matplotlib の既定のサブプロット配置で、正方形に調整された極座標軸の位置 (Figure 比)
+AXES_CENTER = (0.5125, 0.495)
+AXES_SIZE = 0.77
+FONT_FAMILY = "IPAexGothic, 'IPAex Gothic', 'Hiragino Sans', 'Yu Gothic', Meiryo, TakaoPGothic, 'DejaVu Sans', sans-serif"
+# Matplotlib の破線 '--' のパターン (線幅 1pt あたりの pt)
+DASH_PATTERN = (3.7, 1.6)
+VALIGN = {"center": "central", "top": "hanging", "bottom": "text-after-edge"}
+HALIGN = {"center": "middle", "right": "end", "left": "start"}
+
+
+class _Canvas:
+    """チャートの極座標を SVG のピクセル座標に換算する"""
+
+    def __init__(self, size):
+        self.size = size
+        self.px_per_pt = size / (FIGSIZE[0] * 72)
+        self.cx = size * AXES_CENTER[0]
+        self.cy = size * (1 - AXES_CENTER[1])
+        self.scale = size * AXES_SIZE / 2 / RADIUS_MAX
+
+    def xy(self, angle_deg, radius):
+        rad = math.radians(angle_deg)
+        return self.cx + radius * self.scale * math.cos(rad), self.cy - radius * self.scale * math.sin(rad)
+
+    def pt(self, value):
+        return value * self.px_per_pt
+
+    def dash(self, linewidth):
+        return ",".join(f"{self.pt(d * linewidth):.2f}" for d in DASH_PATTERN)
+
+    def text(self, angle_deg, radius, text, fontsize, color="black", ha="center", va="center", bold=False):
+        x, y = self.xy(angle_deg, radius)
+        weight = ' font-weight="bold"' if bold else ''
+        return (f'<text x="{x:.2f}" y="{y:.2f}" font-size="{self.pt(fontsize):.2f}" fill="{color}"'
+                f' text-anchor="{HALIGN[ha]}" dominant-baseline="{VALIGN[va]}"{weight}>{escape(text)}</text>')
+
+
+@lru_cache(maxsize=8)
+def _static_ring(size):
+    """回転前のサインの帯・境界線と三重円の補助線 (SVG 断片)"""
+    c = _Canvas(size)
+    inner, outer = RADIUS_SIGN - 1, RADIUS_SIGN
+    parts = []
+    for i in range(12):
+        start, end = i * 30, (i + 1) * 30
+        color = "aliceblue" if i % 2 == 0 else "white"
+        x0, y0 = c.xy(start, outer)
+        x1, y1 = c.xy(end, outer)
+        x2, y2 = c.xy(end, inner)
+        x3, y3 = c.xy(start, inner)
+        ro, ri = outer * c.scale, inner * c.scale
+        parts.append(f'<path d="M{x0:.2f},{y0:.2f} A{ro:.2f},{ro:.2f} 0 0 0 {x1:.2f},{y1:.2f} '
+                     f'L{x2:.2f},{y2:.2f} A{ri:.2f},{ri:.2f} 0 0 1 {x3:.2f},{y3:.2f} Z" fill="{color}"/>')
+    for radius in RING_RADII.values():
+        parts.append(f'<circle cx="{c.cx:.2f}" cy="{c.cy:.2f}" r="{radius * c.scale:.2f}" fill="none" stroke="lightgray"'
+                     f' stroke-width="{c.pt(0.5):.2f}" stroke-dasharray="{c.dash(0.5)}"/>')
+    for i in range(12):
+        x0, y0 = c.xy(i * 30, inner)
+        x1, y1 = c.xy(i * 30, outer)
+        parts.append(f'<line x1="{x0:.2f}" y1="{y0:.2f}" x2="{x1:.2f}" y2="{y1:.2f}" stroke="lightgray" stroke-width="{c.pt(1):.2f}"/>')
+    return "".join(parts)
+
+
+def _chart_parts(c, natal, prog, trans, cusps, ascmc):
+    """チャートの SVG 要素を描画順 (Matplotlib の zorder 順) に返す"""
+    rotation_offset = rotation_offset_for(ascmc)
+    def apply_rotation(pos): return (pos + rotation_offset) % 360
+
+    # 1. サインの円 (回転前の形に rotate をかける。SVG は y 軸が下向きなので符号が逆)
+    yield f'<g transform="rotate({-rotation_offset:.4f} {c.cx:.2f} {c.cy:.2f})">{_static_ring(c.size)}</g>'
+    for i in range(12):
+        yield c.text(apply_rotation(i * 30 + 15), RADIUS_SIGN - 0.5, SIGN_SYMBOLS[i], 20)
+
+    # ASC/MCラベル
+    yield c.text(apply_rotation(ascmc[0]), RADIUS_SIGN - 1.2, "ASC", 12, ha="right")
+    yield c.text(apply_rotation(ascmc[1]), RADIUS_SIGN - 1.2, "MC", 12, va="bottom")
+
+    # 2. ハウスのカスプ (すべて破線) とハウス番号
+    for cusp_deg in cusps:
+        x0, y0 = c.xy(0, 0)
+        x1, y1 = c.xy(apply_rotation(cusp_deg), RADIUS_SIGN - 1)
+        yield (f'<line x1="{x0:.2f}" y1="{y0:.2f}" x2="{x1:.2f}" y2="{y1:.2f}" stroke="gray"'
+               f' stroke-width="{c.pt(1):.2f}" stroke-dasharray="{c.dash(1)}"/>')
+    for i, mid_angle_deg in enumerate(house_label_angles(cusps)):
+        yield c.text(apply_rotation(mid_angle_deg), RADIUS_HOUSE_NUM, str(i + 1), 12, color="gray")
+
+    # 3. 天体の三重円 (度数ラベルの上に記号を重ねる)
+    rings = []
+    for bodies, key in ((trans, "trans"), (prog, "prog"), (natal, "natal")):
+        plot_info = layout_planets(bodies, RING_RADII[key], rotation_offset)
+        rings.append([(name, data, plot_info[name]) for name, data in bodies.items() if name in plot_info])
+    for ring in rings:
+        for name, data, info in ring:
+            yield c.text(info['angle'], info['radius'] - 0.5, planet_label(data), 7, va="top")
+    for ring in rings:
+        for name, data, info in ring:
+            yield c.text(info['angle'], info['radius'], PLANET_SYMBOLS[name], 14,
+                         color=PLANET_COLORS.get(name, 'black'), bold=True)
+
+
+def _svg_open_tag(size):
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{size}" height="{size}" viewBox="0 0 {size} {size}"'
+            f' font-family="{FONT_FAMILY}"><rect width="100%" height="100%" fill="white"/>')
+
+
+def render_tri_chart_svg(natal, prog, trans, cusps, ascmc, size=1000):
+    """三重円チャートの SVG をバイト列で返す (size は一辺のピクセル数)"""
+    c = _Canvas(size)
+    return "".join((_svg_open_tag(size), *_chart_parts(c, natal, prog, trans, cusps, ascmc), "</svg>")).encode("utf-8")
+
+
+def write_tri_chart_svg(stream, natal, prog, trans, cusps, ascmc, size=1000):
+    """三重円チャートの SVG をバイナリストリームに書き出す"""
+    stream.write(render_tri_chart_svg(natal, prog, trans, cusps, ascmc, size))
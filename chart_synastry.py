@@ -0,0 +1,209 @@
+"""1 つのチャートと多数のチャートの相性 (シナストリー) の採点
+
+母集団のネイタルの黄経を 1 つの配列 (チャート数, 天体数) として持ち、照会するチャートの
+全天体との間のアスペクトで採点する。アスペクトの判定は calculate_cross_aspects と同じ
+(ASPECTS のオーブ未満、太陽・月を含む組は +2°) で、1 つのアスペクトの点数は
+オーブが狭いほど高い 1 - オーブ / 許容オーブ (0〜1)、チャートの点数はその合計。
+上位 top_k 件について、点数に寄与したアスペクトの一覧を付けて返す。
+
+    population = SynastryPopulation.from_index("charts.idx")      # chart_index の索引を使う
+    for match in population.top_matches(natal_bodies, top_k=20, workers=4):
+        print(match["row"], match["score"], [a["aspect_name"] for a in match["aspects"]])
+
+照会チャートを固定すると、母集団の天体 1 つの点数への寄与はその黄経だけで決まる
+区分線形の関数 (折れ目は照会チャートの天体 ± アスペクト角 ± 許容オーブ) になる。
+これを折れ目ごとの値の表 (score_profile) にしておき、母集団の列ごとに np.interp で
+引いて足し合わせるため、天体の組ごとの計算が要らない (補間は誤差を含まない)。
+
+workers を 2 以上にすると母集団を区間に分け、ワーカープロセスで並列に採点する。
+索引から作った母集団は各ワーカーが同じファイルを mmap で開くため、配列はコピーされない。
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from chart_aspects import (
+    ASPECT_ANGLES, ASPECT_ORBS, LUMINARY_ORB_BONUS, angular_distance, body_arrays, calculate_cross_aspects,
+    pair_mask,
+)
+from chart_engine import LUMINARIES, PLANET_NAMES, ASPECTS, ZODIAC_DEGREES
+
+DEFAULT_TOP_K = 10
+# 1 回にまとめて採点するチャート数 (mmap の母集団を読み込む単位)
+DEFAULT_CHUNK_SIZE = 65536
+# ワーカー 1 つあたりのタスク数 (区間を細かくして処理時間の偏りをならす)
+TASKS_PER_WORKER = 4
+
+_worker_population = None
+
+
+def _allowed_orbs(names_a, lum_a, names_b):
+    """天体の組とアスペクトごとの許容オーブ (A, B, K)。計算しない組は 0"""
+    lum_b = np.array([PLANET_NAMES.get(name) in LUMINARIES for name in names_b], dtype=bool)
+    allowed = ASPECT_ORBS + LUMINARY_ORB_BONUS * (lum_a[:, None] | lum_b[None, :])[..., None]
+    return np.where(pair_mask(tuple(names_a), tuple(names_b), same_chart=False)[..., None], allowed, 0.0)
+
+
+def pair_weights(query_lon, lon, allowed):
+    """照会チャートの天体 (A,) と黄経 lon (P,) の点数への寄与 (A, P, B)
+
+    allowed は _allowed_orbs の (A, B, K)。lon の各点に母集団の天体 B 個のそれぞれが
+    あった場合の、照会チャートの天体ごとの寄与を返す。
+    """
+    orb = np.abs(angular_distance(query_lon, lon)[..., None] - ASPECT_ANGLES)[:, :, None, :]
+    limit = allowed[:, None, :, :]
+    weight = np.where(orb < limit, 1 - orb / np.where(limit > 0, limit, 1), 0.0)
+    return weight.sum(axis=3)
+
+
+def score_profile(query_lon, allowed):
+    """母集団の天体ごとの寄与の表 (折れ目の黄経 (P,), 寄与 (P, B)) を作る
+
+    寄与は各アスペクトの中心 (照会チャートの天体 ± アスペクト角) とその ± 許容オーブで
+    折れる区分線形の関数なので、折れ目の値から np.interp で正確に求まる。
+    """
+    centers = query_lon[:, None] + np.concatenate([ASPECT_ANGLES, -ASPECT_ANGLES])
+    orbs = np.unique(allowed[allowed > 0])
+    knots = (centers[..., None] + np.concatenate([-orbs, [0], orbs])).ravel()
+    # 角距離そのものの折れ目 (0° と 180°) と、補間の両端も加える
+    knots = np.unique(np.concatenate([
+        np.mod(knots, ZODIAC_DEGREES), np.mod(query_lon, ZODIAC_DEGREES),
+        np.mod(query_lon + 180, ZODIAC_DEGREES), [0, ZODIAC_DEGREES],
+    ]))
+    return knots, pair_weights(query_lon, knots, allowed).sum(axis=0)
+
+
+def score_chunk(population_lon, profile):
+    """母集団の一部 (n, B) の点数 (n,) を返す"""
+    knots, values = profile
+    score = np.zeros(len(population_lon))
+    for b in range(values.shape[1]):
+        score += np.interp(population_lon[:, b], knots, values[:, b])
+    return score
+
+
+def _merge_top(best_idx, best_score, idx, score, top_k):
+    """これまでの上位と新しい候補から上位 top_k 件を選ぶ (順不同)"""
+    idx, score = np.concatenate([best_idx, idx]), np.concatenate([best_score, score])
+    if len(score) > top_k:
+        keep = np.argpartition(-score, top_k - 1)[:top_k]
+        idx, score = idx[keep], score[keep]
+    return idx, score
+
+
+def _score_range(population_lon, start, stop, profile, top_k, chunk_size):
+    """母集団の [start, stop) を一定件数ずつ採点し、区間内の上位 (番号, 点数) を返す"""
+    best_idx, best_score = np.empty(0, dtype=np.int64), np.empty(0)
+    for chunk_start in range(start, stop, chunk_size):
+        chunk_stop = min(chunk_start + chunk_size, stop)
+        score = score_chunk(np.asarray(population_lon[chunk_start:chunk_stop], dtype=float), profile)
+        best_idx, best_score = _merge_top(best_idx, best_score, np.arange(chunk_start, chunk_stop), score, top_k)
+    return best_idx, best_score
+
+
+# --- ワーカー処理 ---
+def _init_worker(index_path, lon):
+    """ワーカープロセスの初期化 (母集団の黄経を索引から mmap で開く、または受け取る)"""
+    global _worker_population
+    if index_path is not None:
+        lon = np.load(os.path.join(index_path, "lon.npy"), mmap_mode="r")
+    _worker_population = lon
+
+
+def _score_range_in_worker(start, stop, profile, top_k, chunk_size):
+    return _score_range(_worker_population, start, stop, profile, top_k, chunk_size)
+
+
+# --- 母集団 ---
+class SynastryPopulation:
+    """採点の対象とするチャートの集まり
+
+    lon: (N, len(names)) の黄経の配列 (np.memmap でもよい)
+    names: 列の天体名
+    rows, ids: 結果に付ける各チャートの番号と識別子 (省略時は 0 からの番号と空文字)
+    """
+
+    def __init__(self, lon, names, rows=None, ids=None, index_path=None):
+        self.lon = lon
+        self.names = list(names)
+        self.rows = np.arange(len(lon)) if rows is None else rows
+        self.ids = np.full(len(lon), "") if ids is None else ids
+        self.index_path = index_path
+
+    @classmethod
+    def from_index(cls, path):
+        """chart_index で作った索引のネイタルの黄経を母集団にする"""
+        from chart_index import BODY_NAMES, ChartIndex
+
+        index = ChartIndex(path)
+        return cls(index.lon, BODY_NAMES, index.rows, index.ids, index_path=path)
+
+    def __len__(self):
+        return len(self.lon)
+
+    def _bodies(self, i):
+        """母集団の i 番目のチャートを chart_engine と同じ形の dict にする"""
+        return {name: {'id': PLANET_NAMES.get(name, name), 'pos': float(pos)}
+                for name, pos in zip(self.names, self.lon[i])}
+
+    def profile(self, query_bodies):
+        """照会チャートに対する score_profile"""
+        query_names, query_lon, query_lum = body_arrays(query_bodies)
+        return score_profile(query_lon, _allowed_orbs(query_names, query_lum, self.names))
+
+    def scores(self, query_bodies, chunk_size=DEFAULT_CHUNK_SIZE):
+        """全チャートの点数 (N,) を返す (上位だけでなく分布を見たいとき用)"""
+        profile = self.profile(query_bodies)
+        score = np.empty(len(self))
+        for start in range(0, len(self), chunk_size):
+            chunk = np.asarray(self.lon[start:start + chunk_size], dtype=float)
+            score[start:start + len(chunk)] = score_chunk(chunk, profile)
+        return score
+
+    def top_matches(self, query_bodies, top_k=DEFAULT_TOP_K, workers=1, chunk_size=DEFAULT_CHUNK_SIZE):
+        """点数の高い順に top_k 件のチャートを返す
+
+        各要素は dict で、キーは index (母集団内の番号)、row、id、score と、aspects
+        (calculate_cross_aspects の形式で p1 が照会チャート・p2 が母集団の天体。各要素に
+        点数への寄与 weight を加え、weight の大きい順に並べたもの)。
+        """
+        profile = self.profile(query_bodies)
+        if workers <= 1 or len(self) <= chunk_size:
+            best_idx, best_score = _score_range(self.lon, 0, len(self), profile, top_k, chunk_size)
+        else:
+            best_idx, best_score = self._score_parallel(profile, top_k, workers, chunk_size)
+
+        # 点数の高い順 (同点は番号順) に並べる
+        order = np.lexsort((best_idx, -best_score))[:top_k]
+        matches = []
+        for i, score in zip(best_idx[order].tolist(), best_score[order].tolist()):
+            matches.append({
+                "index": i, "row": int(self.rows[i]), "id": str(self.ids[i]), "score": score,
+                "aspects": _weighted_aspects(query_bodies, self._bodies(i)),
+            })
+        return matches
+
+    def _score_parallel(self, profile, top_k, workers, chunk_size):
+        """母集団を区間に分けてワーカープロセスで採点し、上位をまとめる"""
+        # 索引から作った母集団はワーカーが自分で mmap する。それ以外は配列をワーカーに渡す
+        initargs = (self.index_path, None) if self.index_path else (None, np.asarray(self.lon))
+        bounds = np.linspace(0, len(self), workers * TASKS_PER_WORKER + 1).astype(int)
+        best_idx, best_score = np.empty(0, dtype=np.int64), np.empty(0)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as executor:
+            futures = [executor.submit(_score_range_in_worker, start, stop, profile, top_k, chunk_size)
+                       for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+            for future in futures:
+                best_idx, best_score = _merge_top(best_idx, best_score, *future.result(), top_k)
+        return best_idx, best_score
+
+
+def _weighted_aspects(bodies_a, bodies_b):
+    """calculate_cross_aspects の結果に点数への寄与 (1 - オーブ / 許容オーブ) を加える"""
+    aspects = calculate_cross_aspects(bodies_a, bodies_b)
+    for aspect in aspects:
+        luminary = (bodies_a[aspect["p1_name"]].get('id') in LUMINARIES
+                    or bodies_b[aspect["p2_name"]].get('id') in LUMINARIES)
+        allowed = ASPECTS[aspect["aspect_name"]]["orb"] + (LUMINARY_ORB_BONUS if luminary else 0)
+        aspect["weight"] = 1 - aspect["orb"] / allowed
+    return sorted(aspects, key=lambda aspect: -aspect["weight"])
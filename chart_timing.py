@@ -0,0 +1,233 @@
+"""処理段階ごとの時間計測
+
+計測したい処理を span で囲む。計測が無効なとき span() は何もしない共有オブジェクトを
+返すだけなので、計測箇所を残したままでもほとんど負荷はかからない。
+
+    with span("ephemeris.houses"):
+        cusps, ascmc = swe.houses(...)
+
+計測は次の 2 通りで有効になる。
+
+- collect(): そのスレッドで囲んだ範囲の span を Trace に記録する (1 リクエスト分の内訳の表示用)
+- 環境変数 HOROSCOPE_TIMING=1 または enable(): 全スレッドの span を段階ごとの集計
+  (件数・合計・ヒストグラム・直近の分位点) に加える。集計は prometheus_text() で
+  Prometheus のテキスト形式、snapshot() で dict として取り出せ、log_trace() で
+  1 リクエスト分の内訳を JSON のログとして出力できる。
+"""
+import json
+import logging
+import os
+import threading
+from collections import deque
+from contextlib import contextmanager
+from time import perf_counter
+
+logger = logging.getLogger(__name__)
+
+# ヒストグラムのバケット (秒)
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUANTILES = (0.5, 0.9, 0.99)
+# 分位点の計算に使う直近の計測値の件数 (段階ごと)
+RESERVOIR_SIZE = 1024
+METRIC_NAME = "horoscope_stage_seconds"
+
+_enabled = os.environ.get("HOROSCOPE_TIMING", "") not in ("", "0")
+
+
+class _Local(threading.local):
+    # 属性を既定値で持たせ、未設定のスレッドでも例外を経由せずに参照できるようにする
+    trace = None
+
+
+_local = _Local()
+_stats_lock = threading.Lock()
+_stats = {}
+
+
+class _NullSpan:
+    """計測が無効なときの span (何もしない)"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _StageStats:
+    """1 つの段階の集計"""
+
+    __slots__ = ("count", "total", "buckets", "recent")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.buckets = [0] * len(BUCKETS)
+        self.recent = deque(maxlen=RESERVOIR_SIZE)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.recent.append(seconds)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+
+    def quantiles(self):
+        values = sorted(self.recent)
+        if not values:
+            return {q: 0.0 for q in QUANTILES}
+        return {q: values[min(int(q * len(values)), len(values) - 1)] for q in QUANTILES}
+
+
+def _observe(name, seconds):
+    with _stats_lock:
+        stats = _stats.get(name)
+        if stats is None:
+            stats = _stats[name] = _StageStats()
+        stats.observe(seconds)
+
+
+class Trace:
+    """1 リクエスト分の span の記録
+
+    spans は (名前, 入れ子の深さ, 開始時刻 (秒、Trace の開始から), 所要時間 (秒)) のリストで、
+    span が終わった順に並ぶ。
+    """
+
+    def __init__(self):
+        self.start = perf_counter()
+        self.depth = 0
+        self.spans = []
+
+    def records(self):
+        """開始順に並べた span の dict のリスト (時間は ms)"""
+        return [
+            {"stage": name, "depth": depth, "start_ms": offset * 1000, "duration_ms": seconds * 1000}
+            for name, depth, offset, seconds in sorted(self.spans, key=lambda s: (s[2], s[1]))
+        ]
+
+    def totals(self):
+        """段階ごとの合計時間 (ms)"""
+        totals = {}
+        for name, _, _, seconds in self.spans:
+            totals[name] = totals.get(name, 0.0) + seconds * 1000
+        return totals
+
+
+class _Span:
+    """計測中の span"""
+
+    __slots__ = ("name", "trace", "depth", "start")
+
+    def __init__(self, name, trace):
+        self.name = name
+        self.trace = trace
+
+    def __enter__(self):
+        trace = self.trace
+        if trace is not None:
+            self.depth = trace.depth
+            trace.depth += 1
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = perf_counter() - self.start
+        trace = self.trace
+        if trace is not None:
+            trace.depth -= 1
+            trace.spans.append((self.name, self.depth, self.start - trace.start, seconds))
+        if _enabled:
+            _observe(self.name, seconds)
+        return False
+
+
+def span(name):
+    """name の段階の時間を計測するコンテキストマネージャを返す"""
+    trace = _local.trace
+    if trace is None and not _enabled:
+        return _NULL_SPAN
+    return _Span(name, trace)
+
+
+@contextmanager
+def collect():
+    """囲んだ範囲でこのスレッドが計測した span を Trace に記録する"""
+    trace = Trace()
+    previous = _local.trace
+    _local.trace = trace
+    try:
+        yield trace
+    finally:
+        _local.trace = previous
+
+
+def enable(flag=True):
+    """全スレッドの span の集計を有効 (無効) にする"""
+    global _enabled
+    _enabled = flag
+
+
+def is_enabled():
+    return _enabled
+
+
+def log_trace(trace, event="chart_request", **fields):
+    """Trace の内訳を 1 行の JSON としてログに出力する"""
+    logger.info(json.dumps({"event": event, **fields, "spans": trace.records()}, ensure_ascii=False))
+
+
+def configure_json_logging(stream=None):
+    """log_trace の JSON をそのまま stream (省略時は標準エラー) に出力するよう設定する"""
+    if not logger.handlers:
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+
+def snapshot():
+    """段階ごとの集計 (件数・合計秒数・分位点) の dict を返す"""
+    with _stats_lock:
+        return {
+            name: {"count": stats.count, "sum": stats.total,
+                   **{f"p{round(q * 100)}": value for q, value in stats.quantiles().items()}}
+            for name, stats in sorted(_stats.items())
+        }
+
+
+def prometheus_text():
+    """段階ごとの集計を Prometheus のテキスト形式で返す (ヒストグラムと直近の分位点)"""
+    lines = [
+        f"# HELP {METRIC_NAME} Time spent in each stage of chart generation.",
+        f"# TYPE {METRIC_NAME} histogram",
+    ]
+    quantile_lines = [
+        f"# HELP {METRIC_NAME}_recent Quantiles over the last {RESERVOIR_SIZE} observations of each stage.",
+        f"# TYPE {METRIC_NAME}_recent summary",
+    ]
+    with _stats_lock:
+        for name, stats in sorted(_stats.items()):
+            cumulative = 0
+            for bound, count in zip(BUCKETS, stats.buckets):
+                cumulative += count
+                lines.append(f'{METRIC_NAME}_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'{METRIC_NAME}_bucket{{stage="{name}",le="+Inf"}} {stats.count}')
+            lines.append(f'{METRIC_NAME}_sum{{stage="{name}"}} {stats.total}')
+            lines.append(f'{METRIC_NAME}_count{{stage="{name}"}} {stats.count}')
+            for q, value in stats.quantiles().items():
+                quantile_lines.append(f'{METRIC_NAME}_recent{{stage="{name}",quantile="{q}"}} {value}')
+    return "\n".join(lines + quantile_lines) + "\n"
+
+
+def reset():
+    """集計を空にする"""
+    with _stats_lock:
+        _stats.clear()
@@ -0,0 +1,214 @@
+"""天体位置の事前計算グリッド
+
+PLANET_NAMES の全天体について、一定間隔で黄経と速度を swe.calc_ut でサンプリングし、
+メモリマップ可能なバイナリファイルに保存する。位置の参照時はグリッドの近傍のサンプルから
+黄経 (前後 4 点の 3 次ラグランジュ補間) と速度 (線形補間) を求める。ファイルは
+読み取り専用で mmap するため、複数プロセスで開いても OS のページキャッシュが共有され、
+プロセスごとに天体暦を読み込む必要がない。
+
+chart_engine.set_ephemeris_grid() でグリッドを設定すると、範囲内の日時の天体位置は
+グリッドから求めるようになる (ハウスの計算は従来どおり swe.houses を使う)。
+
+    python ephemeris_grid.py build ephe/grid_1900_2100.bin --start 1900 --end 2100 --step 0.5
+    python ephemeris_grid.py verify ephe/grid_1900_2100.bin --samples 20000
+
+補間誤差 (1900〜2100 年のランダムな 20000 時刻で live の swe.calc_ut と比較した最大値):
+    step=0.5 日: 全天体で 4 秒角未満 (月は 0.4 秒角未満)
+    step=1 日:   全天体で 6 秒角未満 (月は約 5.3 秒角)
+0.5 日間隔での誤差の大半は補間ではなく、swe.calc_ut の結果自体に含まれる
+短周期の小さな揺らぎ (木星〜冥王星で数秒角) によるもの。手元のグリッドの誤差は
+verify サブコマンドで確認できる。
+速度の符号 (逆行判定) は留の前後のごく短い時間で live 計算と食い違うことがある。
+
+ファイル形式:
+    MAGIC (8 バイト) + ヘッダ長 (uint32 LE) + JSON ヘッダ + パディング (64 バイト境界)
+    + float64 配列 (サンプル数, 天体数, 2)   最後の軸は (黄経, 速度)
+"""
+import argparse
+import json
+import struct
+import sys
+
+import numpy as np
+import swisseph as swe
+
+from chart_engine import EPHE_PATH, PLANET_NAMES
+
+MAGIC = b"HSGRID1\0"
+ALIGNMENT = 64
+DEFAULT_STEP = 0.5
+DEFAULT_START_YEAR = 1900
+DEFAULT_END_YEAR = 2100
+# build_grid で一度に計算して書き出すサンプル数
+WRITE_CHUNK = 4096
+
+
+def _year_to_jd(year):
+    return swe.julday(year, 1, 1, 0.0)
+
+
+def sample_positions(jds, body_ids):
+    """jds の各時刻の (黄経, 速度) を swe.calc_ut で求め、(時刻数, 天体数, 2) の配列で返す
+
+    天体暦パスは呼び出し側で設定しておくこと。
+    """
+    iflag = swe.FLG_SWIEPH | swe.FLG_SPEED
+    data = np.empty((len(jds), len(body_ids), 2))
+    for i, jd in enumerate(jds):
+        for b, p_id in enumerate(body_ids):
+            res = swe.calc_ut(float(jd), p_id, iflag)
+            data[i, b, 0], data[i, b, 1] = res[0][0], res[0][3]
+    return data
+
+
+def build_grid(path, jd_start, jd_end, step=DEFAULT_STEP, ephe_path=EPHE_PATH):
+    """グリッドを計算してファイルに書き出し、サンプル数を返す"""
+    swe.set_ephe_path(ephe_path)
+    body_names = list(PLANET_NAMES)
+    count = int(np.ceil((jd_end - jd_start) / step)) + 1
+    header = json.dumps({
+        "jd_start": jd_start, "step": step, "count": count,
+        "bodies": body_names, "ids": [PLANET_NAMES[name] for name in body_names],
+    }, ensure_ascii=False).encode("utf-8")
+    prefix = MAGIC + struct.pack("<I", len(header)) + header
+    data_offset = -(-len(prefix) // ALIGNMENT) * ALIGNMENT
+
+    with open(path, "wb") as f:
+        f.write(prefix.ljust(data_offset, b"\0"))
+    data = np.memmap(path, dtype="<f8", mode="r+", offset=data_offset, shape=(count, len(body_names), 2))
+    body_ids = [PLANET_NAMES[name] for name in body_names]
+    for start in range(0, count, WRITE_CHUNK):
+        stop = min(start + WRITE_CHUNK, count)
+        data[start:stop] = sample_positions(jd_start + np.arange(start, stop) * step, body_ids)
+    data.flush()
+    del data
+    return count
+
+
+class EphemerisGrid:
+    """メモリマップしたグリッドから天体の黄経・速度を補間して返す
+
+    EphemerisGrid.sample() でファイルを使わずにメモリ上の短いグリッドも作れる。
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            magic = f.read(len(MAGIC))
+            if magic != MAGIC:
+                raise ValueError(f"天体位置グリッドのファイルではありません: {path}")
+            (header_len,) = struct.unpack("<I", f.read(4))
+            header = json.loads(f.read(header_len).decode("utf-8"))
+        data_offset = -(-(len(MAGIC) + 4 + header_len) // ALIGNMENT) * ALIGNMENT
+
+        # memmap のままだとスライスのたびにサブクラスの生成処理が走るため、ndarray として参照する
+        data = np.memmap(path, dtype="<f8", mode="r", offset=data_offset,
+                         shape=(header["count"], len(header["bodies"]), 2)).view(np.ndarray)
+        self._setup(path, header["jd_start"], header["step"], header["bodies"], header["ids"], data)
+
+    def _setup(self, path, jd_start, step, body_names, body_ids, data):
+        self.path = path
+        self.jd_start = jd_start
+        self.step = step
+        self.count = len(data)
+        self.body_names = list(body_names)
+        self.body_ids = list(body_ids)
+        self.jd_end = self.jd_start + (self.count - 1) * self.step
+        self.data = data
+
+    @classmethod
+    def sample(cls, jd_start, jd_end, step=DEFAULT_STEP, sampler=sample_positions):
+        """ファイルを作らずに [jd_start, jd_end] のグリッドをメモリ上に作る (短い期間の補間用)
+
+        sampler は sample_positions と同じ引数で (時刻数, 天体数, 2) の配列を返す関数。
+        """
+        body_names = list(PLANET_NAMES)
+        body_ids = [PLANET_NAMES[name] for name in body_names]
+        count = max(int(np.ceil((jd_end - jd_start) / step)) + 1, 4)
+        grid = cls.__new__(cls)
+        grid._setup(None, jd_start, step, body_names, body_ids,
+                    sampler(jd_start + np.arange(count) * step, body_ids))
+        return grid
+
+    def covers(self, jd_ut):
+        """jd_ut (スカラーまたは配列) がすべてグリッドの範囲内かを返す"""
+        jd = np.asarray(jd_ut, dtype=float)
+        return bool(np.all((jd >= self.jd_start) & (jd <= self.jd_end)))
+
+    def positions(self, jd_ut, body_index=None):
+        """天体の (黄経, 速度) を返す
+
+        body_index を省略すると全天体を計算し、形状はどちらも jd_ut の形状 + (天体数,) となる。
+        body_index (body_names 上の位置) を指定するとその天体のみを計算し、形状は jd_ut と同じ。
+        body_index に jd_ut と同じ形状の配列を渡すと、要素ごとにその天体を計算する。
+        """
+        jd = np.asarray(jd_ut, dtype=float)
+        if not self.covers(jd):
+            raise ValueError(f"グリッドの範囲外です: JD {self.jd_start}〜{self.jd_end}")
+
+        x = (jd - self.jd_start) / self.step
+        # 前後 4 点 (i-1, i, i+1, i+2) を使う。端では補間区間をずらす
+        i = np.clip(np.floor(x).astype(np.int64), 1, self.count - 3)
+        t = x - i
+        if np.ndim(body_index):
+            # 要素ごとの天体: (時刻, 天体) の組で直接取り出す
+            b = np.asarray(body_index)
+            p = np.moveaxis(self.data[i[..., None] + np.arange(-1, 3), b[..., None], 0], np.ndim(i), 0)
+            speed_i, speed_next = self.data[i, b, 1], self.data[i + 1, b, 1]
+        else:
+            data = self.data if body_index is None else self.data[:, body_index, :]
+            if body_index is None:
+                t = t[..., None]
+            p = np.moveaxis(data[i[..., None] + np.arange(-1, 3), ..., 0], np.ndim(i), 0)
+            speed_i, speed_next = data[i, ..., 1], data[i + 1, ..., 1]
+        # 0°/360° をまたぐ場合に備え、i 点からの変位に直して補間する
+        d = p - p[1]
+        d -= 360 * np.floor((d + 180) / 360)
+        w_m1 = -t * (t - 1) * (t - 2) / 6
+        w_1 = -(t + 1) * t * (t - 2) / 2
+        w_2 = (t + 1) * t * (t - 1) / 6
+        lon = p[1] + w_m1 * d[0] + w_1 * d[2] + w_2 * d[3]
+
+        # 速度は swe.calc_ut の値を線形補間する (逆行判定に使う)
+        t = np.clip(t, 0, 1)
+        speed = (1 - t) * speed_i + t * speed_next
+        return lon - 360 * np.floor(lon / 360), speed
+
+
+def verify_grid(grid, samples=20000, seed=0, ephe_path=EPHE_PATH):
+    """ランダムな時刻で live の swe.calc_ut と比較し、天体ごとの最大誤差 (秒角) を返す"""
+    swe.set_ephe_path(ephe_path)
+    rng = np.random.default_rng(seed)
+    jds = rng.uniform(grid.jd_start, grid.jd_end, samples)
+    lon, _ = grid.positions(jds)
+    iflag = swe.FLG_SWIEPH | swe.FLG_SPEED
+    max_error = {}
+    for b, (name, p_id) in enumerate(zip(grid.body_names, grid.body_ids)):
+        live = np.array([swe.calc_ut(jd, p_id, iflag)[0][0] for jd in jds])
+        error = np.abs((lon[:, b] - live + 180) % 360 - 180)
+        max_error[name] = float(error.max() * 3600)
+    return max_error
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="天体位置グリッドの作成と検証")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="グリッドを作成する")
+    build.add_argument("path")
+    build.add_argument("--start", type=int, default=DEFAULT_START_YEAR, help="開始年")
+    build.add_argument("--end", type=int, default=DEFAULT_END_YEAR, help="終了年")
+    build.add_argument("--step", type=float, default=DEFAULT_STEP, help="サンプリング間隔 (日)")
+    verify = sub.add_parser("verify", help="live の計算と比較して最大誤差を表示する")
+    verify.add_argument("path")
+    verify.add_argument("--samples", type=int, default=20000)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        count = build_grid(args.path, _year_to_jd(args.start), _year_to_jd(args.end), args.step)
+        print(f"{count} 件のサンプルを書き出しました: {args.path}", file=sys.stderr)
+    else:
+        max_error = verify_grid(EphemerisGrid(args.path), samples=args.samples)
+        print(json.dumps(max_error, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
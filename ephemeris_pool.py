@@ -0,0 +1,165 @@
+"""Swiss Ephemeris の計算を行うワーカープロセスのプール
+
+pyswisseph はプロセス全体で 1 つの C の状態 (天体暦パス・開いているファイル等) を
+共有するため、Streamlit のように複数のセッションをスレッドで処理すると、同時に
+来たリクエストが同じ状態を取り合う。このプールは天体・ハウスの計算を常駐する
+ワーカープロセスに任せ、各ワーカーでは起動時に一度だけ天体暦パスを設定して
+天体暦ファイルを読み込んでおく。
+
+    pool = EphemerisPool(workers=4)
+    chart_engine.set_ephemeris_pool(pool)     # 以降の calculate_all_data はプール経由
+    natal, prog, trans, cusps, ascmc = pool.calculate_chart_layers(dt_utc, lat, lon, transit_dt_utc)
+
+同時に受け付ける計算は max_pending 件まで。空きがなければ timeout 秒まで待ち、
+それでも空かなければ PoolBusyError、計算が timeout 秒以内に終わらなければ
+TimeoutError を送出する。
+"""
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import swisseph as swe
+
+import chart_engine
+from chart_engine import EPHE_PATH, PLANET_NAMES, HOUSE_SYSTEM
+from chart_timing import span
+
+DEFAULT_TIMEOUT = 30.0  # 秒
+# ワーカー 1 つあたりの同時受付数 (処理中と待ち行列の合計)
+PENDING_PER_WORKER = 4
+# 起動時に天体暦ファイルを読み込ませるための日時 (2000-01-01 12:00 UT)
+WARM_UP_JD = 2451545.0
+
+
+class PoolBusyError(RuntimeError):
+    """受付数の上限に達していて計算を受け付けられない"""
+
+
+# --- ワーカー処理 ---
+def _init_worker(ephe_path, grid_path=None):
+    """ワーカープロセスの初期化 (天体暦パスの設定と天体暦ファイルの読み込み)"""
+    # fork で親プロセスの設定を引き継いでいても、ワーカー自身は直接計算する
+    chart_engine.set_ephemeris_pool(None)
+    chart_engine.set_chart_cache(None)
+    chart_engine.set_ephemeris_grid(None)
+    if grid_path:
+        from ephemeris_grid import EphemerisGrid
+        chart_engine.set_ephemeris_grid(EphemerisGrid(grid_path))
+
+    swe.set_ephe_path(ephe_path)
+    iflag = swe.FLG_SWIEPH | swe.FLG_SPEED
+    for p_id in PLANET_NAMES.values():
+        swe.calc_ut(WARM_UP_JD, p_id, iflag)
+    swe.houses(WARM_UP_JD, 35.0, 139.0, HOUSE_SYSTEM)
+
+
+def _worker_pid():
+    return os.getpid()
+
+
+def _compute_bodies(jd_ut, lat, lon, calc_houses):
+    return chart_engine._compute_celestial_bodies(jd_ut, lat, lon, calc_houses)
+
+
+def _compute_chart(dt_utc, lat, lon, transit_dt_utc, now_utc):
+    return chart_engine.calculate_chart_layers(dt_utc, lat, lon, transit_dt_utc, now_utc)
+
+
+def _compute_charts(requests):
+    return [chart_engine.calculate_chart_layers(*request) for request in requests]
+
+
+# --- プール ---
+class EphemerisPool:
+    """天体・ハウスの計算を行う常駐ワーカープロセスのプール
+
+    workers: ワーカー数 (省略時は CPU 数)
+    max_pending: 同時に受け付ける計算の上限 (省略時は workers * PENDING_PER_WORKER)
+    timeout: 受付待ちと計算を合わせた既定のタイムアウト (秒)
+    grid_path: ワーカーで使う事前計算グリッド (ephemeris_grid) のパス
+    """
+
+    def __init__(self, workers=None, max_pending=None, timeout=DEFAULT_TIMEOUT,
+                 ephe_path=EPHE_PATH, grid_path=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * PENDING_PER_WORKER
+        self.timeout = timeout
+        self._initargs = (ephe_path, grid_path)
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._executor_lock = threading.Lock()
+        self._executor = None
+        self._start()
+
+    def _start(self):
+        """ワーカーを起動し、全員の初期化 (天体暦ファイルの読み込み) が終わるまで待つ"""
+        executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                       initargs=self._initargs)
+        # ワーカーは投入に応じて起動されるため、ワーカー数だけ投入して起動と初期化を済ませておく
+        for future in [executor.submit(_worker_pid) for _ in range(self.workers)]:
+            future.result()
+        self._executor = executor
+
+    def _submit(self, fn, *args):
+        """空きを待たずに投入する (ワーカーが異常終了していればプールを作り直して再投入する)"""
+        with self._executor_lock:
+            if self._executor is None:
+                raise RuntimeError("pool is closed: close() 済みのプールには投入できません")
+            try:
+                return self._executor.submit(fn, *args)
+            except BrokenProcessPool:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._start()
+                return self._executor.submit(fn, *args)
+
+    def run(self, fn, *args, timeout=None):
+        """ワーカーで fn(*args) を実行して結果を返す (fn はモジュールの関数であること)"""
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        with span("ephemeris_pool.wait"):
+            if not self._slots.acquire(timeout=timeout):
+                raise PoolBusyError(f"計算の受付数が上限 ({self.max_pending}) に達しています")
+        try:
+            future = self._submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # 受付枠は計算が実際に終わったときに返す (タイムアウトしても計算中の枠は空けない)
+        future.add_done_callback(lambda _: self._slots.release())
+        with span("ephemeris_pool.run"):
+            try:
+                return future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                future.cancel()
+                raise TimeoutError(f"天体暦の計算が {timeout} 秒以内に終わりませんでした") from None
+
+    def compute_bodies(self, jd_ut, lat, lon, calc_houses=False, timeout=None):
+        """天体情報とハウスを計算する (chart_engine の (bodies, cusps, ascmc) と同じ形)"""
+        return self.run(_compute_bodies, jd_ut, lat, lon, calc_houses, timeout=timeout)
+
+    def calculate_chart_layers(self, dt_utc, lat, lon, transit_dt_utc, now_utc=None, timeout=None):
+        """ネイタル・プログレス・トランジットを 1 回のやり取りで計算する"""
+        return self.run(_compute_chart, dt_utc, lat, lon, transit_dt_utc, now_utc, timeout=timeout)
+
+    def calculate_charts(self, requests, timeout=None):
+        """複数チャートをまとめて 1 つのワーカーで計算する
+
+        requests は calculate_chart_layers の引数 (dt_utc, lat, lon, transit_dt_utc, now_utc) の
+        タプルのリスト。プロセス間のやり取りの回数を減らしたいときに使う。
+        """
+        return self.run(_compute_charts, list(requests), timeout=timeout)
+
+    def close(self, wait=True):
+        """ワーカーを終了する (以降の計算は RuntimeError になる)"""
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait, cancel_futures=True)
+                self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
@@ -0,0 +1,165 @@
+"""生涯のセカンダリープログレス (一日一年法) の年表
+
+一日一年法では誕生から 1 年の経過がネイタルの 1 日後の天体配置に対応するため、
+100 年分のプログレスは約 100 日分の天体暦で足りる。この期間の全サンプル (既定は毎月)
+のプログレス天体を一度の配列演算で求め、(サンプル数, 天体数) の黄経・速度の配列と、
+プログレス天体がネイタルの天体とアスペクトを形成する (正確になる) 時期の一覧を返す。
+サンプルごとに calculate_all_data を呼ぶ (100 年分の毎月で約 1200 回) 代わりに 1 回で済む。
+
+    timeline = calculate_progression_timeline(dt_utc, lat, lon, years=100)
+    moon = timeline["lon"][:, timeline["names"].index("月")]   # 毎月のプログレスの月
+    for event in timeline["events"]:
+        print(event["utc"], event["age"], event["progressed_name"], event["aspect_name"], event["natal_name"])
+
+天体位置は chart_engine.set_ephemeris_grid() のグリッドが期間を含めばそこから補間し、
+含まない場合はこの期間だけ NODE_STEP_DAYS 間隔で swe.calc_ut を計算したグリッドを
+メモリ上に作って同じ方法で補間する (ワーカープールの設定中はプールで計算する)。
+サンプルの年齢は日単位に切り捨てないため、progressed_datetime とは最大で 1 日
+(プログレスの天体暦で約 4 分) ずれる。
+
+イベントは dict で、キーは type ("aspect")、age (満年齢、年)、jd_ut と utc (実際の日時)、
+progressed_jd_ut (プログレスの天体暦上の日時)、progressed_name、pos、is_retro、
+natal_name、natal_pos、aspect_name、params。正確になる時期は隣り合うサンプルの間の
+線形補間で求める (毎月のサンプルで誤差は数日以内)。
+"""
+import logging
+
+import numpy as np
+import swisseph as swe
+
+import chart_engine
+from chart_engine import ASPECTS, BODY_NAMES, EPHE_PATH, PLANET_NAMES, ephemeris_available, datetime_to_jd
+from chart_frame import wrap_angle
+from chart_timing import span
+from transit_search import jd_to_datetime
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_YEARS = 100
+SAMPLES_PER_YEAR = 12
+DAYS_PER_YEAR = 365.2425
+# グリッドがないときにメモリ上で作るグリッドのサンプリング間隔 (日)
+NODE_STEP_DAYS = 0.5
+# 誕生時点でこれより小さい角度のずれの組は、正確なアスペクトとして数えない
+EXACT_EPSILON = 1e-9
+
+# chart_engine と同じく、ドラゴンテイルは速度によらず逆行としない
+_RETRO_BODIES = np.array([name != "ドラゴンテイル" for name in BODY_NAMES])
+
+
+def progressed_positions(jd_uts):
+    """jd_uts (1 次元配列) の全天体の黄経と速度を返す。形状はどちらも (時刻数, len(BODY_NAMES))"""
+    jds = np.asarray(jd_uts, dtype=float)
+    grid = chart_engine.get_ephemeris_grid()
+    if grid is None or not grid.covers(jds):
+        grid = chart_engine.sample_ephemeris_grid(jds.min(), jds.max(), NODE_STEP_DAYS)
+    lon, speed = grid.positions(jds)
+    order = [grid.body_names.index(name) for name in PLANET_NAMES]
+    lon, speed = lon[:, order], speed[:, order]
+    head = list(PLANET_NAMES).index("ドラゴンヘッド")
+    lon = np.column_stack([lon, (lon[:, head] + 180) % 360])
+    speed = np.column_stack([speed, speed[:, head]])
+    return lon, speed
+
+
+def retro_flags(speed):
+    """速度の配列 (..., len(BODY_NAMES)) から逆行フラグを求める (chart_engine の is_retro と同じ)"""
+    return (np.asarray(speed) < 0) & _RETRO_BODIES
+
+
+def _aspect_targets(aspect_names):
+    """(アスペクト名, 0〜360° の角度) の一覧を角度順に返す。0° と 180° 以外は ± の両方向を含む"""
+    targets = set()
+    for aspect_name in aspect_names:
+        angle = ASPECTS[aspect_name]["angle"]
+        targets |= {(angle % 360, aspect_name), ((-angle) % 360, aspect_name)}
+    return [(aspect_name, angle) for angle, aspect_name in sorted(targets)]
+
+
+def find_progressed_aspects(ages, prog_jds, lon, speed, natal_bodies, jd_natal, aspect_names=None):
+    """プログレス天体の黄経の列から、ネイタルの天体へのアスペクトが正確になる時期を求める
+
+    (プログレス - ネイタル) の角度が目標の角度のどの区間にあるかをサンプルごとに求め、
+    区間が変わったところを目標の角度を通過した時点とする。隣り合うサンプルの間で動く
+    角度が目標の角度の間隔 (既定のアスペクトでは 30°) より小さいこと (月は年 1 回以上)。
+    """
+    targets = _aspect_targets(aspect_names or list(ASPECTS))
+    angles = np.array([angle for _, angle in targets], dtype=float)
+    natal_names = list(natal_bodies)
+    natal_lon = np.array([natal_bodies[name]['pos'] for name in natal_names], dtype=float)
+
+    # d: (サンプル, プログレス天体, ネイタル天体) の角度差 (0〜360°)、bucket: その角度を含む目標の区間
+    d = lon[:, :, None] - natal_lon
+    d -= 360 * np.floor(d / 360)
+    bucket = np.searchsorted(angles, d, side="right") % len(angles)
+    k, p, n = np.nonzero(bucket[:-1] != bucket[1:])
+
+    d0, d1 = d[k, p, n], d[k + 1, p, n]
+    forward = wrap_angle(d1 - d0) > 0
+    # 順行なら入った区間の下端、逆行なら出た区間の下端を通過した
+    t = np.where(forward, bucket[k + 1, p, n], bucket[k, p, n]) - 1
+    f0, f1 = wrap_angle(d0 - angles[t]), wrap_angle(d1 - angles[t])
+    # 誕生時点でちょうど成立している組は、そこから離れていくだけなので除く
+    keep = ~((k == 0) & (np.abs(f0) < EXACT_EPSILON))
+    k, p, n, t, f0, f1 = k[keep], p[keep], n[keep], t[keep], f0[keep], f1[keep]
+
+    frac = f0 / (f0 - f1)
+    event_ages = ages[k] + frac * (ages[k + 1] - ages[k])
+    event_prog_jds = prog_jds[k] + frac * (prog_jds[k + 1] - prog_jds[k])
+    event_speed = speed[k, p] + frac * (speed[k + 1, p] - speed[k, p])
+    event_retro = (event_speed < 0) & _RETRO_BODIES[p]
+
+    events = []
+    for i in np.argsort(event_ages, kind="stable").tolist():
+        aspect_name, angle = targets[t[i]]
+        natal_pos = float(natal_lon[n[i]])
+        age = float(event_ages[i])
+        jd_ut = jd_natal + age * DAYS_PER_YEAR
+        events.append({
+            "type": "aspect", "age": age, "jd_ut": jd_ut, "utc": jd_to_datetime(jd_ut),
+            "progressed_jd_ut": float(event_prog_jds[i]), "progressed_name": BODY_NAMES[p[i]],
+            "pos": (natal_pos + angle) % 360, "is_retro": bool(event_retro[i]),
+            "natal_name": natal_names[n[i]], "natal_pos": natal_pos,
+            "aspect_name": aspect_name, "params": ASPECTS[aspect_name],
+        })
+    return events
+
+
+def calculate_progression_timeline(dt_utc, lat, lon, years=DEFAULT_YEARS, samples_per_year=SAMPLES_PER_YEAR,
+                                   aspect_names=None):
+    """誕生から years 年間のプログレスの年表を計算する
+
+    戻り値の dict のキー:
+        names: 天体名のリスト (BODY_NAMES)
+        ages: (T,) 各サンプルの満年齢 (年)。0 から 1 / samples_per_year 刻み
+        jd_ut: (T,) 各サンプルの実際の日時 (ユリウス日)
+        progressed_jd_ut: (T,) 各サンプルのプログレスの日時 (ユリウス日)
+        lon, speed: (T, len(names)) プログレス天体の黄経と速度
+        retro: (T, len(names)) 逆行フラグ (chart_engine と同じく、ドラゴンテイルは常に False)
+        natal, cusps, ascmc: ネイタルの天体情報とハウス
+        events: アスペクトが正確になる時期のリスト (年齢順)
+    天体暦ファイルがない場合は None を返す。
+    """
+    if not ephemeris_available():
+        logger.error("天体暦ファイルが見つかりません: %s", EPHE_PATH)
+        return None
+    if chart_engine.get_ephemeris_pool() is None:
+        with span("ephemeris.set_path"):
+            swe.set_ephe_path(EPHE_PATH)
+
+    jd_natal = datetime_to_jd(dt_utc)
+    with span("chart.natal"):
+        natal_bodies, cusps, ascmc = chart_engine._calculate_celestial_bodies(jd_natal, lat, lon, calc_houses=True)
+
+    ages = np.arange(int(round(years * samples_per_year)) + 1) / samples_per_year
+    prog_jds = jd_natal + ages
+    with span("timeline.positions"):
+        prog_lon, prog_speed = progressed_positions(prog_jds)
+    with span("timeline.aspects"):
+        events = find_progressed_aspects(ages, prog_jds, prog_lon, prog_speed, natal_bodies, jd_natal, aspect_names)
+
+    return {
+        "names": list(BODY_NAMES), "ages": ages, "jd_ut": jd_natal + ages * DAYS_PER_YEAR,
+        "progressed_jd_ut": prog_jds, "lon": prog_lon, "speed": prog_speed, "retro": retro_flags(prog_speed),
+        "natal": natal_bodies, "cusps": cusps, "ascmc": ascmc, "events": events,
+    }